@@ -1,21 +1,37 @@
 #!pip install crewai crewai_tools langchain langchain_community langchain_groq streamlit duckduckgo-search sendgrid
 
-from crewai import LLM
-from langchain_groq import ChatGroq
-from crewai import Crew, Process, Agent, Task
-from crewai.tools import tool
-from langchain_community.tools import DuckDuckGoSearchResults 
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import os
+import time
+import threading
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from pymongo import MongoClient
 import uuid
 # from sendgrid import SendGridAPIClient
 # from sendgrid.helpers.mail import Mail
 import resend
-from pdf_generator import generate_pdf_report
+from resend.http_client_requests import RequestsClient
 from agents.email_generator import generate_personalized_email
+from agents.speculation import preview_jobs, report_jobs
+from agents.report_scheduler import report_scheduler, priority_tier, HIGH
+from agents.cancellation import GenerationCancelled, cancellable, check_cancelled, current_token
+from agents import metering
+from agents.email_outbox import outbox as email_outbox
+from agents.crew_pool import single_task_pool
+from agents.direct_prompt import run_prompt
+import resilience
+from resilience import DependencyUnavailable
+from metrics import MongoCommandMetrics
+import tracing
+from tracing import traced
+from profiling import profiled
+from pdf_cache import get_report_pdf_base64, pdf_cache
+from pdf_renderer import pdf_renderer
 
 import random
 
@@ -32,6 +48,39 @@ SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 FROM_EMAIL = os.getenv("FROM_EMAIL", "noreply@youragency.com")
 resend.api_key = os.getenv("RESEND_API_KEY")
 MAX_TOKEN = os.getenv("MAX_TOKEN_REPORT")
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+RESEND_TIMEOUT_SECONDS = int(os.getenv("RESEND_TIMEOUT_SECONDS", "10"))
+
+# Speculative preview: start generating as soon as requirements are complete
+SPECULATIVE_PREVIEW = os.getenv("SPECULATIVE_PREVIEW", "true").lower() == "true"
+PREVIEW_JOIN_TIMEOUT_SECONDS = float(os.getenv("PREVIEW_JOIN_TIMEOUT_SECONDS", "120"))
+
+# Speculative report stages for high-scoring sessions still on the preview page
+SPECULATIVE_REPORT = os.getenv("SPECULATIVE_REPORT", "true").lower() == "true"
+SPECULATIVE_REPORT_MIN_SCORE = int(os.getenv("SPECULATIVE_REPORT_MIN_SCORE", "60"))
+SPECULATIVE_DAILY_TOKEN_BUDGET = int(os.getenv("SPECULATIVE_DAILY_TOKEN_BUDGET", "500000"))
+SPECULATIVE_REPORT_TOKEN_ESTIMATE = int(os.getenv("SPECULATIVE_REPORT_TOKEN_ESTIMATE", "12000"))
+
+# LLM pricing (USD per million tokens) for cost reporting
+LLM_PRICE_PROMPT_PER_MTOK = float(os.getenv("LLM_PRICE_PROMPT_PER_MTOK", "1.0"))
+LLM_PRICE_COMPLETION_PER_MTOK = float(os.getenv("LLM_PRICE_COMPLETION_PER_MTOK", "3.0"))
+SPECULATIVE_REPORT_JOIN_TIMEOUT_SECONDS = float(os.getenv("SPECULATIVE_REPORT_JOIN_TIMEOUT_SECONDS", "90"))
+
+# Deadline-driven report pipeline (see DEADLINE-DRIVEN REPORT PIPELINE below)
+REPORT_DEADLINE_MODE = os.getenv("REPORT_DEADLINE_MODE", "false").lower() == "true"
+REPORT_SLA_SECONDS = float(os.getenv("REPORT_SLA_SECONDS", "180"))
+REPORT_FALLBACK_MODEL = os.getenv("REPORT_FALLBACK_MODEL", "groq/llama-3.1-8b-instant")
+REPORT_FALLBACK_BUDGET_SECONDS = float(os.getenv("REPORT_FALLBACK_BUDGET_SECONDS", "20"))
+STAGE_BUDGETS = {
+    "requirement_gathering": float(os.getenv("STAGE_BUDGET_REQUIREMENT_GATHERING", "40")),
+    "technical_architecture": float(os.getenv("STAGE_BUDGET_TECHNICAL_ARCHITECTURE", "50")),
+    "ux_design": float(os.getenv("STAGE_BUDGET_UX_DESIGN", "40")),
+    "business_strategy": float(os.getenv("STAGE_BUDGET_BUSINESS_STRATEGY", "40")),
+}
+
+# Fail an email send after RESEND_TIMEOUT_SECONDS instead of the client's 30s default
+resend.default_http_client = RequestsClient(timeout=RESEND_TIMEOUT_SECONDS)
 
 
 print("Using GROQ Model:", GROQ_MODEL)
@@ -39,22 +88,29 @@ print("Using GROQ Model:", GROQ_MODEL)
 # ==============================
 # 🔹 DATABASE SETUP
 # ==============================
-mongo_client = MongoClient(MONGO_URI)
+# Bounded timeouts and pool wait so a degraded cluster fails fast instead of hanging requests
+mongo_client = MongoClient(
+    MONGO_URI,
+    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_TIMEOUT_MS * 2,
+    waitQueueTimeoutMS=MONGO_TIMEOUT_MS,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    event_listeners=[MongoCommandMetrics()],
+    # No connection at import; the first operation (or the startup warm-up) opens it
+    connect=False,
+)
 db = mongo_client[MONGO_DB]
 sessions = db.sessions
 leads = db.leads
+speculation_stats = db.speculation_stats
+cancellation_stats = db.cancellation_stats
+llm_usage = db.llm_usage
+metering.recorder.bind(llm_usage)
+trace_spans = db.trace_spans
+tracing.bind_span_store(trace_spans)
 
-print("Connected to MongoDB:", db.name)
-
-# ==============================
-# 🔹 LLM SETUP
-# ==============================
-llm = ChatGroq(
-    temperature=0, 
-    groq_api_key=GROQ_API_KEY, 
-    model=GROQ_MODEL,
-    max_tokens=MAX_TOKEN
-)
+print("MongoDB client ready for database:", db.name)
 
 # ==============================
 # 🔹 SOCIAL PROOF DATA
@@ -75,93 +131,170 @@ SUCCESS_METRICS = [
 ]
 
 # ==============================
-# 🔹 TOOLS
+# 🔹 LLMS & AGENTS (BUILT ON FIRST USE)
 # ==============================
-@tool
-def search_web_tool(query: str):
-    """Searches the web and returns results."""
-    search_tool = DuckDuckGoSearchResults(num_results=10, verbose=True)
-    return search_tool.run(query)
+# Importing crewai (and litellm under it) takes seconds, so the LLMs and agents
+# are built by the first call to get_agents() - or by the warm-up thread that
+# index.py starts - rather than when this module is imported.
+_agents = None
+_agents_lock = threading.Lock()
 
-# ==============================
-# 🔹 AGENTS
-# ==============================
-requirement_gathering_expert = Agent( 
-    role="Requirement Gathering Expert",    
-    goal="Understand user's AI agent idea through conversation and convert it into detailed requirements.",    
-    backstory=(
-        "You are a professional AI product consultant specializing in converting vague ideas "
-        "into clear, structured product requirements. You ask insightful follow-up questions "
-        "and know when you have enough information to proceed."
-    ),
-    verbose=True,
-    max_iter=5,
-    llm=llm,
-    allow_delegation=False,
-)
+def get_agents():
+    """The shared LLMs and agents; the first call imports crewai and builds them."""
+    global _agents
+    if _agents is None:
+        with _agents_lock:
+            if _agents is None:
+                _agents = _build_agents()
+    return _agents
 
-technical_architect = Agent(
-    role="Technical Architect",
-    goal=(
-        "Design technical architecture using ONLY approved tech stack: "
-        "Python, FastAPI, NextJS, React, React Native, TensorFlow, PyTorch, NumPy, Pandas, "
-        "Hugging Face, Streamlit, CrewAI, LangChain, LangGraph, RAG, MongoDB, PostgreSQL, "
-        "Redis, Pinecone, Prisma, Dizzle, AWS AI, Azure AI, Google Cloud AI, VAPI, Retell.AI, "
-        "BotPress, Relevance.AI, Whisper, ElevenLabs, Twilio, Stripe, WhatsApp API. "
-        "Keep architecture simple, lean, and efficient."
-    ),
-    backstory=(
-        "You are a senior AI systems architect specializing in designing scalable production-grade "
-        "agentic systems. You create practical, efficient architectures using only the approved tech stack."
-    ),
-    llm=llm,
-    verbose=True,
-    allow_delegation=False
-)
+def agents_ready():
+    """Whether get_agents() has built the agents yet (reported by /health)."""
+    return _agents is not None
 
-ux_expert = Agent(
-    role="UX / Product Design Expert",
-    goal="Translate requirements into user flows and experience design structures.",
-    backstory=(
-        "You are a UX architect who transforms conceptual ideas into clear, intuitive interactions. "
-        "You think in terms of user journey, mental models, and task efficiency."
-    ),
-    llm=llm,
-    verbose=True,
-    allow_delegation=False
-)
+def _build_agents():
+    from crewai import Agent
+    from crewai.tools import tool
+    from agents.llm_client import build_llm
 
-business_strategist = Agent(
-    role="Business Strategy Expert",
-    goal=(
-        "Develop practical business and monetization strategy including: ICP, pricing tiers, "
-        "market size estimates, competitive positioning, CAC vs LTV, and go-to-market channels."
-    ),
-    backstory=(
-        "You are a SaaS strategy consultant who builds business models based on revenue potential "
-        "and cost efficiency. You present quantified assumptions to make plans investor-ready."
-    ),
-    llm=llm,
-    verbose=True,
-    allow_delegation=False
-)
+    started = time.perf_counter()
 
-change_impact_analyzer = Agent(
-    role="Change Impact Analyzer",
-    goal="Determine which report sections are affected by new information during refinements.",
-    backstory="You analyze how new requirements impact existing documentation and identify dependencies.",
-    llm=llm,
-    verbose=False,
-    allow_delegation=False
-)
+    # Timeouts, retries and hedging live in agents/llm_client.py
+    llm = build_llm(
+        temperature=0,
+        max_tokens=MAX_TOKEN,
+        model=GROQ_MODEL
+    )
+
+    # Lower-tier model used when a report stage overruns its time budget
+    fallback_llm = build_llm(
+        temperature=0,
+        max_tokens=MAX_TOKEN,
+        model=REPORT_FALLBACK_MODEL
+    )
+
+    @tool
+    def search_web_tool(query: str):
+        """Searches the web and returns results."""
+        from langchain_community.tools import DuckDuckGoSearchResults
+        search_tool = DuckDuckGoSearchResults(num_results=10, verbose=True)
+        return search_tool.run(query)
+
+    requirement_gathering_expert = Agent( 
+        role="Requirement Gathering Expert",    
+        goal="Understand user's AI agent idea through conversation and convert it into detailed requirements.",    
+        backstory=(
+            "You are a professional AI product consultant specializing in converting vague ideas "
+            "into clear, structured product requirements. You ask insightful follow-up questions "
+            "and know when you have enough information to proceed."
+        ),
+        verbose=True,
+        max_iter=5,
+        llm=llm,
+        allow_delegation=False,
+    )
 
-change_summarizer = Agent(
-    role="Change Summarizer",
-    goal="Create clear summaries of report changes after refinements.",
-    backstory="You explain technical changes in simple, user-friendly terms.",
-    llm=llm,
-    verbose=False,
-    allow_delegation=False
+    technical_architect = Agent(
+        role="Technical Architect",
+        goal=(
+            "Design technical architecture using ONLY approved tech stack: "
+            "Python, FastAPI, NextJS, React, React Native, TensorFlow, PyTorch, NumPy, Pandas, "
+            "Hugging Face, Streamlit, CrewAI, LangChain, LangGraph, RAG, MongoDB, PostgreSQL, "
+            "Redis, Pinecone, Prisma, Dizzle, AWS AI, Azure AI, Google Cloud AI, VAPI, Retell.AI, "
+            "BotPress, Relevance.AI, Whisper, ElevenLabs, Twilio, Stripe, WhatsApp API. "
+            "Keep architecture simple, lean, and efficient."
+        ),
+        backstory=(
+            "You are a senior AI systems architect specializing in designing scalable production-grade "
+            "agentic systems. You create practical, efficient architectures using only the approved tech stack."
+        ),
+        llm=llm,
+        verbose=True,
+        allow_delegation=False
+    )
+
+    ux_expert = Agent(
+        role="UX / Product Design Expert",
+        goal="Translate requirements into user flows and experience design structures.",
+        backstory=(
+            "You are a UX architect who transforms conceptual ideas into clear, intuitive interactions. "
+            "You think in terms of user journey, mental models, and task efficiency."
+        ),
+        llm=llm,
+        verbose=True,
+        allow_delegation=False
+    )
+
+    business_strategist = Agent(
+        role="Business Strategy Expert",
+        goal=(
+            "Develop practical business and monetization strategy including: ICP, pricing tiers, "
+            "market size estimates, competitive positioning, CAC vs LTV, and go-to-market channels."
+        ),
+        backstory=(
+            "You are a SaaS strategy consultant who builds business models based on revenue potential "
+            "and cost efficiency. You present quantified assumptions to make plans investor-ready."
+        ),
+        llm=llm,
+        verbose=True,
+        allow_delegation=False
+    )
+
+    change_impact_analyzer = Agent(
+        role="Change Impact Analyzer",
+        goal="Determine which report sections are affected by new information during refinements.",
+        backstory="You analyze how new requirements impact existing documentation and identify dependencies.",
+        llm=llm,
+        verbose=False,
+        allow_delegation=False
+    )
+
+    change_summarizer = Agent(
+        role="Change Summarizer",
+        goal="Create clear summaries of report changes after refinements.",
+        backstory="You explain technical changes in simple, user-friendly terms.",
+        llm=llm,
+        verbose=False,
+        allow_delegation=False
+    )
+    print(f"[INIT] LLMs and agents built in {time.perf_counter() - started:.2f}s")
+    return SimpleNamespace(
+        llm=llm,
+        fallback_llm=fallback_llm,
+        search_web_tool=search_web_tool,
+        requirement_gathering_expert=requirement_gathering_expert,
+        technical_architect=technical_architect,
+        ux_expert=ux_expert,
+        business_strategist=business_strategist,
+        change_impact_analyzer=change_impact_analyzer,
+        change_summarizer=change_summarizer,
+    )
+
+def warm_up():
+    """Builds the agents and opens the Mongo connection ahead of the first request."""
+    started = time.perf_counter()
+    try:
+        mongo_client.admin.command("ping")
+    except Exception as e:
+        print(f"[WARMUP] MongoDB not reachable yet: {e}")
+    get_agents()
+    from agents.email_generator import get_email_writer_agent
+    get_email_writer_agent()
+    pdf_renderer.warm_up()  # render worker processes (and reportlab)
+    print(f"[WARMUP] Ready in {time.perf_counter() - started:.2f}s")
+
+# ==============================
+# 🔹 PREPARED CREWS
+# ==============================
+# One-task crews are pooled per workflow (see agents/crew_pool.py): a request
+# checks one out, binds its prompt and kicks it off, instead of building a new
+# Task and Crew around the shared agent. Plain question/answer calls (the
+# conversation turn, change impact and summary, the email) skip crews
+# altogether and go through agents/direct_prompt.py.
+preview_crews = single_task_pool(
+    "preview",
+    lambda: get_agents().requirement_gathering_expert,
+    "A structured detailed summary describing the idea, audience, key features, and tech needs.",
 )
 
 # ==============================
@@ -197,11 +330,11 @@ def create_session(user_id, idea):
 
 def get_session(session_id):
     """Retrieves session by ID."""
-    return sessions.find_one({"session_id": session_id})
+    return resilience.mongo.call(sessions.find_one, {"session_id": session_id})
 
 def get_context(session_id):
     """Gets context for a session."""
-    session = sessions.find_one({"session_id": session_id})
+    session = get_session(session_id)
     return session["context"] if session else {}
 
 # ==============================
@@ -231,6 +364,7 @@ def safe_serialize(obj):
 # ==============================
 # 🔹 CONTEXT UPDATE WITH PROGRESS
 # ==============================
+@traced("session.update_context")
 def update_session_context(session_id, stage, content):
     """Store content and update progress."""    
     content_str = safe_serialize(content)
@@ -256,7 +390,8 @@ def update_session_context(session_id, stage, content):
         "saved_at": saved_at,
     }
 
-    sessions.update_one(
+    resilience.mongo.call(
+        sessions.update_one,
         {"session_id": session_id},
         {
             "$set": set_payload,
@@ -270,6 +405,7 @@ def update_session_context(session_id, stage, content):
 # ==============================
 # 🔹 CONVERSATIONAL REFINEMENT
 # ==============================
+@profiled
 def chat_with_requirement_agent(session_id: str, user_message: str):
     """Interactive Q&A to refine requirements."""
     session = get_session(session_id)
@@ -289,8 +425,7 @@ def chat_with_requirement_agent(session_id: str, user_message: str):
     ])
     
     # Agent responds
-    task = Task(
-        description=f"""
+    description = f"""
         Conversation so far:
         {conversation_context}
         
@@ -306,18 +441,15 @@ def chat_with_requirement_agent(session_id: str, user_message: str):
            - Business model and goals
         
         Be conversational and encouraging. Don't overwhelm with too many questions at once.
-        """,
-        agent=requirement_gathering_expert,
-        expected_output="Either complete requirements summary OR clarifying questions"
-    )
-    
-    crew = Crew(
-        agents=[requirement_gathering_expert], 
-        tasks=[task],
-        verbose=False
-    )
-    response = crew.kickoff()
-    response_str = safe_serialize(response)
+        """
+    
+    with metering.scope(session_id, "conversation"):
+        response_str = run_prompt(
+            "conversation",
+            get_agents().requirement_gathering_expert,
+            description,
+            "Either complete requirements summary OR clarifying questions",
+        )
     
     # Add agent response
     conversation_history.append({
@@ -340,6 +472,10 @@ def chat_with_requirement_agent(session_id: str, user_message: str):
         }
     )
     
+    # Start the preview now so /preview/generate can return it instantly
+    if requirements_complete and SPECULATIVE_PREVIEW:
+        start_speculative_preview(session_id)
+    
     return {
         "response": response_str,
         "requirements_complete": requirements_complete,
@@ -349,44 +485,138 @@ def chat_with_requirement_agent(session_id: str, user_message: str):
 # ==============================
 # 🔹 PREVIEW GENERATION (FREE)
 # ==============================
-def generate_preview(session_id: str):
-    """Generates requirement gathering preview (free, no email needed)."""
-    session = get_session(session_id)
-    idea = session["idea"]
-    
-    # Build enhanced idea from conversation
-    conversation = session.get("conversation_history", [])
+def conversation_fingerprint(session):
+    """Hash of the idea and conversation a preview was generated from."""
+    digest = hashlib.sha256(session.get("idea", "").encode())
+    for msg in session.get("conversation_history", []):
+        digest.update(f"\n{msg['role']}:{msg['content']}".encode())
+    return digest.hexdigest()
+
+def build_enhanced_idea(session: dict) -> str:
+    """The idea plus the refinement conversation, as every report stage is prompted with it."""
     conversation_text = "\n".join([
         f"{msg['role']}: {msg['content']}" 
-        for msg in conversation
+        for msg in session.get("conversation_history", [])
     ])
+    return f"{session['idea']}\n\nConversation Context:\n{conversation_text}"
+
+@profiled
+def generate_preview(session_id: str, speculative: bool = False):
+    """Generates requirement gathering preview (free, no email needed)."""
+    session = get_session(session_id)
+    fingerprint = conversation_fingerprint(session)
+    enhanced_idea = build_enhanced_idea(session)
     
-    enhanced_idea = f"{idea}\n\nConversation Context:\n{conversation_text}"
-    
-    task = requirement_gathering_task_func(enhanced_idea, session_id)
-    
-    crew = Crew(
-        agents=[requirement_gathering_expert],
-        tasks=[task],
-        process=Process.sequential,
-        verbose=False
+    with metering.scope(session_id, "speculative_preview" if speculative else "preview"):
+        result = preview_crews.kickoff(
+            requirement_gathering_description(enhanced_idea),
+            callback=lambda output: update_session_context(session_id, "requirement_gathering", output),
+        )
+    preview_content = safe_serialize(result)
+    
+    # Store the preview so later requests (or other workers) can reuse it
+    update = {
+        "preview_content": preview_content,
+        "preview_fingerprint": fingerprint,
+        "preview_status": "ready",
+        "preview_generated_at": datetime.utcnow(),
+        "preview_speculative": speculative,
+    }
+    if not speculative:
+        update["stage"] = "preview_generated"
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": update}
     )
     
-    result = crew.kickoff()
+    return preview_content
+
+def start_speculative_preview(session_id: str):
+    """Kicks off preview generation in the background (no-op if one is already running)."""
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"preview_status": "generating", "preview_started_at": datetime.utcnow()}}
+    )
+    preview_jobs.submit(session_id, _speculative_preview_job, session_id)
+    print(f"[SPECULATION] Preview generation started for {session_id}")
+
+def _speculative_preview_job(session_id: str):
+    try:
+        with cancellable(session_id, "speculative_preview"):
+            return generate_preview(session_id, speculative=True)
+    except Exception as e:
+        sessions.update_one(
+            {"session_id": session_id},
+            {"$set": {"preview_status": "cancelled" if isinstance(e, GenerationCancelled) else "failed"}}
+        )
+        raise
+
+def _stored_preview(session, fingerprint):
+    if session and session.get("preview_content") and session.get("preview_fingerprint") == fingerprint:
+        return session["preview_content"]
+    return None
+
+@traced("preview.get")
+def get_or_generate_preview(session_id: str):
+    """
+    Returns the speculative preview if it is ready, joins it if it is still
+    running, and only generates synchronously as a last resort.
+    """
+    session = get_session(session_id)
+    fingerprint = conversation_fingerprint(session)
     
-    # Update session stage
+    preview = _stored_preview(session, fingerprint)
+    if preview is None:
+        # Waits under the request's token, so a client that went away frees its thread
+        token = current_token()
+        try:
+            found, _ = preview_jobs.join(session_id, timeout=PREVIEW_JOIN_TIMEOUT_SECONDS, cancel_token=token)
+            if not found and session.get("preview_status") == "generating":
+                _wait_for_remote_preview(session, token)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"[SPECULATION] Could not reuse speculative preview for {session_id}: {e}")
+        preview = _stored_preview(get_session(session_id), fingerprint)
+    
+    if preview is None:
+        print(f"[SPECULATION] Preview miss for {session_id}, generating now")
+        preview = generate_preview(session_id)
+        maybe_start_speculative_report(session_id)
+        return preview
+    
+    print(f"[SPECULATION] Preview hit for {session_id}")
+    metering.record_cache_hit("preview", session_id)
     sessions.update_one(
         {"session_id": session_id},
         {"$set": {"stage": "preview_generated"}}
     )
-    
-    return safe_serialize(result)
+    maybe_start_speculative_report(session_id)
+    return preview
+
+def _wait_for_remote_preview(session, token=None):
+    """Polls Mongo while a preview started by another worker finishes; stops if `token` is cancelled."""
+    started_at = session.get("preview_started_at") or datetime.utcnow()
+    give_up_at = time.monotonic() + max(0, PREVIEW_JOIN_TIMEOUT_SECONDS - (datetime.utcnow() - started_at).total_seconds())
+    while time.monotonic() < give_up_at:
+        current = get_session(session["session_id"])
+        if current.get("preview_status") != "generating":
+            return
+        if token is None:
+            time.sleep(1)
+        elif token.wait(1):
+            token.raise_if_cancelled()
 
 # ==============================
 # 🔹 LEAD CAPTURE
 # ==============================
 def capture_lead(session_id: str, email: str, name: str, phone: str = None):
     """Captures lead information and triggers full report generation."""
+    return _insert_lead(session_id, email, name, phone)["lead_id"]
+
+@traced("lead.capture")
+def _insert_lead(session_id: str, email: str, name: str, phone: str = None):
+    """Stores the lead and marks the session; returns the lead document."""
     session = get_session(session_id)
     
     # Calculate lead score
@@ -425,7 +655,7 @@ def capture_lead(session_id: str, email: str, name: str, phone: str = None):
     
     print(f"[LEAD CAPTURED] {name} ({email}) - Score: {score}")
     
-    return lead["lead_id"]
+    return lead
 
 # ==============================
 # 🔹 LEAD SCORING
@@ -458,7 +688,7 @@ def calculate_lead_score(session):
     score += min(business_score, 15)
     
     # Detailed requirements (0-10)
-    req_content = context.get("requirement_gathering", "")
+    req_content = context.get("requirement_gathering") or ""
     if len(req_content) > 1000:
         score += 10
     elif len(req_content) > 500:
@@ -469,32 +699,68 @@ def calculate_lead_score(session):
 # ==============================
 # 🔹 FULL REPORT GENERATION
 # ==============================
-def generate_full_report(session_id: str):
-    """Generates complete report after lead capture."""
+@traced("report.generate")
+def generate_full_report(session_id: str, deadline_mode: bool = None):
+    """
+    Generates complete report after lead capture.
+
+    deadline_mode overrides REPORT_DEADLINE_MODE (the scheduler forces it for
+    high-priority leads so their report lands within REPORT_SLA_SECONDS).
+    """
     session = get_session(session_id)
-    idea = session["idea"]
+    enhanced_idea = build_enhanced_idea(session)
     
-    # Build enhanced idea from conversation
-    conversation = session.get("conversation_history", [])
-    conversation_text = "\n".join([
-        f"{msg['role']}: {msg['content']}" 
-        for msg in conversation
-    ])
-    enhanced_idea = f"{idea}\n\nConversation Context:\n{conversation_text}"
+    # Sections generated speculatively while the user was on the preview page
+    precomputed = take_speculative_sections(session)
+    
+    if deadline_mode is None:
+        deadline_mode = REPORT_DEADLINE_MODE
+    
+    with metering.scope(session_id, "full_report"):
+        if deadline_mode:
+            generate_full_report_with_deadlines(session, enhanced_idea, precomputed)
+        elif precomputed:
+            run_remaining_stages(session_id, enhanced_idea, precomputed)
+        else:
+            run_full_report_crew(session_id, enhanced_idea)
+    
+    # Update session
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"stage": "report_complete"}}
+    )
+    
+    # Send email
+    send_report_email(session_id)
+    
+    # Notify sales team
+    notify_sales_team(session_id)
     
+    return get_context(session_id)
+
+def run_remaining_stages(session_id: str, enhanced_idea: str, precomputed: dict):
+    """Stores precomputed sections and generates only the stages still missing."""
+    prior = {}
+    for stage in STAGE_ORDER:
+        content = precomputed.get(stage) or run_stage(stage, enhanced_idea, prior)
+        prior[stage] = content
+        update_session_context(session_id, stage, content)
+    return prior
+
+@profiled
+def run_full_report_crew(session_id: str, enhanced_idea: str):
+    """Runs all four stages as one sequential crew (no time budget)."""
+    from crewai import Crew, Process
+
     # Generate all tasks with context passing
     requirement_task = requirement_gathering_task_func(enhanced_idea, session_id)
     technical_task = technical_architecture_task_func(requirement_task, session_id)
     ux_task = ux_task_func(requirement_task, technical_task, session_id)
     business_task = business_strategy_task_func(requirement_task, technical_task, ux_task, session_id)
+    tasks = [requirement_task, technical_task, ux_task, business_task]
 
     crew = Crew(
-        agents=[
-            requirement_gathering_expert,
-            technical_architect,
-            ux_expert,
-            business_strategist
-        ],
+        agents=_own_agents(tasks),
         tasks=[
             requirement_task,
             technical_task,
@@ -507,73 +773,501 @@ def generate_full_report(session_id: str):
         verbose=True
     )
 
-    result = crew.kickoff()
-    
-    # Update session
-    sessions.update_one(
-        {"session_id": session_id},
-        {"$set": {"stage": "report_complete"}}
-    )
-    
-    # Send email
-    send_report_email(session_id)
-    
-    # Notify sales team
-    notify_sales_team(session_id)
-    
-    return get_context(session_id)
+    return crew.kickoff()
 
 # ==============================
 # 🔹 TASK DEFINITIONS WITH CONTEXT
 # ==============================
+def _own_agents(tasks: list):
+    """
+    Moves the tasks onto per-crew copies of their agents and returns the copies.
+
+    Crew.kickoff() rebinds agent.crew and agent.agent_executor, so crews that
+    share the module's agents and run concurrently can end up on each other's executor.
+    """
+    copies = {}
+    for task in tasks:
+        if id(task.agent) not in copies:
+            copies[id(task.agent)] = task.agent.copy()
+        task.agent = copies[id(task.agent)]
+    return list(copies.values())
+
+def requirement_gathering_description(user_input: str):
+    return (
+        f"Take the following idea: '{user_input}' and generate a detailed understanding document. "
+        f"Include: idea summary, target audience, key features, potential benefits, "
+        f"and suggested tech requirements."
+    )
+
 def requirement_gathering_task_func(user_input: str, session_id: str):
+    from crewai import Task
     return Task(
-        description=f"Take the following idea: '{user_input}' and generate a detailed understanding document. "
-                    f"Include: idea summary, target audience, key features, potential benefits, "
-                    f"and suggested tech requirements.",
-        agent=requirement_gathering_expert,
+        description=requirement_gathering_description(user_input),
+        agent=get_agents().requirement_gathering_expert,
         expected_output="A structured detailed summary describing the idea, audience, key features, and tech needs.",
         callback=lambda result: update_session_context(session_id, "requirement_gathering", result)
     )
 
 def technical_architecture_task_func(requirement_task, session_id: str):
+    from crewai import Task
     return Task(
         description=(
             "Using the requirements from the previous task, design a complete technical architecture. "
             "Include: system components, data flow, LangGraph nodes, CrewAI agent responsibilities, "
             "LangChain tools, and which MCP servers or external APIs are needed."
         ),
-        agent=technical_architect,
+        agent=get_agents().technical_architect,
         context=[requirement_task],  # ✅ Access to requirement output
         expected_output="A technical architecture blueprint in markdown format.",
         callback=lambda result: update_session_context(session_id, "technical_architecture", result)
     )
 
 def ux_task_func(requirement_task, technical_task, session_id: str):
+    from crewai import Task
     return Task(
         description=(
             "Using the requirement and architecture reports as context, "
             "create user experience documentation including key user journeys, user flows, and interaction logic."
         ),
-        agent=ux_expert,
+        agent=get_agents().ux_expert,
         context=[requirement_task, technical_task],  # ✅ Access to both outputs
         expected_output="User flow & UX journey documentation.",
         callback=lambda result: update_session_context(session_id, "ux_design", result)
     )
 
 def business_strategy_task_func(requirement_task, technical_task, ux_task, session_id: str):
+    from crewai import Task
     return Task(
         description=(
             "Using all previous deliverables as context, create a business strategy blueprint. "
             "Include: ideal customer profiles, monetization models, pricing tiers, go-to-market channels, "
             "and competitive advantage."
         ),
-        agent=business_strategist,
+        agent=get_agents().business_strategist,
         context=[requirement_task, technical_task, ux_task],  # ✅ Access to all outputs
         expected_output="Business Strategy Blueprint.",
         callback=lambda result: update_session_context(session_id, "business_strategy", result)
     )
 
+# ==============================
+# 🔹 DEADLINE-DRIVEN REPORT PIPELINE
+# ==============================
+STAGE_ORDER = ["requirement_gathering", "technical_architecture", "ux_design", "business_strategy"]
+
+STAGE_TITLES = {
+    "requirement_gathering": "Requirements Analysis",
+    "technical_architecture": "Technical Architecture",
+    "ux_design": "UX Design & User Flows",
+    "business_strategy": "Business Strategy",
+}
+
+# "agent" names an attribute of get_agents()
+STAGE_SPECS = {
+    "requirement_gathering": {
+        "agent": "requirement_gathering_expert",
+        "description": "Take the following idea and generate a detailed understanding document. "
+                       "Include: idea summary, target audience, key features, potential benefits, "
+                       "and suggested tech requirements.",
+        "expected_output": "A structured detailed summary describing the idea, audience, key features, and tech needs.",
+    },
+    "technical_architecture": {
+        "agent": "technical_architect",
+        "description": "Using the requirements below, design a complete technical architecture. "
+                       "Include: system components, data flow, LangGraph nodes, CrewAI agent responsibilities, "
+                       "LangChain tools, and which MCP servers or external APIs are needed.",
+        "expected_output": "A technical architecture blueprint in markdown format.",
+    },
+    "ux_design": {
+        "agent": "ux_expert",
+        "description": "Using the requirement and architecture reports below, create user experience "
+                       "documentation including key user journeys, user flows, and interaction logic.",
+        "expected_output": "User flow & UX journey documentation.",
+    },
+    "business_strategy": {
+        "agent": "business_strategist",
+        "description": "Using all previous deliverables below, create a business strategy blueprint. "
+                       "Include: ideal customer profiles, monetization models, pricing tiers, go-to-market channels, "
+                       "and competitive advantage.",
+        "expected_output": "Business Strategy Blueprint.",
+    },
+}
+
+# Last-resort sections used when neither the primary nor the fallback model finish in time
+SECTION_TEMPLATES = {
+    "requirement_gathering": (
+        "## Idea Summary\n{idea}\n\n"
+        "## Target Audience\nTo be refined with your consultant.\n\n"
+        "## Key Features\n- Core AI agent workflow\n- User-facing interface\n- Admin and analytics\n\n"
+        "## Suggested Tech Requirements\n- Python / FastAPI backend\n- LLM provider integration\n- MongoDB for state"
+    ),
+    "technical_architecture": (
+        "## System Components\n- **Frontend**: NextJS / React\n- **API**: FastAPI\n"
+        "- **Agents**: CrewAI / LangGraph orchestration\n- **Storage**: MongoDB, Redis cache\n\n"
+        "## Data Flow\nUser request -> API -> agent workflow -> LLM + tools -> stored result -> UI\n\n"
+        "A detailed architecture for your idea will be prepared during your consultation."
+    ),
+    "ux_design": (
+        "## Key User Journey\n1. Onboarding and goal capture\n2. Core agent interaction\n"
+        "3. Review and refine results\n4. Export and share\n\n"
+        "Detailed user flows will be prepared during your consultation."
+    ),
+    "business_strategy": (
+        "## Monetization\n- Freemium entry tier\n- Pro subscription\n- Enterprise plan\n\n"
+        "## Go-To-Market\n- Content marketing\n- Community and partnerships\n\n"
+        "A quantified strategy will be prepared during your consultation."
+    ),
+}
+
+# Stage crews run here so the pipeline can stop waiting when a budget expires
+_stage_pool = ThreadPoolExecutor(max_workers=int(os.getenv("STAGE_POOL_WORKERS", "8")), thread_name_prefix="report-stage")
+
+def _stage_agent(stage: str):
+    return getattr(get_agents(), STAGE_SPECS[stage]["agent"])
+
+def _stage_crews(stage: str, fallback: bool = False):
+    """Pooled one-task crews for a stage, on its primary agent or the fallback model."""
+    if fallback:
+        return single_task_pool(f"{stage}.fallback", lambda: _fallback_agent(stage), STAGE_SPECS[stage]["expected_output"])
+    return single_task_pool(stage, lambda: _stage_agent(stage), STAGE_SPECS[stage]["expected_output"])
+
+@profiled
+def _kickoff_single_task(crews, description: str):
+    """Runs one task on a pooled one-agent crew and returns the raw text."""
+    return safe_serialize(crews.kickoff(description))
+
+def _run_with_budget(fn, budget: float):
+    """Runs fn on the stage pool; raises FutureTimeoutError once the budget is spent.
+
+    A stage that overruns keeps its thread until the LLM deadline fires, but
+    its output is discarded: only the pipeline writes results to the session.
+    """
+    # Run in a copy of the caller's context so metering/cancellation scopes carry over
+    future = _stage_pool.submit(contextvars.copy_context().run, fn)
+    try:
+        return future.result(timeout=budget)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+def _prior_deliverables(prior: dict):
+    return "\n\n".join(f"## {STAGE_TITLES[s]}\n{c}" for s, c in prior.items() if c)
+
+def _stage_description(stage: str, enhanced_idea: str, prior: dict):
+    """Full prompt for a stage run on its own, with earlier sections inlined as text."""
+    description = f"{STAGE_SPECS[stage]['description']}\n\nIdea:\n{enhanced_idea}"
+    prior_text = _prior_deliverables(prior)
+    if prior_text:
+        description += f"\n\nPrevious deliverables:\n{prior_text}"
+    return description
+
+def run_stage(stage: str, enhanced_idea: str, prior: dict):
+    """Runs one stage on its primary agent with no time budget."""
+    with metering.scope(stage=stage):
+        return _kickoff_single_task(_stage_crews(stage), _stage_description(stage, enhanced_idea, prior))
+
+def _fallback_agent(stage: str):
+    from crewai import Agent
+
+    agent = _stage_agent(stage)
+    return Agent(
+        role=agent.role,
+        goal=agent.goal,
+        backstory=agent.backstory,
+        llm=get_agents().fallback_llm,
+        verbose=False,
+        allow_delegation=False,
+    )
+
+def run_stage_with_deadline(stage: str, enhanced_idea: str, prior: dict, existing: str, deadline: float):
+    """
+    Produces one report section before `deadline` (time.monotonic()).
+
+    Tries, in order: the primary agent with the full prompt, the lower-tier model
+    with a shorter prompt, the section already stored on the session, and a template.
+    Returns (content, degradation) where degradation is None for a full-quality section.
+    """
+    prior_text = _prior_deliverables(prior)
+    description = _stage_description(stage, enhanced_idea, prior)
+
+    # Reserve time for the fallback model so an overrun can still produce a real section
+    budget = min(STAGE_BUDGETS[stage], deadline - time.monotonic() - REPORT_FALLBACK_BUDGET_SECONDS)
+    if budget > 0:
+        def run_primary():
+            with metering.scope(stage=stage):
+                return _kickoff_single_task(_stage_crews(stage), description)
+        try:
+            return _run_with_budget(run_primary, budget), None
+        except FutureTimeoutError:
+            print(f"[DEADLINE] {stage} exceeded its {budget:.0f}s budget, falling back")
+        except Exception as e:
+            print(f"[DEADLINE] {stage} failed ({e}), falling back")
+
+    budget = min(REPORT_FALLBACK_BUDGET_SECONDS, deadline - time.monotonic())
+    if budget > 0:
+        short_description = (
+            f"Write a concise {STAGE_TITLES[stage]} (under 300 words, markdown bullet points) "
+            f"for this AI agent idea:\n{enhanced_idea[:1500]}"
+        )
+        if prior_text:
+            short_description += f"\n\nKey context:\n{prior_text[:1500]}"
+        def run_fallback():
+            with metering.scope(stage=stage):
+                return _kickoff_single_task(_stage_crews(stage, fallback=True), short_description)
+        try:
+            return _run_with_budget(run_fallback, budget), "fallback_model"
+        except FutureTimeoutError:
+            print(f"[DEADLINE] {stage} fallback model exceeded {budget:.0f}s")
+        except Exception as e:
+            print(f"[DEADLINE] {stage} fallback model failed ({e})")
+
+    if existing:
+        return existing, "cached"
+    return SECTION_TEMPLATES[stage].replace("{idea}", enhanced_idea[:500]), "template"
+
+def generate_full_report_with_deadlines(session: dict, enhanced_idea: str, precomputed: dict = None):
+    """
+    Runs the four stages one by one, each within its budget and all within REPORT_SLA_SECONDS.
+
+    Stages in `precomputed` (e.g. speculative sections) are stored as-is.
+    Degraded sections are recorded on the session under `degraded_sections`
+    (stage -> "fallback_model" | "cached" | "template").
+    """
+    precomputed = precomputed or {}
+    session_id = session["session_id"]
+    existing_context = session.get("context", {})
+    started = time.monotonic()
+    deadline = started + REPORT_SLA_SECONDS
+
+    prior = {}
+    degraded = {}
+    timings = {}
+    for stage in STAGE_ORDER:
+        if stage in precomputed:
+            prior[stage] = precomputed[stage]
+            update_session_context(session_id, stage, precomputed[stage])
+            continue
+        stage_started = time.monotonic()
+        content, degradation = run_stage_with_deadline(
+            stage, enhanced_idea, prior, existing_context.get(stage), deadline
+        )
+        timings[stage] = round(time.monotonic() - stage_started, 2)
+        if degradation:
+            degraded[stage] = degradation
+        prior[stage] = content
+        update_session_context(session_id, stage, content)
+
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {
+            "degraded_sections": degraded,
+            "report_degraded": bool(degraded),
+            "stage_timings": timings,
+        }}
+    )
+    print(f"[DEADLINE] Report for {session_id} finished in {time.monotonic() - started:.1f}s "
+          f"(degraded: {degraded or 'none'})")
+    return prior
+
+# ==============================
+# 🔹 SPECULATIVE REPORT STAGES
+# ==============================
+SPECULATIVE_STAGES = ["technical_architecture", "ux_design"]
+
+def _today():
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+def _reserve_speculative_budget(tokens: int):
+    """Atomically reserves tokens from today's speculative budget; False if it would overrun."""
+    day = _today()
+    speculation_stats.update_one({"_id": day}, {"$setOnInsert": {"tokens_reserved": 0}}, upsert=True)
+    reserved = speculation_stats.find_one_and_update(
+        {"_id": day, "tokens_reserved": {"$lte": SPECULATIVE_DAILY_TOKEN_BUDGET - tokens}},
+        {"$inc": {"tokens_reserved": tokens, "started": 1}},
+    )
+    return reserved is not None
+
+def _record_speculation(**increments):
+    speculation_stats.update_one({"_id": _today()}, {"$inc": increments}, upsert=True)
+
+def maybe_start_speculative_report(session_id: str):
+    """
+    Pre-generates the architecture and UX stages for sessions likely to convert.
+
+    Runs only when the session scores at least SPECULATIVE_REPORT_MIN_SCORE and
+    today's speculative token budget still has room.
+    """
+    if not SPECULATIVE_REPORT:
+        return
+    session = get_session(session_id)
+    if session.get("lead_captured") or session.get("speculative_status") in ("generating", "ready", "cancelled"):
+        return
+    
+    score = calculate_lead_score(session)
+    if score < SPECULATIVE_REPORT_MIN_SCORE:
+        return
+    if not _reserve_speculative_budget(SPECULATIVE_REPORT_TOKEN_ESTIMATE):
+        _record_speculation(skipped_budget=1)
+        print(f"[SPECULATION] Daily budget reached, not pre-generating report for {session_id}")
+        return
+    
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"speculative_status": "generating", "speculative_started_at": datetime.utcnow()}}
+    )
+    report_jobs.submit(session_id, _speculative_report_job, session_id)
+    print(f"[SPECULATION] Pre-generating report stages for {session_id} (score {score})")
+
+def _speculative_report_job(session_id: str):
+    session = get_session(session_id)
+    basis = conversation_fingerprint(session)
+    requirements = session.get("context", {}).get("requirement_gathering")
+    # Same prompt as generate_full_report, so the stages can be reused verbatim at capture
+    enhanced_idea = build_enhanced_idea(session)
+    
+    prior = {"requirement_gathering": requirements}
+    status = "ready"
+    with metering.scope(session_id, "speculative_report") as usage:
+        try:
+            with cancellable(session_id, "speculative_report"):
+                for stage in SPECULATIVE_STAGES:
+                    prior[stage] = run_stage(stage, enhanced_idea, prior)
+        except GenerationCancelled:
+            # Keep the stages finished before the cancel; the report can still reuse them
+            status = "cancelled"
+        except Exception:
+            sessions.update_one({"session_id": session_id}, {"$set": {"speculative_status": "failed"}})
+            raise
+        finally:
+            # Metered usage replaces the up-front estimate in today's budget
+            _record_speculation(
+                tokens_spent=usage.total_tokens,
+                tokens_reserved=usage.total_tokens - SPECULATIVE_REPORT_TOKEN_ESTIMATE
+            )
+    tokens = usage.total_tokens
+    
+    sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {
+            "speculative_status": status,
+            "speculative_basis": basis,
+            "speculative_requirements": requirements,
+            "speculative_context": {stage: prior[stage] for stage in SPECULATIVE_STAGES if stage in prior},
+            "speculative_tokens": tokens,
+        }}
+    )
+
+def take_speculative_sections(session: dict):
+    """
+    Returns the speculative sections still valid for this session (plus the
+    requirements they were built on), joining a job that is still running.
+    Records a hit or a miss either way.
+    """
+    if not session.get("speculative_status"):
+        return {}
+    session_id = session["session_id"]
+    
+    try:
+        report_jobs.join(session_id, timeout=SPECULATIVE_REPORT_JOIN_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"[SPECULATION] Speculative report for {session_id} not usable: {e}")
+    session = get_session(session_id)
+    
+    requirements = session.get("context", {}).get("requirement_gathering")
+    valid = (
+        session.get("speculative_status") in ("ready", "cancelled")
+        and session.get("speculative_context")
+        and session.get("speculative_basis") == conversation_fingerprint(session)
+        and session.get("speculative_requirements") == requirements
+    )
+    tokens = session.get("speculative_tokens", 0)
+    if not valid:
+        _record_speculation(misses=1)
+        print(f"[SPECULATION] Report miss for {session_id}")
+        return {}
+    
+    _record_speculation(hits=1, tokens_used=tokens)
+    for stage in session["speculative_context"]:
+        metering.record_cache_hit(stage, session_id)
+    print(f"[SPECULATION] Report hit for {session_id}: reusing {', '.join(session['speculative_context'])}")
+    return {"requirement_gathering": requirements, **session["speculative_context"]}
+
+def get_speculation_stats(days: int = 7):
+    """
+    Daily speculation hit rate and token usage.
+
+    hit_rate is the share of started speculations that a report reused;
+    wasted_tokens covers stale results and sessions that never converted.
+    """
+    stats = []
+    for doc in speculation_stats.find().sort("_id", -1).limit(days):
+        started, hits = doc.get("started", 0), doc.get("hits", 0)
+        spent, used = doc.get("tokens_spent", 0), doc.get("tokens_used", 0)
+        stats.append({
+            "date": doc["_id"],
+            "started": started,
+            "hits": hits,
+            "misses": doc.get("misses", 0),
+            "skipped_budget": doc.get("skipped_budget", 0),
+            "hit_rate": round(hits / started * 100, 2) if started else 0,
+            "tokens_spent": spent,
+            "tokens_used": used,
+            "wasted_tokens": max(spent - used, 0),
+            "daily_budget": SPECULATIVE_DAILY_TOKEN_BUDGET,
+        })
+    return stats
+
+# ==============================
+# 🔹 CANCELLATION
+# ==============================
+def run_cancellable(session_id: str, kind: str, cancel_token, fn, *args):
+    """
+    Runs `fn` as a cancellable generation and records what it cost.
+
+    Completed runs that called the LLM feed the average cost per kind; cancelled
+    runs record what they spent before stopping, so tokens saved can be estimated.
+    """
+    with cancellable(session_id, kind, cancel_token), metering.scope(session_id, kind) as usage:
+        try:
+            result = fn(*args)
+        except GenerationCancelled:
+            _record_cancellation(kind, cancelled=1, tokens_before_cancel=usage.total_tokens)
+            raise
+        if usage.calls:
+            _record_cancellation(kind, completed=1, completed_tokens=usage.total_tokens)
+        return result
+
+def _record_cancellation(kind: str, **increments):
+    cancellation_stats.update_one(
+        {"_id": _today()},
+        {"$inc": {f"{kind}.{key}": value for key, value in increments.items()}},
+        upsert=True
+    )
+
+def get_cancellation_stats(days: int = 7):
+    """
+    Daily cancellations per generation kind and the tokens they saved.
+
+    tokens_saved_estimate = cancelled * average tokens of a completed run
+    - tokens already spent by the cancelled runs.
+    """
+    stats = []
+    for doc in cancellation_stats.find().sort("_id", -1).limit(days):
+        kinds = {}
+        for kind, counts in doc.items():
+            if kind == "_id":
+                continue
+            completed, cancelled = counts.get("completed", 0), counts.get("cancelled", 0)
+            average = counts.get("completed_tokens", 0) / completed if completed else 0
+            spent = counts.get("tokens_before_cancel", 0)
+            kinds[kind] = {
+                "completed": completed,
+                "cancelled": cancelled,
+                "tokens_before_cancel": spent,
+                "tokens_saved_estimate": max(int(cancelled * average - spent), 0),
+            }
+        stats.append({"date": doc["_id"], "kinds": kinds})
+    return stats
+
 # ==============================
 # 🔹 REFINEMENT SYSTEM
 # ==============================
@@ -600,17 +1294,33 @@ class IdeaRefinementManager:
                 "cta": "Book Free Consultation"
             }
         
+        # A refinement cancelled part-way is resumed when the same info is resubmitted:
+        # finished steps and regenerated sections are not redone.
+        pending = self.session.get("pending_refinement") or {}
+        if pending.get("additional_info") != additional_info:
+            pending = {"additional_info": additional_info, "completed": []}
+        
         # Step 1: Update idea
-        enhanced_idea = self._update_idea(additional_info)
+        enhanced_idea = pending.get("idea")
+        if enhanced_idea is None:
+            enhanced_idea = self._update_idea(additional_info)
+            self._save_progress(pending, idea=enhanced_idea)
         
         # Step 2: Detect affected sections
-        affected = self._detect_affected_sections(additional_info)
+        affected = pending.get("affected")
+        if affected is None:
+            affected = self._detect_affected_sections(additional_info)
+            self._save_progress(pending, affected=affected)
         
         # Step 3: Create version snapshot
-        version_num = self._create_version_snapshot("user_refinement")
+        version_num = pending.get("version")
+        if version_num is None:
+            version_num = self._create_version_snapshot("user_refinement")
+            self._save_progress(pending, version=version_num)
         
         # Step 4: Regenerate affected sections
-        results = self._regenerate_sections(enhanced_idea, affected)
+        check_cancelled()
+        results = self._regenerate_sections(enhanced_idea, list(affected), pending["completed"])
         
         # Step 5: Generate change summary
         changes = self._summarize_changes(version_num, version_num + 1)
@@ -618,8 +1328,10 @@ class IdeaRefinementManager:
         # Step 6: Increment refinements used
         sessions.update_one(
             {"session_id": self.session_id},
-            {"$inc": {"refinements_used": 1}}
+            {"$inc": {"refinements_used": 1}, "$unset": {"pending_refinement": ""}}
         )
+        # PDFs of the previous version are never served again
+        pdf_cache.invalidate(self.session_id)
         
         refinements_left = self.session["refinements_allowed"] - (self.session.get("refinements_used", 0) + 1)
         
@@ -631,6 +1343,28 @@ class IdeaRefinementManager:
             "refinements_left": refinements_left
         }
     
+    def _save_progress(self, pending: dict, **fields):
+        """Persists refinement progress so a cancelled refinement can resume."""
+        pending.update(fields)
+        sessions.update_one(
+            {"session_id": self.session_id},
+            {"$set": {"pending_refinement": pending}}
+        )
+    
+    def _section_callback(self, section: str, callback):
+        """Wraps a task callback so the finished section is also recorded."""
+        def done(output):
+            if callback:
+                callback(output)
+            self._mark_section_done(section)
+        return done
+    
+    def _mark_section_done(self, section: str):
+        sessions.update_one(
+            {"session_id": self.session_id},
+            {"$addToSet": {"pending_refinement.completed": section}}
+        )
+    
     def _update_idea(self, additional_info: str):
         """Appends new info to original idea."""
         original = self.session["idea"]
@@ -650,10 +1384,10 @@ class IdeaRefinementManager:
         )
         return enhanced
     
+    @profiled
     def _detect_affected_sections(self, new_info: str):
         """Uses LLM to detect which sections need updates."""
-        task = Task(
-            description=f"""
+        description = f"""
             User added new information: "{new_info}"
             
             Existing context: {json.dumps(self.session.get("context", {}), indent=2)[:500]}...
@@ -665,22 +1399,23 @@ class IdeaRefinementManager:
             - business_strategy: Include if target audience, pricing, or market changed
             
             Return ONLY a JSON array: ["section1", "section2"]
-            """,
-            agent=change_impact_analyzer,
-            expected_output="JSON array of section names"
-        )
+            """
         
-        crew = Crew(agents=[change_impact_analyzer], tasks=[task], verbose=False)
-        result = crew.kickoff()
+        with metering.scope(self.session_id, "refinement_impact"):
+            result = run_prompt("refinement_impact", get_agents().change_impact_analyzer, description, "JSON array of section names")
         
         try:
-            sections = json.loads(safe_serialize(result))
+            sections = json.loads(result)
             return sections if isinstance(sections, list) else ["requirement_gathering"]
         except:
             return ["requirement_gathering"]
     
-    def _regenerate_sections(self, enhanced_idea: str, sections: list):
-        """Regenerates specified sections with dependencies."""
+    @profiled
+    def _regenerate_sections(self, enhanced_idea: str, sections: list, completed: list = None):
+        """Regenerates specified sections with dependencies, skipping `completed` ones."""
+        from crewai import Crew, Process, Task
+
+        team = get_agents()
         # Ensure dependencies
         if "technical_architecture" in sections and "requirement_gathering" not in sections:
             sections.insert(0, "requirement_gathering")
@@ -693,52 +1428,52 @@ class IdeaRefinementManager:
         section_order = ["requirement_gathering", "technical_architecture", "ux_design", "business_strategy"]
         sections = [s for s in section_order if s in sections]
         
+        if completed:
+            return self._resume_sections(enhanced_idea, sections, completed)
+        
         # Build tasks
         tasks = []
-        agents_list = []
         
         for i, section in enumerate(sections):
             if section == "requirement_gathering":
                 task = requirement_gathering_task_func(enhanced_idea, self.session_id)
-                agent = requirement_gathering_expert
             elif section == "technical_architecture":
                 # Get previous task for context
                 prev_task = tasks[i-1] if i > 0 else None
                 task = Task(
                     description="Design complete technical architecture based on requirements.",
-                    agent=technical_architect,
+                    agent=team.technical_architect,
                     context=[prev_task] if prev_task else [],
                     expected_output="Technical architecture blueprint.",
                     callback=lambda result: update_session_context(self.session_id, "technical_architecture", result)
                 )
-                agent = technical_architect
             elif section == "ux_design":
                 prev_tasks = [t for t in tasks if t]
                 task = Task(
                     description="Create UX documentation with user journeys and flows.",
-                    agent=ux_expert,
+                    agent=team.ux_expert,
                     context=prev_tasks,
                     expected_output="UX journey documentation.",
                     callback=lambda result: update_session_context(self.session_id, "ux_design", result)
                 )
-                agent = ux_expert
             elif section == "business_strategy":
                 prev_tasks = [t for t in tasks if t]
                 task = Task(
                     description="Create business strategy blueprint.",
-                    agent=business_strategist,
+                    agent=team.business_strategist,
                     context=prev_tasks,
                     expected_output="Business Strategy Blueprint.",
                     callback=lambda result: update_session_context(self.session_id, "business_strategy", result)
                 )
-                agent = business_strategist
             
+            # Each finished task is recorded so a cancelled run can resume. This goes on the
+            # task itself: Crew(task_callback=...) is looked up through the agent's
+            # latest crew rather than this one.
+            task.callback = self._section_callback(section, task.callback)
             tasks.append(task)
-            agents_list.append(agent)
         
-        # Run crew
         crew = Crew(
-            agents=agents_list,
+            agents=_own_agents(tasks),
             tasks=tasks,
             process=Process.sequential,
             verbose=True
@@ -747,6 +1482,19 @@ class IdeaRefinementManager:
         result = crew.kickoff()
         return result
     
+    def _resume_sections(self, enhanced_idea: str, sections: list, completed: list):
+        """Generates the sections a cancelled refinement did not finish, on top of the stored ones."""
+        print(f"[REFINE] Resuming {self.session_id}: keeping {', '.join(completed)}")
+        context = get_context(self.session_id)
+        prior = {section: context.get(section) for section in completed if context.get(section)}
+        for section in sections:
+            if section in completed:
+                continue
+            prior[section] = run_stage(section, enhanced_idea, prior)
+            update_session_context(self.session_id, section, prior[section])
+            self._mark_section_done(section)
+        return prior
+    
     def _create_version_snapshot(self, trigger: str):
         """Creates version snapshot."""
         version_num = len(self.session.get("versions", [])) + 1
@@ -766,6 +1514,7 @@ class IdeaRefinementManager:
         
         return version_num
     
+    @profiled
     def _summarize_changes(self, old_version: int, new_version: int):
         """Generates summary of changes."""
         session = get_session(self.session_id)
@@ -780,8 +1529,7 @@ class IdeaRefinementManager:
         if not v_old or not v_new:
             return "Changes summary not available."
         
-        task = Task(
-            description=f"""
+        description = f"""
             The user refined their AI agent idea. Summarize what changed:
             
             Original idea: {v_old['idea_snapshot'][:300]}...
@@ -789,78 +1537,98 @@ class IdeaRefinementManager:
             
             Create a bullet-point summary of KEY changes (3-5 bullets max).
             Focus on: new features, tech changes, cost implications.
-            """,
-            agent=change_summarizer,
-            expected_output="Bullet-point summary of changes"
-        )
+            """
         
-        crew = Crew(agents=[change_summarizer], tasks=[task], verbose=False)
-        summary = crew.kickoff()
+        with metering.scope(self.session_id, "change_summary"):
+            summary = run_prompt("change_summary", get_agents().change_summarizer, description, "Bullet-point summary of changes")
         
-        return safe_serialize(summary)
+        return summary
 
 # ==============================
 # 🔹 EMAIL INTEGRATION
 # ==============================
+def _load_email_attachment(message: dict, spec: dict) -> dict:
+    """Resolves an outbox attachment reference when the email is sent."""
+    if spec.get("report_pdf"):
+        session = sessions.find_one({"session_id": message["session_id"]})
+        return {
+            "filename": spec["filename"],
+            # Base64 string, not list(pdf_bytes): a list of ints costs ~28x the PDF in memory
+            "content": get_report_pdf_base64(session),
+            "content_type": "application/pdf",
+        }
+    raise ValueError(f"Unknown attachment reference: {spec}")
+
+def _record_email_result(message: dict, email_id, error):
+    """Logs the outcome of an outbox delivery on the session."""
+    if message["kind"] != "report":
+        return
+    if error is None:
+        fields = {
+            "report_email_sent": True,
+            "report_email_sent_at": datetime.utcnow(),
+            "email_id": email_id,
+            "email_subject": message["params"]["subject"],
+        }
+    else:
+        fields = {"report_email_sent": False, "report_email_error": str(error)}
+    sessions.update_one({"session_id": message["session_id"]}, {"$set": fields})
+
+email_outbox.bind(db.email_outbox, _load_email_attachment, _record_email_result)
+
+@traced("email.report")
 def send_report_email(session_id: str):
-    """Sends report via email using Resend."""
+    """Queues the report email in the outbox; the PDF is attached when it is sent."""
     session = sessions.find_one({"session_id": session_id})
     lead_email = session.get("lead_email")
     lead_name = session.get("lead_name", "there")
     
-    if not lead_email or not resend.api_key:
-        print("[EMAIL] Skipping email - no email address or Resend key")
+    if not lead_email or not email_outbox.transport.configured:
+        print("[EMAIL] Skipping email - no email address or email transport")
         return
     
+    key = f"report:{session_id}"
     try:
-        # Generate PDF
-        pdf_bytes = generate_pdf_report(session)
+        # A retried report job must not write (or pay for) the email twice
+        if email_outbox.queued(key):
+            print(f"[EMAIL] Already queued for {session_id}")
+            return
         
         print(f"[EMAIL] Generating personalized email for {lead_name}...")
-        email_data = generate_personalized_email(session)
+        with metering.scope(session_id, "email"):
+            email_data = generate_personalized_email(session)
         
 
-        subject = email_data["subject"]
-        html_content = email_data["html_content"]
-        # Send email with Resend
         params = {
             "from": os.getenv("FROM_EMAIL", "noreply@youragency.com"),
             "to": [lead_email],
-            "subject": subject,
-            "html": html_content,
-            "attachments": [
-                {
-                    "filename": f"ai-agent-report-{session_id[:8]}.pdf",
-                    "content": list(pdf_bytes)  # Resend expects list of bytes
-                }
-            ]
+            "subject": email_data["subject"],
+            "html": email_data["html_content"],
         }
+        attachments = [{"filename": f"ai-agent-report-{session_id[:8]}.pdf", "report_pdf": True}]
         
-        email = resend.Emails.send(params)
-        print(f"[EMAIL] Sent to {lead_email} - ID: {email['id']}")
+        if email_outbox.enqueue("report", params, key, session_id=session_id, attachments=attachments):
+            print(f"[EMAIL] Queued for {lead_email}")
         
-        # Log email sent
+    except DependencyUnavailable as e:
+        print(f"[EMAIL SKIPPED] {e} (retry in {e.retry_after:.0f}s)")
         sessions.update_one(
             {"session_id": session_id},
-            {
-                "$set": {
-                    "report_email_sent": True,
-                    "report_email_sent_at": datetime.utcnow(),
-                    "email_id": email['id'],
-                    "email_subject": subject 
-                }
-            }
+            {"$set": {"report_email_sent": False, "report_email_error": str(e)}}
         )
-        
     except Exception as e:
         print(f"[EMAIL ERROR] {e}")
         import traceback
         traceback.print_exc()
 
 
+@traced("email.sales_alert")
 def notify_sales_team(session_id: str):
-    """Sends notification to sales team about new lead using Resend."""
+    """Queues a notification to the sales team about the new lead."""
     session = sessions.find_one({"session_id": session_id})
+    if not email_outbox.transport.configured:
+        print("[SALES NOTIFICATION] Skipping - no email transport")
+        return
     lead_email = session.get("lead_email")
     lead_name = session.get("lead_name")
     lead_score = session.get("lead_score", 0)
@@ -945,9 +1713,11 @@ def notify_sales_team(session_id: str):
             "html": html_content
         }
         
-        email = resend.Emails.send(params)
-        print(f"[SALES NOTIFICATION] Sent - ID: {email['id']}")
+        if email_outbox.enqueue("sales_alert", params, f"sales_alert:{session_id}", session_id=session_id):
+            print(f"[SALES NOTIFICATION] Queued for {session_id}")
         
+    except DependencyUnavailable as e:
+        print(f"[SALES NOTIFICATION SKIPPED] {e}")
     except Exception as e:
         print(f"[SALES NOTIFICATION ERROR] {e}")
         import traceback
@@ -1009,12 +1779,12 @@ def continue_conversation(session_id: str, user_message: str):
         "next_step": "preview_ready" if response["requirements_complete"] else "continue_conversation"
     }
 
-def generate_preview_report(session_id: str):
+def generate_preview_report(session_id: str, cancel_token=None):
     """
     Step 3: Generate free preview (requirements only).
     No email needed yet.
     """
-    preview_content = generate_preview(session_id)
+    preview_content = run_cancellable(session_id, "preview", cancel_token, get_or_generate_preview, session_id)
     
     return {
         "session_id": session_id,
@@ -1042,7 +1812,32 @@ def submit_lead_and_generate_full_report(session_id: str, email: str, name: str,
         "refinements_left": 2
     }
 
-def refine_report(session_id: str, additional_info: str):
+@traced("lead.submit")
+def submit_lead_and_schedule_full_report(session_id: str, email: str, name: str, phone: str = None):
+    """
+    Step 4 (API): capture the lead now, queue the full report by lead score.
+
+    High-score leads run in deadline mode on reserved report workers, so their
+    report and the sales alert go out within REPORT_SLA_SECONDS of starting.
+    """
+    lead = _insert_lead(session_id, email, name, phone)
+    tier = report_scheduler.submit(
+        session_id,
+        lead["lead_score"],
+        generate_full_report,
+        session_id,
+        deadline_mode=True if priority_tier(lead["lead_score"]) == HIGH else None,
+    )
+    
+    return {
+        "session_id": session_id,
+        "lead_id": lead["lead_id"],
+        "lead_score": lead["lead_score"],
+        "priority": tier,
+        "status": "generating"
+    }
+
+def refine_report(session_id: str, additional_info: str, cancel_token=None):
     """
     Step 5: User refines their idea after seeing report.
     """
@@ -1056,7 +1851,7 @@ def refine_report(session_id: str, additional_info: str):
             "cta_url": "https://calendly.com/youragency/consultation"
         }
     
-    result = manager.add_refinement(additional_info)
+    result = run_cancellable(session_id, "refinement", cancel_token, manager.add_refinement, additional_info)
     
     return result
 
@@ -1075,7 +1870,8 @@ def get_session_report(session_id: str):
         "lead_captured": session.get("lead_captured", False),
         "refinements_left": session.get("refinements_allowed", 2) - session.get("refinements_used", 0),
         "lead_score": session.get("lead_score", 0),
-        "versions": session.get("versions", [])
+        "versions": session.get("versions", []),
+        "degraded_sections": session.get("degraded_sections", {})
     }
 
 # ==============================
@@ -1105,6 +1901,115 @@ def get_lead_analytics():
         "conversion_rate": round((high_score_leads / total_leads * 100), 2) if total_leads > 0 else 0
     }
 
+def _llm_cost(prompt_tokens: int, completion_tokens: int):
+    return (prompt_tokens * LLM_PRICE_PROMPT_PER_MTOK + completion_tokens * LLM_PRICE_COMPLETION_PER_MTOK) / 1_000_000
+
+def _group_usage(match: dict, kind: str, key: str, fields: dict):
+    pipeline = [
+        {"$match": {**match, "kind": kind}},
+        {"$group": {"_id": f"${key}", **fields}},
+        {"$sort": {"_id": 1}}
+    ]
+    return list(llm_usage.aggregate(pipeline))
+
+def get_llm_usage_stats(days: int = 7, session_id: str = None):
+    """
+    LLM tokens, latency and cost by stage, agent and model, plus cost per lead.
+
+    Usage records are buffered for up to LLM_USAGE_FLUSH_SECONDS before they land in Mongo.
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    match = {"timestamp": {"$gte": since}}
+    if session_id:
+        match["session_id"] = session_id
+    
+    call_fields = {
+        "calls": {"$sum": 1},
+        "prompt_tokens": {"$sum": "$prompt_tokens"},
+        "completion_tokens": {"$sum": "$completion_tokens"},
+        "cached_prompt_tokens": {"$sum": "$cached_prompt_tokens"},
+        "attempts": {"$sum": "$attempts"},
+        "errors": {"$sum": {"$cond": [{"$eq": ["$status", "ok"]}, 0, 1]}},
+        "avg_latency_ms": {"$avg": "$latency_ms"},
+        "max_latency_ms": {"$max": "$latency_ms"},
+    }
+    
+    def summarize(rows):
+        return {
+            str(row["_id"]): {
+                "calls": row["calls"],
+                "prompt_tokens": row["prompt_tokens"],
+                "completion_tokens": row["completion_tokens"],
+                "cached_prompt_tokens": row["cached_prompt_tokens"],
+                "retries": max(row["attempts"] - row["calls"], 0),
+                "errors": row["errors"],
+                "avg_latency_ms": round(row["avg_latency_ms"] or 0, 1),
+                "max_latency_ms": row["max_latency_ms"],
+                "cost_usd": round(_llm_cost(row["prompt_tokens"], row["completion_tokens"]), 4),
+            }
+            for row in rows
+        }
+    
+    by_stage = summarize(_group_usage(match, "call", "stage", call_fields))
+    stage_runs = _group_usage(match, "stage", "stage", {
+        "runs": {"$sum": 1},
+        "avg_duration_ms": {"$avg": "$duration_ms"},
+        "max_duration_ms": {"$max": "$duration_ms"},
+    })
+    cache_hits = _group_usage(match, "cache_hit", "stage", {"hits": {"$sum": 1}})
+    
+    total_prompt = sum(stage["prompt_tokens"] for stage in by_stage.values())
+    total_completion = sum(stage["completion_tokens"] for stage in by_stage.values())
+    total_cost = _llm_cost(total_prompt, total_completion)
+    
+    stats = {
+        "days": days,
+        "totals": {
+            "calls": sum(stage["calls"] for stage in by_stage.values()),
+            "prompt_tokens": total_prompt,
+            "completion_tokens": total_completion,
+            "cost_usd": round(total_cost, 4),
+        },
+        "by_stage": by_stage,
+        "by_agent": summarize(_group_usage(match, "call", "agent", call_fields)),
+        "by_model": summarize(_group_usage(match, "call", "model", call_fields)),
+        "stage_durations": {
+            str(row["_id"]): {
+                "runs": row["runs"],
+                "avg_duration_ms": round(row["avg_duration_ms"] or 0, 1),
+                "max_duration_ms": row["max_duration_ms"],
+            }
+            for row in stage_runs
+        },
+        "cache_hits": {str(row["_id"]): row["hits"] for row in cache_hits},
+    }
+    
+    if not session_id:
+        # Every conversation's spend counts towards the cost of acquiring a lead
+        new_leads = leads.count_documents({"captured_at": {"$gte": since}})
+        stats["leads"] = new_leads
+        stats["cost_per_lead_usd"] = round(total_cost / new_leads, 4) if new_leads else None
+    return stats
+
+def get_session_traces(session_id: str, limit: int = 20):
+    """
+    Waterfall of the session's most recent traces (requests and the background
+    jobs they started), oldest first. Spans are exported in batches, so the
+    last second or so of activity may not be visible yet.
+    """
+    trace_ids = [
+        row["_id"] for row in trace_spans.aggregate([
+            {"$match": {"session_id": session_id}},
+            {"$group": {"_id": "$trace_id", "start": {"$min": "$start"}}},
+            {"$sort": {"start": -1}},
+            {"$limit": limit},
+        ])
+    ]
+    if not trace_ids:
+        return []
+    spans = list(trace_spans.find({"trace_id": {"$in": trace_ids}}, {"_id": 0}))
+    return tracing.build_waterfall(spans)
+
 def get_top_leads(limit: int = 10):
     """Gets top quality leads."""
     top_leads = leads.find().sort("lead_score", -1).limit(limit)
@@ -1120,6 +2025,26 @@ def get_top_leads(limit: int = 10):
         for lead in top_leads
     ]
 
+def find_export_sessions(min_score=None, max_score=None, since=None, until=None, stage=None, limit: int = 500):
+    """Cursor over the sessions matching an admin export filter, newest first."""
+    query = {}
+    if min_score is not None or max_score is not None:
+        query["lead_score"] = {}
+        if min_score is not None:
+            query["lead_score"]["$gte"] = min_score
+        if max_score is not None:
+            query["lead_score"]["$lte"] = max_score
+    if since is not None or until is not None:
+        query["created_at"] = {}
+        if since is not None:
+            query["created_at"]["$gte"] = since
+        if until is not None:
+            query["created_at"]["$lt"] = until
+    if stage:
+        query["stage"] = stage
+    # Small batches: the export streams, so only a few documents need to be in memory
+    return sessions.find(query).sort("created_at", -1).limit(limit).batch_size(50)
+
 # ==============================
 # 🔹 EXAMPLE USAGE / TESTING
 # ==============================
@@ -0,0 +1,97 @@
+# cancellation.py
+# Cooperative cancellation of in-flight generations (previews, refinements, speculative jobs)
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a generation once its cancel token has been set."""
+
+    def __init__(self, session_id: str, reason: str):
+        super().__init__(f"Generation for {session_id} cancelled: {reason}")
+        self.session_id = session_id
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cancellation flag for one generation.
+
+    The pipeline checks it cooperatively: ResilientLLM before every LLM call and
+    while waiting on one, and the refinement flow between its steps.
+    """
+
+    def __init__(self, session_id: str, kind: str):
+        self.session_id = session_id
+        self.kind = kind
+        self.reason = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self.cancelled:
+            self.reason = reason
+            self._event.set()
+            print(f"[CANCEL] {self.kind} for {self.session_id}: {reason}")
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled(self.session_id, self.reason)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps up to `timeout` seconds; returns True as soon as the token is cancelled."""
+        return self._event.wait(timeout)
+
+
+_current = ContextVar("generation_cancel_token", default=None)
+_active = {}
+_lock = threading.Lock()
+
+
+def current_token():
+    """The token of the generation running in this context, or None."""
+    return _current.get()
+
+
+def check_cancelled():
+    """Raises GenerationCancelled if the current generation has been cancelled."""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def cancellable(session_id: str, kind: str, token: CancelToken = None):
+    """
+    Runs the enclosed block as a cancellable generation for `session_id`.
+
+    Pass a token created by the caller (e.g. an API request watching for client
+    disconnects) to cancel it from outside; `cancel_session` reaches it either way.
+    """
+    token = token or CancelToken(session_id, kind)
+    with _lock:
+        _active.setdefault(session_id, set()).add(token)
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+        with _lock:
+            tokens = _active.get(session_id, set())
+            tokens.discard(token)
+            if not tokens:
+                _active.pop(session_id, None)
+
+
+def cancel_session(session_id: str, reason: str = "cancelled by user") -> list:
+    """Cancels every running generation of the session; returns their kinds."""
+    with _lock:
+        tokens = list(_active.get(session_id, ()))
+    for token in tokens:
+        token.cancel(reason)
+    return [token.kind for token in tokens]
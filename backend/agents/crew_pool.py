@@ -0,0 +1,121 @@
+# crew_pool.py
+# Prepared one-task crews, reused across requests instead of rebuilt per call.
+#
+# Building a Task and a Crew runs pydantic validation, loads the i18n prompts,
+# wires the cache handler and opens the task-output storage on every call. A
+# CrewPool keeps finished crews per workflow and only rebinds the per-request
+# prompt (and callback) before the next kickoff.
+#
+# Each pooled crew owns a copy of its agent. Crew.kickoff() rebinds agent.crew
+# and agent.agent_executor, so two requests kicking off crews that share one
+# Agent object could otherwise run on each other's executor.
+
+import os
+import threading
+from contextlib import contextmanager
+
+# Idle crews kept per workflow; extra crews built under a burst are dropped
+CREW_POOL_MAX_IDLE = int(os.getenv("CREW_POOL_MAX_IDLE", "8"))
+
+
+class PooledCrew:
+    """A one-task crew with its own copy of the agent; the task prompt is set per kickoff."""
+
+    def __init__(self, agent, expected_output: str):
+        from crewai import Crew, Task
+
+        self.agent = agent.copy()
+        self.task = Task(description="(bound per request)", agent=self.agent, expected_output=expected_output)
+        self.crew = Crew(agents=[self.agent], tasks=[self.task], verbose=False)
+
+    def bind(self, description: str, callback=None):
+        """Sets this request's prompt and callback and clears the previous run's task state."""
+        task = self.task
+        # Assigned directly rather than via kickoff(inputs=...), which would
+        # also substitute any {placeholders} found in user-provided text
+        task.description = description
+        task.callback = callback
+        task.output = None
+        task.retry_count = 0
+        task.processed_by_agents = set()
+        task.used_tools = task.tools_errors = task.delegations = 0
+
+    def kickoff(self, description: str, callback=None):
+        self.bind(description, callback)
+        return self.crew.kickoff()
+
+
+class CrewPool:
+    """Idle PooledCrews for one workflow, built on demand by `factory()`."""
+
+    def __init__(self, name: str, factory, max_idle: int = CREW_POOL_MAX_IDLE):
+        self.name = name
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+        self.in_use = 0
+
+    @contextmanager
+    def checkout(self):
+        """Yields an idle crew (or a new one); it goes back to the pool unless the run raised."""
+        with self._lock:
+            crew = self._idle.pop() if self._idle else None
+            if crew is not None:
+                self.reused += 1
+            self.in_use += 1
+        if crew is None:
+            try:
+                crew = self.factory()
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            with self._lock:
+                self.built += 1
+        try:
+            yield crew
+        except BaseException:
+            # A failed or cancelled kickoff may leave the crew half-updated; let it go
+            with self._lock:
+                self.in_use -= 1
+            raise
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(crew)
+
+    def kickoff(self, description: str, callback=None):
+        with self.checkout() as crew:
+            return crew.kickoff(description, callback)
+
+    def stats(self):
+        with self._lock:
+            return {"built": self.built, "reused": self.reused, "idle": len(self._idle), "in_use": self.in_use}
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def crew_pool(name: str, factory) -> CrewPool:
+    """The pool registered under `name`, created with `factory` on first use."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = CrewPool(name, factory)
+        return pool
+
+def single_task_pool(name: str, get_agent, expected_output: str) -> CrewPool:
+    """Pool of one-task crews for the agent returned by `get_agent()` (resolved on first build)."""
+    return crew_pool(name, lambda: PooledCrew(get_agent(), expected_output))
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.stats() for pool in pools}
@@ -0,0 +1,53 @@
+# direct_prompt.py
+# Runs a one-agent, one-task prompt straight on the agent's LLM, without a Crew.
+#
+# A crew around a single task adds nothing but overhead: the agent executor's
+# ReAct scaffolding ("Thought: / Final Answer:" instructions and tool notes) in
+# every prompt, plus crewai's per-kickoff setup. The prompt here keeps the
+# agent's role, backstory and goal, and the task's description and expected
+# output. The call still goes through ResilientLLM, so retries, hedging,
+# cancellation, metering and tracing work as before.
+#
+# DIRECT_PROMPTS=false routes the same calls through pooled crews instead
+# (see crew_pool.py).
+
+import os
+import textwrap
+
+from agents.crew_pool import single_task_pool
+
+DIRECT_PROMPTS = os.getenv("DIRECT_PROMPTS", "true").lower() == "true"
+
+
+def agent_messages(agent, description: str, expected_output: str) -> list:
+    """System message with the agent's framing, user message with the task."""
+    return [
+        {
+            "role": "system",
+            "content": f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}",
+        },
+        {
+            "role": "user",
+            "content": f"{textwrap.dedent(description).strip()}\n\nExpected output: {expected_output}",
+        },
+    ]
+
+
+def final_answer(text: str) -> str:
+    """The answer without ReAct framing, in case the model adds it anyway (as crewai's parser does)."""
+    if "Final Answer:" in text:
+        text = text.split("Final Answer:")[-1]
+    return text.strip()
+
+
+def run_prompt(name: str, agent, description: str, expected_output: str) -> str:
+    """
+    Answers `description` as `agent` and returns the text.
+
+    `name` identifies the workflow; it names the crew pool used when
+    DIRECT_PROMPTS is off.
+    """
+    if not DIRECT_PROMPTS:
+        return str(single_task_pool(name, lambda: agent, expected_output).kickoff(description))
+    response = agent.llm.call(agent_messages(agent, description, expected_output), from_agent=agent)
+    return final_answer(str(response))
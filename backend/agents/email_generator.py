@@ -1,36 +1,52 @@
-from crewai import Agent, Task, Crew, Process
-from langchain_groq import ChatGroq
 import os
+import threading
 
-# Initialize LLM
-llm = ChatGroq(
-    temperature=0.7,  # Slightly higher for creative email writing
-    groq_api_key=os.getenv("GROQ_API_KEY"),
-    model=os.getenv("GROQ_MODEL", "mixtral-8x7b-32768"),
-    max_tokens=os.getenv("MAX_TOKEN_EMAIL"),
-)
+from agents.direct_prompt import run_prompt
 
-# Email Writer Agent
-email_writer_agent = Agent(
-    role="Professional Email Copywriter",
-    goal="Create personalized, engaging emails that relate to the user's specific AI agent idea and make them excited about the report",
-    backstory=(
-        "You are an expert email copywriter who specializes in tech and AI products. "
-        "You know how to write emails that are personal, engaging, and action-oriented. "
-        "You always reference specific details from the user's project to make them feel "
-        "like the email was written just for them. You balance professionalism with warmth."
-    ),
-    llm=llm,
-    verbose=False,
-    allow_delegation=False,
-)
+# Built on first use: importing crewai takes seconds (see get_agents() in ai_consultant_system)
+_email_writer_agent = None
+_email_writer_lock = threading.Lock()
+
+def get_email_writer_agent():
+    """The Email Writer agent and its LLM, built on the first call."""
+    global _email_writer_agent
+    if _email_writer_agent is None:
+        with _email_writer_lock:
+            if _email_writer_agent is None:
+                _email_writer_agent = _build_email_writer_agent()
+    return _email_writer_agent
+
+def _build_email_writer_agent():
+    from crewai import Agent
+    from agents.llm_client import build_llm
+
+    # Initialize LLM
+    llm = build_llm(
+        temperature=0.7,  # Slightly higher for creative email writing
+        model=os.getenv("GROQ_MODEL", "mixtral-8x7b-32768"),
+        max_tokens=os.getenv("MAX_TOKEN_EMAIL"),
+    )
+
+    # Email Writer Agent
+    return Agent(
+        role="Professional Email Copywriter",
+        goal="Create personalized, engaging emails that relate to the user's specific AI agent idea and make them excited about the report",
+        backstory=(
+            "You are an expert email copywriter who specializes in tech and AI products. "
+            "You know how to write emails that are personal, engaging, and action-oriented. "
+            "You always reference specific details from the user's project to make them feel "
+            "like the email was written just for them. You balance professionalism with warmth."
+        ),
+        llm=llm,
+        verbose=False,
+        allow_delegation=False,
+    )
 
 def generate_personalized_email(session_data: dict) -> dict:
     """
     Generates a personalized email based on the user's idea and report.
     Returns dict with subject and html_content.
     """
-    
     # Extract key information
     lead_name = session_data.get("lead_name", "there")
     idea = session_data.get("idea", "")
@@ -60,8 +76,7 @@ def generate_personalized_email(session_data: dict) -> dict:
         features.append("conversational AI")
     
     # Create the task for email generation
-    task = Task(
-        description=f"""
+    description = f"""
         Create a highly personalized email for {lead_name} about their AI agent idea.
         
         USER'S ORIGINAL IDEA:
@@ -109,21 +124,10 @@ def generate_personalized_email(session_data: dict) -> dict:
         
         The HTML should be complete and ready to send, with inline CSS styling.
         Use the CiphersLab blue theme (#3b82f6) for buttons and accents.
-        """,
-        agent=email_writer_agent,
-        expected_output="JSON object with subject and html_content keys"
-    )
-    
-    # Create and run the crew
-    crew = Crew(
-        agents=[email_writer_agent],
-        tasks=[task],
-        process=Process.sequential,
-        verbose=False
-    )
+        """
     
     try:
-        result = crew.kickoff()
+        result = run_prompt("email", get_email_writer_agent(), description, "JSON object with subject and html_content keys")
         
         # Parse the result
         import json
@@ -0,0 +1,423 @@
+# email_outbox.py
+# Durable outbox for transactional emails (report email, sales alert).
+#
+# The report job only writes the message to the email_outbox collection and
+# returns; sender threads drain it in the background:
+# - At most EMAIL_SENDER_CONCURRENCY sends run at once, spaced to stay under
+#   EMAIL_SEND_RATE per second. A 429 pauses every sender in this process for
+#   EMAIL_RATE_LIMIT_PAUSE_SECONDS.
+# - Failures are retried with exponential backoff and jitter
+#   (EMAIL_RETRY_BASE_SECONDS doubling up to EMAIL_RETRY_MAX_SECONDS).
+#   EMAIL_MAX_ATTEMPTS failures, or an error retrying cannot fix (a 4xx such
+#   as a validation error), mark the message failed.
+# - A message's _id is its idempotency key (e.g. "report:<session_id>"). It is
+#   queued once, and Resend receives the same key as Idempotency-Key on every
+#   attempt, so a crash between sending and recording the result cannot send twice.
+# - A claimed message is leased for EMAIL_OUTBOX_LEASE_SECONDS. Messages from a
+#   sender that died mid-send are picked up again when the lease runs out.
+# - Idle senders do not poll Mongo: enqueue() wakes them, and they sleep until
+#   the next retry this process scheduled. EMAIL_OUTBOX_POLL_SECONDS is only the
+#   fallback for work from elsewhere (expired leases, another worker's messages).
+#
+# Attachments are stored as references (e.g. {"report_pdf": true}) and loaded at
+# send time, so the outbox never holds PDFs. They are loaded before the attempt
+# counts: a PDF the renderer cannot produce right now (DependencyUnavailable,
+# e.g. PdfRenderTimeout) defers the message without using an attempt, and a
+# rendered PDF is cached on disk, so a retried send does not render it again.
+#
+# EMAIL_TRANSPORT=smtp sends through EMAIL_SMTP_HOST:EMAIL_SMTP_PORT instead of
+# Resend, e.g. to a local Mailpit.
+
+import base64
+import heapq
+import os
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import parseaddr
+
+import resend
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import resilience
+import tracing
+from metrics import email_outbox_deliveries, email_send_duration
+from resilience import DependencyUnavailable
+
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "resend")
+EMAIL_SENDER_CONCURRENCY = int(os.getenv("EMAIL_SENDER_CONCURRENCY", "2"))
+# Resend's default API rate limit is 2 requests per second
+EMAIL_SEND_RATE = float(os.getenv("EMAIL_SEND_RATE", "2"))
+EMAIL_RATE_LIMIT_PAUSE_SECONDS = float(os.getenv("EMAIL_RATE_LIMIT_PAUSE_SECONDS", "1"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "30"))
+EMAIL_OUTBOX_LEASE_SECONDS = float(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", "120"))
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "30"))
+EMAIL_SMTP_HOST = os.getenv("EMAIL_SMTP_HOST", "localhost")
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "1025"))
+EMAIL_SMTP_USERNAME = os.getenv("EMAIL_SMTP_USERNAME")
+EMAIL_SMTP_PASSWORD = os.getenv("EMAIL_SMTP_PASSWORD")
+EMAIL_SMTP_STARTTLS = os.getenv("EMAIL_SMTP_STARTTLS", "false").lower() == "true"
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+STATUSES = (PENDING, SENDING, SENT, FAILED)
+
+
+def _is_permanent(exc: BaseException) -> bool:
+    """Client errors that a retry cannot fix; timeouts, conflicts and 429s are retried."""
+    status = getattr(exc, "code", None)
+    if isinstance(status, str) and status.isdigit():
+        status = int(status)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429)
+
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    return str(getattr(exc, "code", "")) == "429"
+
+# ==============================
+# 🔹 TRANSPORTS
+# ==============================
+class ResendTransport:
+    """Resend API through the resend breaker/bulkhead, with the message's idempotency key."""
+
+    name = "resend"
+
+    @property
+    def configured(self) -> bool:
+        return bool(resend.api_key)
+
+    def send(self, kind: str, params: dict, idempotency_key: str) -> str:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span("resend.send", email=kind):
+                email = resilience.resend_api.call(resend.Emails.send, params, {"idempotency_key": idempotency_key})
+                return email["id"]
+        except DependencyUnavailable:
+            status = "rejected"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            email_send_duration.labels(kind, status).observe(time.perf_counter() - started)
+
+
+class SmtpTransport:
+    """Plain SMTP, for local stand-ins (Mailpit, MailHog) or a relay."""
+
+    name = "smtp"
+    configured = True
+
+    def __init__(self, host: str, port: int, username=None, password=None, starttls: bool = False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def send(self, kind: str, params: dict, idempotency_key: str) -> str:
+        message = EmailMessage()
+        message["From"] = params["from"]
+        message["To"] = ", ".join(params["to"])
+        message["Subject"] = params["subject"]
+        # SMTP has no idempotency; a stable Message-ID at least lets receivers spot duplicates
+        domain = parseaddr(params["from"])[1].rpartition("@")[2] or "localhost"
+        message["Message-ID"] = f"<{idempotency_key.replace(':', '.')}@{domain}>"
+        message.set_content("This email has an HTML body.")
+        message.add_alternative(params["html"], subtype="html")
+        for attachment in params.get("attachments", ()):
+            maintype, _, subtype = attachment.get("content_type", "application/octet-stream").partition("/")
+            message.add_attachment(base64.b64decode(attachment["content"]), maintype=maintype,
+                                   subtype=subtype, filename=attachment["filename"])
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span("smtp.send", email=kind), smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+                smtp.send_message(message)
+            return message["Message-ID"]
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            email_send_duration.labels(kind, status).observe(time.perf_counter() - started)
+
+
+def transport_from_env():
+    if EMAIL_TRANSPORT == "smtp":
+        return SmtpTransport(EMAIL_SMTP_HOST, EMAIL_SMTP_PORT, EMAIL_SMTP_USERNAME,
+                             EMAIL_SMTP_PASSWORD, EMAIL_SMTP_STARTTLS)
+    return ResendTransport()
+
+# ==============================
+# 🔹 OUTBOX
+# ==============================
+class _Retry(Exception):
+    """Put the message back without counting an attempt (rate limit, dependency down)."""
+
+    def __init__(self, delay: float, reason: str):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class EmailOutbox:
+    """Email intents in Mongo, drained by a few sender threads."""
+
+    def __init__(self, transport, concurrency: int, rate_per_second: float, max_attempts: int,
+                 retry_base: float, retry_max: float, poll_interval: float, lease_seconds: float):
+        self.transport = transport
+        self.concurrency = max(1, concurrency)
+        self.send_interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._collection = None
+        self._load_attachment = None
+        self._on_result = None
+        self._indexed = False
+        self._lock = threading.Lock()
+        self._work = threading.Condition()
+        self._signals = 0  # wake-ups not yet taken by a sender (one per queued or rescheduled message)
+        self._threads = []
+        self._stopped = False
+        self._next_send = 0.0  # monotonic time of the next free send slot
+        self._due = []  # heap of monotonic times when messages this process rescheduled come due
+        self._paused_until = 0.0
+
+    def bind(self, collection, load_attachment, on_result=None):
+        """
+        Sets the collection and the hooks: load_attachment(message, spec) returns a
+        Resend attachment dict for a stored reference; on_result(message, email_id, error)
+        runs once a message is sent (error None) or has failed for good.
+        """
+        self._collection = collection
+        self._load_attachment = load_attachment
+        self._on_result = on_result
+
+    def _ensure_indexes(self):
+        if self._indexed:
+            return
+        self._collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        self._collection.create_index("lease_until", sparse=True)
+        self._collection.create_index("sent_at", expireAfterSeconds=EMAIL_OUTBOX_RETENTION_DAYS * 86400)
+        self._indexed = True
+
+    def queued(self, idempotency_key: str) -> bool:
+        return resilience.mongo.call(self._collection.count_documents, {"_id": idempotency_key}, limit=1) > 0
+
+    def enqueue(self, kind: str, params: dict, idempotency_key: str, session_id: str = None,
+                attachments=()) -> bool:
+        """Stores an email intent; returns False if one with this key was already queued."""
+        self._ensure_indexes()
+        now = datetime.utcnow()
+        try:
+            resilience.mongo.call(self._collection.insert_one, {
+                "_id": idempotency_key,
+                "kind": kind,
+                "session_id": session_id,
+                "params": params,
+                "attachments": list(attachments),
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            })
+        except DuplicateKeyError:
+            return False
+        self.start()
+        self._signal()
+        return True
+
+    # ------------------------------
+    # Sender threads
+    # ------------------------------
+    def start(self):
+        with self._lock:
+            if self._threads or self._stopped or self._collection is None:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._run, name=f"email-sender-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Senders finish their current email and exit; unsent messages stay in the outbox."""
+        self._stopped = True
+        with self._work:
+            self._work.notify_all()
+
+    def _signal(self):
+        """Wakes one idle sender."""
+        with self._work:
+            self._signals += 1
+            self._work.notify()
+
+    def _run(self):
+        while not self._stopped:
+            batch = 10
+            try:
+                # A short batch ended on an empty claim: nothing is due right now
+                drained = self.deliver_due(batch) < batch
+            except Exception as e:
+                print(f"[EMAIL OUTBOX] Sender error: {e}")
+                drained = True
+            if drained:
+                with self._work:
+                    if not self._signals and not self._stopped:
+                        self._work.wait(self._idle_timeout())
+                    self._signals = max(0, self._signals - 1)
+
+    def _idle_timeout(self) -> float:
+        """Seconds until the next rescheduled message is due, at most the poll interval."""
+        with self._lock:
+            now = time.monotonic()
+            while self._due and self._due[0] <= now:
+                heapq.heappop(self._due)
+            if self._due:
+                return min(self.poll_interval, self._due[0] - now)
+        return self.poll_interval
+
+    def _reschedule(self, key: str, delay: float, fields: dict):
+        fields = {**fields, "status": PENDING, "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}
+        self._update(key, fields)
+        with self._lock:
+            heapq.heappush(self._due, time.monotonic() + delay)
+        # An idle sender may be sleeping past the new due time
+        self._signal()
+
+    def deliver_due(self, limit: int = 10) -> int:
+        """Claims and delivers up to `limit` due messages; returns how many were claimed."""
+        claimed = 0
+        while claimed < limit and not self._stopped:
+            message = self._claim()
+            if message is None:
+                break
+            claimed += 1
+            self._deliver(message)
+        return claimed
+
+    def _claim(self):
+        now = datetime.utcnow()
+        return resilience.mongo.call(
+            self._collection.find_one_and_update,
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": SENDING, "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": SENDING, "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _wait_for_send_slot(self):
+        """Spaces sends to the configured rate and honours a rate-limit pause."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_send, self._paused_until)
+            self._next_send = slot + self.send_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _deliver(self, message: dict):
+        kind, key = message["kind"], message["_id"]
+        attempt = message.get("attempts", 0) + 1
+        with tracing.span("email.deliver", session_id=message.get("session_id"), email=kind, attempt=attempt):
+            try:
+                params = dict(message["params"])
+                if message.get("attachments"):
+                    params["attachments"] = self._attachments(message)
+                self._wait_for_send_slot()
+                try:
+                    email_id = self.transport.send(kind, params, key)
+                except DependencyUnavailable as e:
+                    raise _Retry(max(e.retry_after, 1), str(e))
+                except Exception as e:
+                    if not _is_rate_limited(e):
+                        raise
+                    with self._lock:
+                        self._paused_until = time.monotonic() + EMAIL_RATE_LIMIT_PAUSE_SECONDS
+                    raise _Retry(EMAIL_RATE_LIMIT_PAUSE_SECONDS, "rate limited")
+            except _Retry as e:
+                email_outbox_deliveries.labels(kind, "deferred").inc()
+                self._reschedule(key, e.delay, {"last_error": str(e)})
+                return
+            except Exception as e:
+                self._failed(message, attempt, e)
+                return
+
+        email_outbox_deliveries.labels(kind, "sent").inc()
+        self._update(key, {"status": SENT, "sent_at": datetime.utcnow(), "email_id": email_id, "attempts": attempt},
+                     unset=("lease_until", "last_error"))
+        print(f"[EMAIL OUTBOX] Sent {key} - ID: {email_id}")
+        self._notify(message, email_id, None)
+
+    def _attachments(self, message: dict) -> list:
+        """
+        Loads the message's attachments before the send. A PDF that cannot be rendered
+        right now (renderer busy or timed out) defers the message without using an attempt.
+        """
+        try:
+            return [self._load_attachment(message, spec) for spec in message["attachments"]]
+        except DependencyUnavailable as e:
+            raise _Retry(max(e.retry_after, 1), f"attachment unavailable: {e}")
+
+    def _failed(self, message: dict, attempt: int, error: Exception):
+        kind, key = message["kind"], message["_id"]
+        if attempt >= self.max_attempts or _is_permanent(error):
+            email_outbox_deliveries.labels(kind, "failed").inc()
+            self._update(key, {"status": FAILED, "attempts": attempt, "last_error": str(error)})
+            print(f"[EMAIL OUTBOX] Giving up on {key} after {attempt} attempt(s): {error}")
+            self._notify(message, None, error)
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+        email_outbox_deliveries.labels(kind, "retried").inc()
+        self._reschedule(key, delay, {"attempts": attempt, "last_error": str(error)})
+        print(f"[EMAIL OUTBOX] {key} failed (attempt {attempt}), retrying in {delay:.0f}s: {error}")
+
+    def _update(self, key: str, fields: dict, unset=("lease_until",)):
+        resilience.mongo.call(self._collection.update_one, {"_id": key},
+                              {"$set": fields, "$unset": {field: "" for field in unset}})
+
+    def _notify(self, message: dict, email_id, error):
+        if self._on_result is None:
+            return
+        try:
+            self._on_result(message, email_id, error)
+        except Exception as e:
+            print(f"[EMAIL OUTBOX] Result hook failed for {message['_id']}: {e}")
+
+    def counts(self) -> dict:
+        """Messages per status, for /metrics."""
+        if self._collection is None:
+            return {}
+        pipeline = [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        rows = resilience.mongo.call(lambda: list(self._collection.aggregate(pipeline)))
+        found = {row["_id"]: row["count"] for row in rows}
+        return {status: found.get(status, 0) for status in STATUSES}
+
+
+outbox = EmailOutbox(
+    transport_from_env(),
+    EMAIL_SENDER_CONCURRENCY,
+    EMAIL_SEND_RATE,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_RETRY_BASE_SECONDS,
+    EMAIL_RETRY_MAX_SECONDS,
+    EMAIL_OUTBOX_POLL_SECONDS,
+    EMAIL_OUTBOX_LEASE_SECONDS,
+)
@@ -0,0 +1,325 @@
+# fake_llm.py
+# Offline LLM backends for benchmarks and regression runs: record, replay, synthetic.
+#
+# Selected with LLM_BACKEND in llm_client.build_llm, so every shared `llm`
+# object (agents, fallback model, email writer) switches at once and still
+# goes through ResilientLLM (retries, hedging, metering, tracing):
+#   groq      - the real provider (default)
+#   record    - the real provider, appending every prompt/response pair to LLM_FIXTURE_PATH
+#   replay    - answers from LLM_FIXTURE_PATH with the recorded latency (scaled)
+#   synthetic - canned answers shaped like each agent's output, with a latency distribution
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from crewai.llms.base_llm import BaseLLM
+
+LLM_FIXTURE_PATH = os.getenv("LLM_FIXTURE_PATH", "benchmarks/fixtures/llm_fixture.jsonl")
+# What replay does for a prompt that was never recorded: agent | synthetic | error
+LLM_REPLAY_ON_MISS = os.getenv("LLM_REPLAY_ON_MISS", "agent")
+# Multiplies recorded latencies; 0 replays instantly
+LLM_REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "1.0"))
+LLM_SYNTHETIC_P50_SECONDS = float(os.getenv("LLM_SYNTHETIC_P50_SECONDS", "0.8"))
+LLM_SYNTHETIC_SIGMA = float(os.getenv("LLM_SYNTHETIC_SIGMA", "0.35"))
+LLM_SYNTHETIC_TAIL_RATE = float(os.getenv("LLM_SYNTHETIC_TAIL_RATE", "0.05"))
+LLM_SYNTHETIC_TAIL_MULTIPLIER = float(os.getenv("LLM_SYNTHETIC_TAIL_MULTIPLIER", "8"))
+LLM_SYNTHETIC_ERROR_RATE = float(os.getenv("LLM_SYNTHETIC_ERROR_RATE", "0"))
+LLM_SYNTHETIC_REPLY_CHARS = int(os.getenv("LLM_SYNTHETIC_REPLY_CHARS", "2400"))
+# User turns before the synthetic requirement agent declares REQUIREMENTS_COMPLETE
+LLM_SYNTHETIC_CONVERSATION_TURNS = int(os.getenv("LLM_SYNTHETIC_CONVERSATION_TURNS", "2"))
+LLM_SYNTHETIC_SEED = os.getenv("LLM_SYNTHETIC_SEED")
+
+# ==============================
+# 🔹 HELPERS
+# ==============================
+def _normalize(messages) -> list:
+    if isinstance(messages, str):
+        return [{"role": "user", "content": messages}]
+    return [{"role": m.get("role", "user"), "content": str(m.get("content", ""))} for m in messages]
+
+
+def prompt_key(model: str, messages) -> str:
+    """Stable fixture key for a prompt: model plus every message's role and content."""
+    payload = json.dumps([model, _normalize(messages)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _report_usage(callbacks, prompt_tokens: int, completion_tokens: int):
+    """Hands usage to the callbacks the way CrewAI does, so metering sees real numbers."""
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    for callback in callbacks or []:
+        if hasattr(callback, "log_success_event"):
+            callback.log_success_event({}, {"usage": usage}, None, None)
+
+
+class SyntheticLLMError(RuntimeError):
+    """Injected provider failure; status 503 makes it retryable like the real thing."""
+
+    status_code = 503
+
+
+class _FakeLLM(BaseLLM):
+    """Common surface ResilientLLM and CrewAI expect from an inner LLM."""
+
+    def __init__(self, model: str, temperature: float = None):
+        super().__init__(model=model, temperature=temperature)
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+# ==============================
+# 🔹 SYNTHETIC
+# ==============================
+class LatencyProfile:
+    """Log-normal latency with a slow tail and optional injected failures."""
+
+    def __init__(self, p50: float = LLM_SYNTHETIC_P50_SECONDS, sigma: float = LLM_SYNTHETIC_SIGMA,
+                 tail_rate: float = LLM_SYNTHETIC_TAIL_RATE, tail_multiplier: float = LLM_SYNTHETIC_TAIL_MULTIPLIER,
+                 error_rate: float = LLM_SYNTHETIC_ERROR_RATE, seed=LLM_SYNTHETIC_SEED):
+        self.p50 = p50
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail_multiplier = tail_multiplier
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Returns (delay_seconds, failed) for one call."""
+        if self.p50 <= 0:
+            return 0.0, False
+        with self._lock:
+            delay = self.random.lognormvariate(math.log(self.p50), self.sigma)
+            if self.random.random() < self.tail_rate:
+                delay *= self.tail_multiplier
+            return delay, self.random.random() < self.error_rate
+
+
+def _filler(topic: str, chars: int) -> str:
+    """Markdown with headings, bullets and a table, roughly `chars` long."""
+    lines = [f"## {topic}", ""]
+    n = 1
+    while sum(len(line) + 1 for line in lines) < chars:
+        lines += [
+            f"### {topic} item {n}",
+            f"- **Point {n}:** a concrete recommendation with enough words to wrap across lines in the report.",
+            f"- Supporting detail {n} covering trade-offs, dependencies and the expected impact.",
+            "",
+            "| Aspect | Choice | Why |",
+            "|---|---|---|",
+            f"| Option {n} | Managed service | Lower operational load |",
+            "",
+        ]
+        n += 1
+    return "\n".join(lines)
+
+
+def synthetic_reply(prompt: str, agent: str = None, chars: int = LLM_SYNTHETIC_REPLY_CHARS) -> str:
+    """An answer the calling code can parse, shaped by the agent role and prompt."""
+    if agent == "Change Impact Analyzer":
+        return '["requirement_gathering", "technical_architecture"]'
+    if agent == "Professional Email Copywriter":
+        return json.dumps({
+            "subject": "Your AI Agent Report is Ready 🚀",
+            "html_content": "<p>Hi there,</p><p>Your personalized report is attached.</p>",
+        })
+    if agent == "Change Summarizer":
+        return "- Updated the requirements and architecture to reflect the new information."
+    if "Conversation so far" in prompt:
+        user_turns = prompt.count("USER:")
+        if user_turns >= LLM_SYNTHETIC_CONVERSATION_TURNS:
+            return "REQUIREMENTS_COMPLETE\n" + _filler("Requirements summary", chars // 3)
+        return "Great idea! Who are the main users, and which systems should the agent integrate with?"
+    return _filler(agent or "Analysis", chars)
+
+
+class SyntheticLLM(_FakeLLM):
+    """Answers every call with a synthetic reply after a sampled delay."""
+
+    def __init__(self, model: str, temperature: float = None, profile: LatencyProfile = None,
+                 reply_chars: int = LLM_SYNTHETIC_REPLY_CHARS):
+        super().__init__(model=model, temperature=temperature)
+        self.profile = profile or LatencyProfile()
+        self.reply_chars = reply_chars
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None):
+        delay, failed = self.profile.sample()
+        time.sleep(delay)
+        if failed:
+            raise SyntheticLLMError("Injected synthetic LLM failure")
+        prompt = "\n".join(m["content"] for m in _normalize(messages))
+        content = synthetic_reply(prompt, getattr(from_agent, "role", None), self.reply_chars)
+        _report_usage(callbacks, len(prompt) // 4, len(content) // 4)
+        return f"Thought: I now know the final answer\nFinal Answer: {content}"
+
+# ==============================
+# 🔹 RECORD
+# ==============================
+class _RecordedUsage:
+    """
+    Shared usage callback for RecordingLLM (one instance, for the same reason
+    as metering.usage_callback); usage goes to the recording call's context.
+    """
+
+    _current = ContextVar("recorded_usage", default=None)
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        usage = self._current.get()
+        if usage is not None:
+            reported = (response_obj or {}).get("usage") or {}
+            get = reported.get if isinstance(reported, dict) else lambda k: getattr(reported, k, None)
+            usage["prompt_tokens"] += int(get("prompt_tokens") or 0)
+            usage["completion_tokens"] += int(get("completion_tokens") or 0)
+
+
+_recorded_usage = _RecordedUsage()
+
+
+class RecordingLLM(_FakeLLM):
+    """Forwards calls to the real LLM and appends each prompt/response pair to a JSONL fixture."""
+
+    def __init__(self, inner, path: str = LLM_FIXTURE_PATH):
+        self.inner = inner
+        super().__init__(model=inner.model, temperature=getattr(inner, "temperature", None))
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def stop(self):
+        return getattr(self.inner, "stop", [])
+
+    @stop.setter
+    def stop(self, value):
+        self.inner.stop = value
+
+    def supports_function_calling(self) -> bool:
+        return getattr(self.inner, "supports_function_calling", lambda: False)()
+
+    def supports_stop_words(self) -> bool:
+        return self.inner.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.inner.get_context_window_size()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None):
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        reset = _RecordedUsage._current.set(usage)
+        started = time.monotonic()
+        try:
+            response = self.inner.call(
+                messages,
+                tools=tools,
+                callbacks=list(callbacks or []) + [_recorded_usage],
+                available_functions=available_functions,
+                from_task=from_task,
+                from_agent=from_agent,
+            )
+        finally:
+            _RecordedUsage._current.reset(reset)
+        self._append({
+            "key": prompt_key(self.model, messages),
+            "model": self.model,
+            "agent": getattr(from_agent, "role", None),
+            "messages": _normalize(messages),
+            "response": response if isinstance(response, str) else str(response),
+            "latency_seconds": round(time.monotonic() - started, 3),
+            **usage,
+        })
+        return response
+
+    def _append(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+# ==============================
+# 🔹 REPLAY
+# ==============================
+class ReplayLLM(_FakeLLM):
+    """
+    Answers from a recorded fixture. Prompts are matched exactly (model and
+    messages); a miss is served per `on_miss`: `agent` cycles through the
+    recordings of the same agent role (then falls back to synthetic),
+    `synthetic` makes one up, `error` raises KeyError.
+    """
+
+    def __init__(self, model: str, temperature: float = None, path: str = LLM_FIXTURE_PATH,
+                 on_miss: str = LLM_REPLAY_ON_MISS, latency_scale: float = LLM_REPLAY_LATENCY_SCALE):
+        super().__init__(model=model, temperature=temperature)
+        self.path = path
+        self.on_miss = on_miss
+        self.latency_scale = latency_scale
+        self.by_key = {}
+        self.by_agent = {}
+        self.hits = 0
+        self.misses = 0
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self._synthetic = SyntheticLLM(model, temperature, profile=LatencyProfile(p50=0))
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            print(f"[FAKE LLM] No fixture at {self.path}, every call is a miss")
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                # Same prompt recorded twice: answer with the responses in recorded order
+                self.by_key.setdefault(entry["key"], []).append(entry)
+                self.by_agent.setdefault(entry.get("agent"), []).append(entry)
+        print(f"[FAKE LLM] Loaded {sum(map(len, self.by_key.values()))} recorded calls from {self.path}")
+
+    def _next(self, bucket: str, entries: list) -> dict:
+        with self._lock:
+            index = self._cursor.get(bucket, 0)
+            self._cursor[bucket] = index + 1
+        return entries[index % len(entries)]
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None):
+        key = prompt_key(self.model, messages)
+        agent = getattr(from_agent, "role", None)
+        entry = None
+        if key in self.by_key:
+            entry = self._next(key, self.by_key[key])
+        elif self.on_miss == "error":
+            raise KeyError(f"No recorded LLM response for prompt {key[:12]} ({agent})")
+        elif self.on_miss == "agent" and agent in self.by_agent:
+            entry = self._next(f"agent:{agent}", self.by_agent[agent])
+
+        with self._lock:
+            if key in self.by_key:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            return self._synthetic.call(messages, callbacks=callbacks, from_agent=from_agent)
+
+        time.sleep(entry.get("latency_seconds", 0) * self.latency_scale)
+        _report_usage(callbacks, entry.get("prompt_tokens", 0), entry.get("completion_tokens", 0))
+        return entry["response"]
@@ -0,0 +1,398 @@
+# llm_client.py
+# Resilient LLM invocation layer shared by every agent.
+#
+# Every agent talks to Groq through a ResilientLLM, which adds per-call
+# deadlines, exponential backoff with jitter, a process-wide retry budget
+# and optional hedged requests on top of the plain CrewAI LLM. Calls also
+# go through the Groq circuit breaker and bulkhead from resilience.py. A cancelled
+# generation (see cancellation.py) makes no further calls and abandons the
+# one it is waiting on. Tokens and latency of every call go to metering.py.
+# LLM_BACKEND=record|replay|synthetic swaps Groq for an offline backend.
+
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from crewai import LLM
+from crewai.llms.base_llm import BaseLLM
+from dotenv import load_dotenv
+
+import resilience
+import tracing
+from resilience import DependencyUnavailable
+from agents.cancellation import GenerationCancelled, current_token
+from agents import metering
+from agents.fake_llm import RecordingLLM, ReplayLLM, SyntheticLLM
+
+load_dotenv()
+
+# ==============================
+# 🔹 CONFIGURATION
+# ==============================
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "groq/moonshotai/kimi-k2-instruct")
+# groq | record | replay | synthetic (offline backends for benchmarks, see fake_llm.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").lower()
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "45"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", "0.5"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+LLM_CALL_WORKERS = int(os.getenv("LLM_CALL_WORKERS", "32"))
+# How often a caller blocked on an LLM reply checks whether it was cancelled
+LLM_CANCEL_POLL_SECONDS = float(os.getenv("LLM_CANCEL_POLL_SECONDS", "0.5"))
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and 5xx
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "RateLimitError",
+    "ServiceUnavailableError",
+    "InternalServerError",
+    "BadGatewayError",
+}
+
+# ==============================
+# 🔹 ERRORS
+# ==============================
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call does not answer within its deadline."""
+
+
+class RetryBudgetExhausted(RuntimeError):
+    """Raised when a call fails and the global retry budget is spent."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Returns True for transient failures (timeouts, 429s, 5xx, dropped connections)."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if getattr(exc, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    return type(exc).__name__ in RETRYABLE_ERROR_NAMES
+
+# ==============================
+# 🔹 RETRY BUDGET
+# ==============================
+class RetryBudget:
+    """
+    Process-wide cap on retries (and hedges).
+
+    Retries are allowed while they stay below `ratio` of the requests seen in
+    the last `window` seconds, plus a small floor so a quiet worker can still
+    retry. This keeps a Groq brown-out from being amplified by our own retries.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_withdraw(self) -> bool:
+        """Reserves one retry if the budget allows it."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = self.min_per_second * self.window + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+# ==============================
+# 🔹 LATENCY TRACKING
+# ==============================
+class LatencyTracker:
+    """Rolling window of successful call latencies, used to derive the hedge delay."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+
+retry_budget = RetryBudget(LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN_PER_SECOND)
+
+# Calls run on this pool so the caller can stop waiting at the deadline.
+# A timed-out attempt keeps its thread until the inner client's own timeout fires.
+_call_pool = ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm-call")
+
+# ==============================
+# 🔹 RESILIENT LLM
+# ==============================
+class ResilientLLM(BaseLLM):
+    """
+    CrewAI-compatible LLM that wraps another LLM with deadlines, retries and hedging.
+
+    Agents use it exactly like a regular `crewai.LLM`; every `call()` is
+    forwarded to `inner.call()` with the same arguments.
+    """
+
+    def __init__(
+        self,
+        inner,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        attempt_timeout: float = LLM_ATTEMPT_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS,
+        budget: RetryBudget = retry_budget,
+        dependency: resilience.Dependency = resilience.groq,
+    ):
+        self.inner = inner
+        super().__init__(model=inner.model, temperature=getattr(inner, "temperature", None))
+        self.timeout = timeout
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.budget = budget
+        self.dependency = dependency
+        self.latency = LatencyTracker()
+
+    # Agents set stop words on the LLM they are given; keep them on the inner client.
+    @property
+    def stop(self):
+        return getattr(self.inner, "stop", [])
+
+    @stop.setter
+    def stop(self, value):
+        self.inner.stop = value
+
+    def supports_function_calling(self) -> bool:
+        return getattr(self.inner, "supports_function_calling", lambda: False)()
+
+    def supports_stop_words(self) -> bool:
+        return self.inner.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.inner.get_context_window_size()
+
+    def get_token_usage_summary(self):
+        if hasattr(self.inner, "get_token_usage_summary"):
+            return self.inner.get_token_usage_summary()
+        return super().get_token_usage_summary()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None):
+        kwargs = {
+            "tools": tools,
+            "callbacks": list(callbacks or []) + [metering.usage_callback],
+            "available_functions": available_functions,
+            "from_task": from_task,
+            "from_agent": from_agent,
+        }
+        # Cooperative cancellation: a cancelled generation makes no further LLM calls
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+
+        stats = {"attempts": 0, "hedged": False}
+        started = time.monotonic()
+        result, status = "", "ok"
+        agent = getattr(from_agent, "role", None)
+        # Usage of every attempt (hedges included) is reported to this meter
+        with metering.meter() as meter, tracing.span("llm.call", agent=agent, model=self.model) as span:
+            try:
+                result = self._call_with_retries(messages, kwargs, token, stats)
+                return result
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                prompt_tokens, completion_tokens = metering.record_llm_call(
+                    meter,
+                    model=self.model,
+                    agent=agent,
+                    latency=time.monotonic() - started,
+                    attempts=stats["attempts"],
+                    hedged=stats["hedged"],
+                    status=status,
+                    prompt_chars=_prompt_chars(messages),
+                    completion_chars=len(str(result)),
+                )
+                span.set_attribute("llm.attempts", stats["attempts"])
+                span.set_attribute("llm.hedged", stats["hedged"])
+                span.set_attribute("llm.prompt_tokens", prompt_tokens)
+                span.set_attribute("llm.completion_tokens", completion_tokens)
+
+    def _call_with_retries(self, messages, kwargs, token, stats):
+        deadline = time.monotonic() + self.timeout
+        self.budget.record_request()
+
+        # The bulkhead slot is held across retries so one logical call counts once
+        with self.dependency.bulkhead.slot():
+            attempt = 0
+            while True:
+                try:
+                    self.dependency.breaker.allow()
+                    stats["attempts"] += 1
+                    attempt_deadline = min(deadline, time.monotonic() + self.attempt_timeout)
+                    result = self._attempt(messages, kwargs, attempt_deadline, token, stats)
+                except DependencyUnavailable:
+                    raise
+                except GenerationCancelled:
+                    # Says nothing about Groq, but a half-open trial slot must still be released
+                    self.dependency.breaker.record_success()
+                    raise
+                except Exception as e:
+                    # As in Dependency.guard: non-outage errors (e.g. a 400) count as a success
+                    if self.dependency.is_failure(e):
+                        self.dependency.breaker.record_failure()
+                    else:
+                        self.dependency.breaker.record_success()
+                    remaining = deadline - time.monotonic()
+                    if not is_retryable(e) or attempt >= self.max_retries or remaining <= 0:
+                        raise
+                    if not self.budget.try_withdraw():
+                        raise RetryBudgetExhausted(f"LLM retry budget exhausted: {e}") from e
+
+                    # Full jitter: sleep somewhere in [0, min(cap, base * 2^attempt)]
+                    backoff = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+                    delay = min(random.uniform(0, backoff), remaining)
+                    attempt += 1
+                    print(f"[LLM RETRY] attempt {attempt}/{self.max_retries} in {delay:.2f}s after: {e}")
+                    if token is not None:
+                        token.wait(delay)
+                        token.raise_if_cancelled()
+                    else:
+                        time.sleep(delay)
+                    continue
+
+                self.dependency.breaker.record_success()
+                return result
+
+    def _attempt(self, messages, kwargs, deadline, token=None, stats=None):
+        """
+        Runs one logical attempt, optionally hedged, bounded by the deadline.
+
+        If `token` is cancelled while waiting, the in-flight request is abandoned.
+        """
+        started = time.monotonic()
+        primary = _call_pool.submit(contextvars.copy_context().run, self.inner.call, messages, **kwargs)
+        pending = {primary}
+
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None and hedge_delay < deadline - started:
+            hedge_at = started + hedge_delay
+            done = set()
+            # Polls the token like the wait below, so a cancelled generation never sends the hedge
+            while not done and not (token is not None and token.cancelled):
+                remaining = hedge_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                if token is not None:
+                    remaining = min(remaining, LLM_CANCEL_POLL_SECONDS)
+                done, _ = wait(pending, timeout=remaining)
+            if token is not None and token.cancelled and not done:
+                primary.cancel()
+                token.raise_if_cancelled()
+            if not done and self.budget.try_withdraw():
+                print(f"[LLM HEDGE] no reply after {hedge_delay:.2f}s, sending duplicate request")
+                if stats is not None:
+                    stats["hedged"] = True
+                pending.add(_call_pool.submit(contextvars.copy_context().run, self.inner.call, messages, **kwargs))
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if token is not None:
+                remaining = min(remaining, LLM_CANCEL_POLL_SECONDS)
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.latency.observe(time.monotonic() - started)
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            if token is not None and token.cancelled and pending:
+                for other in pending:
+                    other.cancel()
+                token.raise_if_cancelled()
+
+        if error is not None and not pending:
+            raise error
+        raise LLMTimeoutError(f"LLM call got no reply within {deadline - started:.1f}s")
+
+    def _hedge_delay(self):
+        if not self.hedge:
+            return None
+        observed = self.latency.quantile(LLM_HEDGE_QUANTILE)
+        if observed is None:
+            return None
+        return max(observed, self.hedge_min_delay)
+
+def _prompt_chars(messages) -> int:
+    if isinstance(messages, str):
+        return len(messages)
+    return sum(len(str(m.get("content", ""))) for m in messages)
+
+# ==============================
+# 🔹 FACTORY
+# ==============================
+def build_llm(temperature: float = 0, max_tokens=None, model: str = None):
+    """
+    Builds the shared, resilient Groq LLM used by agents.
+
+    LLM_BACKEND swaps the provider for an offline one (see fake_llm.py):
+    record, replay or synthetic. Everything around it stays the same.
+    """
+    model = model or GROQ_MODEL
+    if LLM_BACKEND == "replay":
+        return ResilientLLM(ReplayLLM(model, temperature))
+    if LLM_BACKEND == "synthetic":
+        return ResilientLLM(SyntheticLLM(model, temperature))
+
+    inner = LLM(
+        model=model,
+        api_key=GROQ_API_KEY,
+        temperature=temperature,
+        max_tokens=int(max_tokens) if max_tokens else None,
+        timeout=LLM_ATTEMPT_TIMEOUT_SECONDS,
+    )
+    if LLM_BACKEND == "record":
+        inner = RecordingLLM(inner)
+    return ResilientLLM(inner)
@@ -0,0 +1,295 @@
+# metering.py
+# Token and latency accounting for every LLM call, attributed to session, stage and agent.
+#
+# ResilientLLM reports each logical call (all retries and hedges included);
+# `scope()` blocks attribute calls to a session/stage and time the stage itself.
+# Records are buffered in memory and written to Mongo in batches by a
+# background thread, so metering never adds a database round trip to a call.
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+import resilience
+from metrics import llm_call_duration, llm_tokens
+import tracing
+
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "5"))
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "200"))
+LLM_USAGE_BUFFER_MAX = int(os.getenv("LLM_USAGE_BUFFER_MAX", "10000"))
+LLM_USAGE_RETENTION_DAYS = int(os.getenv("LLM_USAGE_RETENTION_DAYS", "90"))
+
+# ==============================
+# 🔹 ATTRIBUTION
+# ==============================
+class UsageScope:
+    """Session/stage attribution for a block of work, plus the LLM usage inside it."""
+
+    def __init__(self, session_id: str, stage: str, parent=None):
+        self.session_id = session_id
+        self.stage = stage
+        self.parent = parent
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int):
+        """Adds one call's usage to this scope and every enclosing one."""
+        scope = self
+        while scope is not None:
+            with scope._lock:
+                scope.calls += 1
+                scope.prompt_tokens += prompt_tokens
+                scope.completion_tokens += completion_tokens
+            scope = scope.parent
+
+
+_current = ContextVar("metering_scope", default=None)
+
+
+def current_scope():
+    return _current.get()
+
+
+@contextmanager
+def scope(session_id: str = None, stage: str = None):
+    """
+    Attributes LLM calls in the block to `session_id`/`stage` (inherited from the
+    enclosing scope when omitted) and records the block's duration as a stage run.
+    The block is also a tracing span named `stage.<stage>`.
+    """
+    parent = _current.get()
+    current = UsageScope(
+        session_id or (parent.session_id if parent else None),
+        stage or (parent.stage if parent else None),
+        parent,
+    )
+    reset = _current.set(current)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with tracing.span(f"stage.{current.stage}", session_id=current.session_id):
+            yield current
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _current.reset(reset)
+        recorder.record({
+            "kind": "stage",
+            "session_id": current.session_id,
+            "stage": current.stage,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "calls": current.calls,
+            "prompt_tokens": current.prompt_tokens,
+            "completion_tokens": current.completion_tokens,
+            "status": status,
+        })
+
+
+def record_cache_hit(stage: str, session_id: str = None):
+    """Records work served from a cache or speculative result instead of the LLM."""
+    current = _current.get()
+    recorder.record({
+        "kind": "cache_hit",
+        "session_id": session_id or (current.session_id if current else None),
+        "stage": stage,
+    })
+
+# ==============================
+# 🔹 PER-CALL USAGE
+# ==============================
+def _usage_value(usage, key: str, default=0):
+    if usage is None:
+        return default
+    if isinstance(usage, dict):
+        return usage.get(key, default) or default
+    return getattr(usage, key, default) or default
+
+
+class UsageMeter:
+    """Usage reported by the provider for one logical call (hedged duplicates included, both are billed)."""
+
+    def __init__(self):
+        self.reported = False
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        details = _usage_value(usage, "prompt_tokens_details", None)
+        with self._lock:
+            self.reported = True
+            self.prompt_tokens += int(_usage_value(usage, "prompt_tokens"))
+            self.completion_tokens += int(_usage_value(usage, "completion_tokens"))
+            self.cached_prompt_tokens += int(_usage_value(details, "cached_tokens"))
+
+
+_meter = ContextVar("usage_meter", default=None)
+
+
+@contextmanager
+def meter():
+    """Collects provider usage for the LLM call made inside the block."""
+    current = UsageMeter()
+    reset = _meter.set(current)
+    try:
+        yield current
+    finally:
+        _meter.reset(reset)
+
+
+class _UsageCallback:
+    """
+    Callback handed to the CrewAI LLM; CrewAI calls `log_success_event` with the
+    provider's `usage` block after every completion.
+
+    A single shared instance is used because CrewAI also registers callbacks
+    with LiteLLM globally, which keeps every distinct instance alive forever.
+    The usage goes to the meter of the calling context (the request thread's
+    context is copied into the worker that makes the HTTP call).
+    """
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        current = _meter.get()
+        if current is not None:
+            current.add((response_obj or {}).get("usage"))
+
+
+usage_callback = _UsageCallback()
+
+
+def record_llm_call(meter: UsageMeter, model: str, agent: str, latency: float, attempts: int,
+                    hedged: bool, status: str, prompt_chars: int = 0, completion_chars: int = 0):
+    """
+    Records one logical LLM call and charges it to the current scope.
+
+    When the provider reported no usage (errors, clients without usage data),
+    tokens are estimated at ~4 characters per token and flagged as estimated.
+    """
+    estimated = not meter.reported
+    if estimated:
+        prompt_tokens, completion_tokens = prompt_chars // 4, completion_chars // 4
+    else:
+        prompt_tokens, completion_tokens = meter.prompt_tokens, meter.completion_tokens
+
+    current = _current.get()
+    if current is not None:
+        current.add(prompt_tokens, completion_tokens)
+
+    role = agent or "unknown"
+    outcome = "ok" if status == "ok" else "cancelled" if status == "GenerationCancelled" else "error"
+    llm_call_duration.labels(role, outcome).observe(latency)
+    llm_tokens.labels(role, "prompt").inc(prompt_tokens)
+    llm_tokens.labels(role, "completion").inc(completion_tokens)
+
+    recorder.record({
+        "kind": "call",
+        "session_id": current.session_id if current else None,
+        "stage": current.stage if current else None,
+        "agent": agent,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_prompt_tokens": meter.cached_prompt_tokens,
+        "estimated": estimated,
+        "latency_ms": round(latency * 1000, 1),
+        "attempts": attempts,
+        "hedged": hedged,
+        "status": status,
+    })
+    return prompt_tokens, completion_tokens
+
+# ==============================
+# 🔹 BUFFERED WRITER
+# ==============================
+class UsageRecorder:
+    """Buffers usage records and writes them to Mongo in batches from a background thread."""
+
+    def __init__(self, flush_interval: float, batch_size: int, max_buffer: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._collection = None
+        self._thread = None
+        self._indexed = False
+
+    def bind(self, collection):
+        """Sets the collection records are written to (until then they are only buffered)."""
+        self._collection = collection
+
+    def record(self, doc: dict):
+        doc["timestamp"] = datetime.utcnow()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(doc)
+            size = len(self._buffer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-usage-writer", daemon=True)
+                self._thread.start()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Writes everything buffered so far; records stay buffered if Mongo is down."""
+        if self._collection is None:
+            return
+        with self._lock:
+            docs = list(self._buffer)
+            self._buffer.clear()
+        if not docs:
+            return
+        try:
+            self._ensure_indexes()
+            resilience.mongo.call(self._collection.insert_many, docs, ordered=False)
+        except BulkWriteError as e:
+            # Some records were written; retry only the ones that failed for a reason other than
+            # already being there (insert_many set _id, so a retried record can only be a duplicate)
+            failed = [error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if failed:
+                print(f"[METERING] Could not write {len(failed)} of {len(docs)} usage records: {e}")
+                self._requeue([docs[index] for index in failed])
+        except Exception as e:
+            # Retried as-is: records that did get written come back as duplicates and are skipped above
+            print(f"[METERING] Could not write {len(docs)} usage records: {e}")
+            self._requeue(docs)
+
+    def _requeue(self, docs: list):
+        """Puts unwritten records back ahead of newer ones; if that overflows the buffer, the oldest are dropped."""
+        with self._lock:
+            pending = docs + list(self._buffer)
+            self.dropped += max(0, len(pending) - self._buffer.maxlen)
+            self._buffer.clear()
+            self._buffer.extend(pending)
+
+    def _ensure_indexes(self):
+        if self._indexed:
+            return
+        self._collection.create_index("timestamp", expireAfterSeconds=LLM_USAGE_RETENTION_DAYS * 86400)
+        self._collection.create_index([("session_id", 1), ("timestamp", 1)])
+        self._indexed = True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+recorder = UsageRecorder(LLM_USAGE_FLUSH_SECONDS, LLM_USAGE_BATCH_SIZE, LLM_USAGE_BUFFER_MAX)
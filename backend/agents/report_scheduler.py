@@ -0,0 +1,183 @@
+# report_scheduler.py
+# Priority scheduler for full report jobs: lead score order, aging, reserved workers per tier
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import tracing
+
+HIGH = "high"
+MEDIUM = "medium"
+LOW = "low"
+TIERS = (HIGH, MEDIUM, LOW)
+
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "4"))
+REPORT_RESERVED_HIGH_WORKERS = int(os.getenv("REPORT_RESERVED_HIGH_WORKERS", "1"))
+REPORT_RESERVED_MEDIUM_WORKERS = int(os.getenv("REPORT_RESERVED_MEDIUM_WORKERS", "1"))
+# Score points a queued job gains per minute of waiting, so low scores cannot starve
+REPORT_AGING_POINTS_PER_MINUTE = float(os.getenv("REPORT_AGING_POINTS_PER_MINUTE", "10"))
+
+
+def priority_tier(lead_score: int) -> str:
+    """Same thresholds as the sales alert (🔥 HIGH > 70, ⚡ MEDIUM > 40)."""
+    if lead_score > 70:
+        return HIGH
+    if lead_score > 40:
+        return MEDIUM
+    return LOW
+
+
+class _Job:
+    __slots__ = ("key", "score", "tier", "fn", "args", "kwargs", "enqueued_at", "trace_context")
+
+    def __init__(self, key, score, tier, fn, args, kwargs):
+        self.key = key
+        self.score = score
+        self.tier = tier
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        # The job's spans continue the trace of the request that queued it
+        self.trace_context = tracing.current_context()
+
+
+class PriorityReportScheduler:
+    """
+    Fixed pool of report workers fed from per-tier priority queues.
+
+    Order: a job's effective priority is `lead_score + aging_rate * minutes_waited`.
+    Since every job ages at the same rate, `lead_score - aging_rate * enqueued_minute`
+    is a time-invariant heap key, so the heaps never need re-sorting.
+
+    Reservations: low jobs may occupy at most `workers - reserved_high - reserved_medium`
+    workers and low+medium jobs at most `workers - reserved_high`, so a high-score
+    lead always finds a free worker within one report's duration at worst, and
+    immediately when fewer than `reserved_high` high jobs are running.
+    """
+
+    def __init__(self, workers: int, reserved_high: int, reserved_medium: int, aging_per_minute: float):
+        self.workers = max(workers, 1)
+        # Always leave at least one worker that low-score jobs may use
+        reserved_high = min(max(reserved_high, 0), self.workers - 1)
+        reserved_medium = min(max(reserved_medium, 0), self.workers - 1 - reserved_high)
+        self.limits = {
+            LOW: self.workers - reserved_high - reserved_medium,
+            MEDIUM: self.workers - reserved_high,
+            HIGH: self.workers,
+        }
+        self.aging_per_second = aging_per_minute / 60
+        self._queues = {tier: [] for tier in TIERS}
+        self._running = {tier: 0 for tier in TIERS}
+        self._stats = {tier: {"completed": 0, "failed": 0, "max_wait_seconds": 0.0} for tier in TIERS}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    def submit(self, key: str, lead_score: int, fn, *args, **kwargs):
+        """Queues `fn(*args, **kwargs)`; returns the job's tier."""
+        tier = priority_tier(lead_score)
+        job = _Job(key, lead_score, tier, fn, args, kwargs)
+        sort_key = -(lead_score - self.aging_per_second * job.enqueued_at)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Report scheduler is shut down")
+            self._start_workers()
+            heapq.heappush(self._queues[tier], (sort_key, next(self._sequence), job))
+            self._cond.notify()
+        print(f"[SCHEDULER] Queued report for {key} (score {lead_score}, {tier})")
+        return tier
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"report-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _can_start(self, tier: str) -> bool:
+        """Running jobs of this tier and every lower tier must stay under the tier's limit."""
+        lower_or_equal = TIERS[TIERS.index(tier):]
+        return sum(self._running[t] for t in lower_or_equal) < self.limits[tier]
+
+    def _next_job(self):
+        """Pops the eligible job with the highest effective priority, or None."""
+        best = None
+        for tier in TIERS:
+            queue = self._queues[tier]
+            if queue and self._can_start(tier) and (best is None or queue[0] < self._queues[best][0]):
+                best = tier
+        if best is None:
+            return None
+        return heapq.heappop(self._queues[best])[2]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None and not self._stopped:
+                    self._cond.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+                self._running[job.tier] += 1
+                waited = time.monotonic() - job.enqueued_at
+                stats = self._stats[job.tier]
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+            print(f"[SCHEDULER] Starting report for {job.key} ({job.tier}, waited {waited:.1f}s)")
+            failed = False
+            try:
+                tracing.run_in_context(job.trace_context, self._run_job, job, waited)
+            except Exception as e:
+                failed = True
+                print(f"[SCHEDULER] Report for {job.key} failed: {e!r}")
+            finally:
+                with self._cond:
+                    self._running[job.tier] -= 1
+                    self._stats[job.tier]["failed" if failed else "completed"] += 1
+                    # A freed worker may unblock a job of any tier
+                    self._cond.notify_all()
+
+    def _run_job(self, job, waited: float):
+        with tracing.span("report.job", session_id=job.key, tier=job.tier,
+                          lead_score=job.score, queue_wait_ms=round(waited * 1000, 1)):
+            job.fn(*job.args, **job.kwargs)
+
+    def snapshot(self):
+        """Queue depth, running jobs and wait stats per tier, for /health."""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                tier: {
+                    "queued": len(self._queues[tier]),
+                    "running": self._running[tier],
+                    "worker_limit": self.limits[tier],
+                    "oldest_wait_seconds": round(
+                        max((now - job.enqueued_at for _, _, job in self._queues[tier]), default=0.0), 1
+                    ),
+                    **{k: round(v, 1) if isinstance(v, float) else v for k, v in self._stats[tier].items()},
+                }
+                for tier in TIERS
+            }
+
+    def shutdown(self):
+        """Stops workers once their current job finishes; queued jobs are dropped."""
+        with self._cond:
+            self._stopped = True
+            for queue in self._queues.values():
+                queue.clear()
+            self._cond.notify_all()
+
+
+report_scheduler = PriorityReportScheduler(
+    REPORT_JOB_WORKERS,
+    REPORT_RESERVED_HIGH_WORKERS,
+    REPORT_RESERVED_MEDIUM_WORKERS,
+    REPORT_AGING_POINTS_PER_MINUTE,
+)
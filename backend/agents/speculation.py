@@ -0,0 +1,90 @@
+# speculation.py
+# Background executor for speculative work (precomputed previews, early report stages)
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import tracing
+
+# How often join() checks the joining generation's cancel token
+JOIN_CANCEL_POLL_SECONDS = 0.5
+
+
+class SpeculativeJobs:
+    """
+    Runs speculative jobs in the background, at most one per key.
+
+    Callers that later need the result can `join()` the in-flight job instead of
+    starting a duplicate. Finished jobs are forgotten: their results are expected
+    to be persisted by the job itself (e.g. on the session document).
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"speculative-{name}")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn, *args, **kwargs):
+        """Starts `fn` for `key` unless a job for that key is already running."""
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is not None and not future.done():
+                return future
+            # Continue the submitting request's trace (and only that) on the worker
+            future = self._pool.submit(tracing.run_in_context, tracing.current_context(), self._run, key, fn, *args, **kwargs)
+            self._jobs[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _run(self, key: str, fn, *args, **kwargs):
+        with tracing.span(f"speculative.{self.name}", session_id=key):
+            return fn(*args, **kwargs)
+
+    def in_flight(self, key: str):
+        """Returns the running future for `key`, or None."""
+        with self._lock:
+            future = self._jobs.get(key)
+        return future if future is not None and not future.done() else None
+
+    def running_count(self) -> int:
+        with self._lock:
+            return sum(1 for future in self._jobs.values() if not future.done())
+
+    def join(self, key: str, timeout: float = None, cancel_token=None):
+        """
+        Waits for the in-flight job for `key`; returns (found, result).
+        With a `cancel_token`, stops waiting (GenerationCancelled) as soon as it is cancelled.
+        """
+        future = self.in_flight(key)
+        if future is None:
+            return False, None
+        if cancel_token is None:
+            return True, future.result(timeout=timeout)
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            cancel_token.raise_if_cancelled()
+            poll = JOIN_CANCEL_POLL_SECONDS
+            if give_up_at is not None:
+                poll = min(poll, max(0, give_up_at - time.monotonic()))
+            try:
+                return True, future.result(timeout=poll)
+            except FutureTimeoutError:
+                if give_up_at is not None and time.monotonic() >= give_up_at:
+                    raise
+
+    def _forget(self, key: str, future):
+        with self._lock:
+            if self._jobs.get(key) is future:
+                del self._jobs[key]
+        if future.exception() is not None:
+            print(f"[SPECULATION] {self.name} job for {key} failed: {future.exception()}")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+preview_jobs = SpeculativeJobs("preview", int(os.getenv("SPECULATIVE_PREVIEW_WORKERS", "4")))
+report_jobs = SpeculativeJobs("report", int(os.getenv("SPECULATIVE_REPORT_WORKERS", "2")))
@@ -0,0 +1,138 @@
+# bench_crew_pool.py
+# Microbenchmark for per-call crew setup: building a fresh Task and Crew around
+# the shared agent (the old path) vs. checking a prepared crew out of a CrewPool
+# and binding the prompt. Uses the synthetic LLM, so kickoff times are crewai's
+# own overhead rather than model latency.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_crew_pool
+#   python -m benchmarks.bench_crew_pool --calls 500 --kickoffs 50 --concurrency 8 --json
+
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline LLM with near-zero latency; no MongoDB needed (spans are not stored)
+BENCH_ENV = {
+    "TRACING_ENABLED": "false",
+    "LLM_BACKEND": "synthetic",
+    "LLM_SYNTHETIC_P50_SECONDS": "0.0001",
+    "LLM_SYNTHETIC_TAIL_RATE": "0",
+    "GROQ_API_KEY": "gsk_benchmark",
+    "MONGO_URI": "mongodb://127.0.0.1:27017",
+}
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from agents.ai_consultant_system import get_agents  # noqa: E402
+from agents.crew_pool import CrewPool, PooledCrew  # noqa: E402
+
+EXPECTED_OUTPUT = "Either complete requirements summary OR clarifying questions"
+
+
+def _prompt(i: int) -> str:
+    return f"Conversation so far:\nUSER: An AI agent that triages support tickets (call {i})\n\nAsk 1-2 clarifying questions."
+
+
+def _summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "calls": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def _timed(fn, calls: int) -> list:
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+# ==============================
+# 🔹 SETUP ONLY
+# ==============================
+def measure_setup(agent, calls: int) -> dict:
+    """Per-call cost of getting a crew ready to kick off, without running it."""
+    from crewai import Crew, Task
+
+    def rebuild(i):
+        task = Task(description=_prompt(i), agent=agent, expected_output=EXPECTED_OUTPUT)
+        Crew(agents=[agent], tasks=[task], verbose=False)
+
+    pool = CrewPool("bench-setup", lambda: PooledCrew(agent, EXPECTED_OUTPUT))
+
+    def pooled(i):
+        with pool.checkout() as crew:
+            crew.bind(_prompt(i))
+
+    rebuild(0), pooled(0)  # first-use imports and the pool's first crew
+    return {"rebuild": _summary(_timed(rebuild, calls)), "pooled": _summary(_timed(pooled, calls))}
+
+# ==============================
+# 🔹 SETUP + KICKOFF
+# ==============================
+def measure_kickoff(agent, calls: int) -> dict:
+    """Per-call cost including a kickoff against the synthetic LLM."""
+    from crewai import Crew, Task
+
+    def rebuild(i):
+        task = Task(description=_prompt(i), agent=agent, expected_output=EXPECTED_OUTPUT)
+        Crew(agents=[agent], tasks=[task], verbose=False).kickoff()
+
+    pool = CrewPool("bench-kickoff", lambda: PooledCrew(agent, EXPECTED_OUTPUT))
+    rebuild(0), pool.kickoff(_prompt(0))
+    return {
+        "rebuild": _summary(_timed(rebuild, calls)),
+        "pooled": _summary(_timed(lambda i: pool.kickoff(_prompt(i)), calls)),
+    }
+
+
+def measure_concurrent(agent, calls: int, concurrency: int) -> dict:
+    """Pooled kickoffs from `concurrency` threads: how many crews the pool ends up building."""
+    pool = CrewPool("bench-concurrent", lambda: PooledCrew(agent, EXPECTED_OUTPUT), max_idle=concurrency)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda i: pool.kickoff(_prompt(i)), range(calls)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "calls": calls, "seconds": round(elapsed, 3), **pool.stats()}
+
+
+def print_result(result: dict):
+    for name, title in (("setup", "setup only"), ("kickoff", "setup + kickoff (synthetic LLM)")):
+        rows = result[name]
+        saved = rows["rebuild"]["mean_ms"] - rows["pooled"]["mean_ms"]
+        print(f"\n{title}:")
+        for path in ("rebuild", "pooled"):
+            row = rows[path]
+            print(f"  {path:<8} mean {row['mean_ms']:>8.3f}ms  p50 {row['p50_ms']:>8.3f}ms  p95 {row['p95_ms']:>8.3f}ms  ({row['calls']} calls)")
+        print(f"  saved per call: {saved:.3f}ms")
+    concurrent = result.get("concurrent")
+    if concurrent:
+        print(f"\n{concurrent['calls']} pooled kickoffs from {concurrent['concurrency']} threads in {concurrent['seconds']}s: "
+              f"{concurrent['built']} crew(s) built, {concurrent['reused']} reuse(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-call crew setup cost: rebuilt vs. pooled crews")
+    parser.add_argument("--calls", type=int, default=300, help="Setup-only calls per path")
+    parser.add_argument("--kickoffs", type=int, default=30, help="Setup + kickoff calls per path")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads for the pooled concurrency run (0 to skip)")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    agent = get_agents().requirement_gathering_expert
+    result = {"setup": measure_setup(agent, args.calls), "kickoff": measure_kickoff(agent, args.kickoffs)}
+    if args.concurrency:
+        result["concurrent"] = measure_concurrent(agent, args.kickoffs, args.concurrency)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
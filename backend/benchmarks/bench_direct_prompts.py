@@ -0,0 +1,173 @@
+# bench_direct_prompts.py
+# Latency and prompt-token comparison for the single-agent workflows (conversation
+# turn, change impact, change summary, email): a pooled one-task crew vs. the
+# direct prompt path in agents/direct_prompt.py. Uses the synthetic LLM, which
+# reports ~4 characters per prompt token, so the token numbers compare prompt
+# sizes rather than a real tokenizer's counts.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_direct_prompts
+#   python -m benchmarks.bench_direct_prompts --calls 50 --llm-p50 0.5 --json
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+# Offline LLM; no MongoDB needed (spans are not stored)
+BENCH_ENV = {
+    "TRACING_ENABLED": "false",
+    "LLM_BACKEND": "synthetic",
+    "LLM_SYNTHETIC_TAIL_RATE": "0",
+    "GROQ_API_KEY": "gsk_benchmark",
+    "MONGO_URI": "mongodb://127.0.0.1:27017",
+}
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+IDEA = "An AI agent that triages support tickets for online shops, drafts replies and escalates refunds to a human"
+
+# workflow -> (agent getter, prompt, expected output), shaped like the real call sites
+WORKFLOWS = {
+    "conversation": (
+        lambda team, email: team.requirement_gathering_expert,
+        f"""
+        Conversation so far:
+        USER: {IDEA}
+        AGENT: Great idea! Who are the main users, and which systems should the agent integrate with?
+        USER: Small Shopify stores; it should plug into Gmail and Zendesk.
+
+        You are helping refine an AI agent idea. Based on the conversation:
+
+        1. If you have enough information (target audience, key features, technical needs, business goals),
+           respond with: "REQUIREMENTS_COMPLETE" followed by a summary of all gathered requirements.
+
+        2. If you need more info, ask 1-2 specific clarifying questions.
+
+        Be conversational and encouraging. Don't overwhelm with too many questions at once.
+        """,
+        "Either complete requirements summary OR clarifying questions",
+    ),
+    "refinement_impact": (
+        lambda team, email: team.change_impact_analyzer,
+        """
+        User added new information: "It should also support WhatsApp and a Spanish-speaking market"
+
+        Existing context: {"requirement_gathering": "## Requirements summary ..."}...
+
+        Determine which sections need regeneration:
+        - requirement_gathering: ALWAYS include
+        - technical_architecture: Include if new features, tech stack, or integrations mentioned
+        - ux_design: Include if new user interactions or flows mentioned
+        - business_strategy: Include if target audience, pricing, or market changed
+
+        Return ONLY a JSON array: ["section1", "section2"]
+        """,
+        "JSON array of section names",
+    ),
+    "change_summary": (
+        lambda team, email: team.change_summarizer,
+        f"""
+        The user refined their AI agent idea. Summarize what changed:
+
+        Original idea: {IDEA}...
+        Updated idea: {IDEA}, on WhatsApp and in Spanish...
+
+        Create a bullet-point summary of KEY changes (3-5 bullets max).
+        Focus on: new features, tech changes, cost implications.
+        """,
+        "Bullet-point summary of changes",
+    ),
+    "email": (
+        lambda team, email: email,
+        f"""
+        Create a highly personalized email for Sam about their AI agent idea.
+
+        USER'S ORIGINAL IDEA:
+        {IDEA}
+
+        PROJECT CHARACTERISTICS:
+        - Complexity Level: medium
+        - Key Features: automation, conversational AI
+        - Lead Score: 55/100
+
+        OUTPUT FORMAT:
+        Return ONLY a JSON object with two keys: "subject" and "html_content".
+        """,
+        "JSON object with subject and html_content keys",
+    ),
+}
+
+
+def _summary(latencies: list, prompt_tokens: list, calls: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[max(int(len(ordered) * 0.95) - 1, 0)] * 1000, 2),
+        "prompt_tokens": round(statistics.fmean(prompt_tokens), 1),
+        "llm_calls": round(statistics.fmean(calls), 2),
+    }
+
+
+def _measure(fn, calls: int) -> dict:
+    from agents import metering
+
+    fn()  # first-use setup (pool crew, litellm callbacks)
+    latencies, prompt_tokens, llm_calls = [], [], []
+    for _ in range(calls):
+        with metering.scope(None, "benchmark") as usage:
+            started = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - started)
+        prompt_tokens.append(usage.prompt_tokens)
+        llm_calls.append(usage.calls)
+    return _summary(latencies, prompt_tokens, llm_calls)
+
+
+def compare(calls: int) -> dict:
+    from agents.ai_consultant_system import get_agents
+    from agents.crew_pool import CrewPool, PooledCrew
+    from agents.direct_prompt import DIRECT_PROMPTS, run_prompt
+    from agents.email_generator import get_email_writer_agent
+
+    if not DIRECT_PROMPTS:
+        raise SystemExit("Unset DIRECT_PROMPTS (or set it to true) so the direct path is measured")
+    team, email = get_agents(), get_email_writer_agent()
+    result = {}
+    for name, (get_agent, description, expected_output) in WORKFLOWS.items():
+        agent = get_agent(team, email)
+        pool = CrewPool(f"bench-{name}", lambda: PooledCrew(agent, expected_output))
+        result[name] = {
+            "crew": _measure(lambda: pool.kickoff(description), calls),
+            "direct": _measure(lambda: run_prompt(name, agent, description, expected_output), calls),
+        }
+    return result
+
+
+def print_result(result: dict):
+    print(f"\n{'workflow':<18} {'path':<7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'prompt tok':>11} {'calls':>6}")
+    for name, paths in result.items():
+        for path, row in paths.items():
+            print(f"{name:<18} {path:<7} {row['mean_ms']:>9.2f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                  f"{row['prompt_tokens']:>11.1f} {row['llm_calls']:>6.2f}")
+        crew, direct = paths["crew"], paths["direct"]
+        saved = 1 - direct["prompt_tokens"] / crew["prompt_tokens"] if crew["prompt_tokens"] else 0
+        print(f"{'':<18} saved   {crew['mean_ms'] - direct['mean_ms']:>9.2f} {'':>9} {'':>9} {saved:>10.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pooled crews vs. direct prompts for single-agent workflows")
+    parser.add_argument("--calls", type=int, default=30, help="Calls per workflow and path")
+    parser.add_argument("--llm-p50", type=float, default=0.0001,
+                        help="Synthetic LLM median latency in seconds (default ~0: overhead only)")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+    os.environ["LLM_SYNTHETIC_P50_SECONDS"] = str(args.llm_p50)
+
+    result = compare(args.calls)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
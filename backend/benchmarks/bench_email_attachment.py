@@ -0,0 +1,95 @@
+# bench_email_attachment.py
+# Memory and serialization time of the report email's PDF attachment: the
+# base64 string from pdf_cache.get_report_pdf_base64 vs. the list(pdf_bytes)
+# integer array the email used to send. Each mode builds the Resend params and
+# JSON-encodes them the way the HTTP client does, from a cached PDF.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_email_attachment
+#   python -m benchmarks.bench_email_attachment --section-chars 40000 --runs 20 --json
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("TRACING_ENABLED", "false")
+os.environ["PDF_RENDER_WORKERS"] = "0"
+os.environ["PDF_CACHE_ENABLED"] = "true"
+os.environ["PDF_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-email-attachment-")
+
+
+def attachment_as_list(session: dict):
+    from pdf_cache import get_report_pdf_file
+
+    pdf = get_report_pdf_file(session)
+    with open(pdf.path, "rb") as f:
+        return list(f.read())
+
+
+def attachment_as_base64(session: dict):
+    from pdf_cache import get_report_pdf_base64
+
+    return get_report_pdf_base64(session)
+
+
+def send_body(session: dict, encode) -> bytes:
+    """The request body Resend would receive for the report email."""
+    params = {
+        "from": "noreply@example.com",
+        "to": ["lead@example.com"],
+        "subject": "Your AI agent report",
+        "html": "<p>Hi</p>",
+        "attachments": [{"filename": "ai-agent-report.pdf", "content": encode(session)}],
+    }
+    return json.dumps(params).encode("utf-8")
+
+
+def measure(session: dict, encode, runs: int) -> dict:
+    send_body(session, encode)  # the PDF is cached from here on
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = send_body(session, encode)
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    send_body(session, encode)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p50_ms": round(sorted(samples)[len(samples) // 2] * 1000, 2),
+        "peak_kb": round(peak / 1024, 1),
+        "body_kb": round(len(body) / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report email attachment: base64 vs. list of ints")
+    parser.add_argument("--runs", type=int, default=30, help="Timed runs per mode")
+    parser.add_argument("--section-chars", type=int, default=6000, help="Approximate markdown length per section")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    from benchmarks.bench_pdf import sample_session
+    from pdf_cache import get_report_pdf_file
+
+    session = sample_session(args.section_chars)
+    pdf = get_report_pdf_file(session)
+    result = {
+        "pdf_kb": round(pdf.stat.st_size / 1024, 1),
+        "list": measure(session, attachment_as_list, args.runs),
+        "base64": measure(session, attachment_as_base64, args.runs),
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"\nPDF: {result['pdf_kb']} KB")
+        for mode in ("list", "base64"):
+            row = result[mode]
+            print(f"  {mode:<7} mean {row['mean_ms']:>8.2f}ms  p50 {row['p50_ms']:>8.2f}ms  "
+                  f"peak {row['peak_kb']:>9.1f} KB  body {row['body_kb']:>9.1f} KB")
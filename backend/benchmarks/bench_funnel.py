@@ -0,0 +1,286 @@
+# bench_funnel.py
+# End-to-end funnel benchmark: drives the real API through start, continue xN,
+# preview, lead capture, progress polling, PDF download and refinement.
+#
+# The API runs in its own process (benchmarks/serve.py) with in-memory Mongo,
+# the synthetic LLM and a stub Resend, or against --url. Reports throughput,
+# p50/p95/p99 per endpoint and Mongo operations per funnel, and compares them
+# with a baseline file: any regression beyond --tolerance exits non-zero.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_funnel --funnels 20 --concurrency 4 --save-baseline
+#   python -m benchmarks.bench_funnel --funnels 20 --concurrency 4
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from benchmarks.serve import ServerProcess, add_arguments
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "funnel.json")
+
+IDEAS = [
+    "An AI agent that triages customer support tickets for a mid-size SaaS company and drafts replies",
+    "A sales assistant agent that qualifies inbound leads from our website chat and books demos",
+    "An internal knowledge agent for a law firm that answers questions from past case documents",
+    "A procurement agent that compares supplier quotes and flags contract risks for manufacturers",
+]
+ANSWERS = [
+    "Our users are operations managers at retailers with 50-500 employees.",
+    "It must integrate with Salesforce, Slack and our Postgres database, and we want a subscription model.",
+    "Key features are summarization, routing and analytics dashboards; budget is around $5k per month.",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+# ==============================
+# 🔹 MEASUREMENT
+# ==============================
+class Recorder:
+    """Thread-safe latency samples per endpoint (route template) plus error counts."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "count": len(values),
+                    "errors": self.errors.get(name, 0),
+                    "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+                }
+                for name, values in sorted(self.samples.items())
+            }
+
+
+def timed(client: httpx.Client, recorder: Recorder, name: str, method: str, path: str, **kwargs):
+    """Sends one request and records its latency under `name`; returns the response."""
+    started = time.perf_counter()
+    try:
+        response = client.request(method, path, **kwargs)
+    except httpx.HTTPError:
+        recorder.add(name, time.perf_counter() - started, ok=False)
+        raise
+    recorder.add(name, time.perf_counter() - started, ok=response.status_code < 400)
+    if response.status_code >= 400:
+        print(f"[BENCH] {name} -> {response.status_code}: {response.text[:200]}")
+    return response
+
+
+_MONGO_COUNT = re.compile(r'^mongo_operation_duration_seconds_count\{command="([^"]+)",outcome="[^"]+"\} (\d+)', re.M)
+
+
+def mongo_operations(client: httpx.Client) -> dict:
+    """Mongo operations so far per command, read from /metrics."""
+    counts = defaultdict(int)
+    for command, value in _MONGO_COUNT.findall(client.get("/metrics").text):
+        counts[command] += int(value)
+    return counts
+
+# ==============================
+# 🔹 FUNNEL
+# ==============================
+def run_funnel(client: httpx.Client, recorder: Recorder, index: int, turns: int,
+               poll_interval: float, report_timeout: float) -> bool:
+    """One simulated visitor through the whole funnel; returns True if every step succeeded."""
+    rng = random.Random(index)
+    r = timed(client, recorder, "POST /conversation/start", "POST", "/conversation/start",
+              json={"user_id": f"bench-{index}", "idea": rng.choice(IDEAS)})
+    if r.status_code != 200:
+        return False
+    session_id = r.json()["session_id"]
+
+    for turn in range(turns):
+        r = timed(client, recorder, "POST /conversation/continue", "POST", "/conversation/continue",
+                  json={"session_id": session_id, "message": ANSWERS[turn % len(ANSWERS)]})
+        if r.status_code != 200:
+            return False
+
+    r = timed(client, recorder, "POST /preview/generate", "POST", "/preview/generate",
+              json={"session_id": session_id})
+    if r.status_code != 200:
+        return False
+
+    r = timed(client, recorder, "POST /lead/capture", "POST", "/lead/capture",
+              json={"session_id": session_id, "email": f"bench{index}@example.com", "name": f"Bench User {index}"})
+    if r.status_code != 200:
+        return False
+
+    captured = time.perf_counter()
+    while True:
+        r = timed(client, recorder, "GET /progress/{session_id}", "GET", f"/progress/{session_id}")
+        if r.status_code == 200 and r.json()["stage"] == "report_complete":
+            recorder.add("report ready (capture -> complete)", time.perf_counter() - captured)
+            break
+        if time.perf_counter() - captured > report_timeout:
+            recorder.add("report ready (capture -> complete)", time.perf_counter() - captured, ok=False)
+            print(f"[BENCH] report for {session_id} not complete after {report_timeout:.0f}s: {r.text[:200]}")
+            return False
+        time.sleep(poll_interval)
+
+    r = timed(client, recorder, "GET /report/{session_id}/download-pdf", "GET", f"/report/{session_id}/download-pdf")
+    if r.status_code != 200 or not r.content.startswith(b"%PDF"):
+        return False
+
+    r = timed(client, recorder, "POST /report/refine", "POST", "/report/refine",
+              json={"session_id": session_id, "additional_info": "We also need a mobile app for store managers."})
+    return r.status_code == 200 and r.json().get("success", False)
+
+
+def run_benchmark(url: str, funnels: int, concurrency: int, turns: int,
+                  poll_interval: float, report_timeout: float) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency + 2)
+    with httpx.Client(base_url=url, timeout=report_timeout, limits=limits) as client:
+        mongo_before = mongo_operations(client)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(
+                lambda i: _safe_funnel(client, recorder, i, turns, poll_interval, report_timeout),
+                range(funnels),
+            ))
+        elapsed = time.perf_counter() - started
+        mongo_after = mongo_operations(client)
+
+    completed = sum(outcomes)
+    requests = sum(stats["count"] for name, stats in recorder.summary().items() if not name.startswith("report ready"))
+    mongo = {cmd: mongo_after[cmd] - mongo_before.get(cmd, 0) for cmd in mongo_after}
+    return {
+        "funnels": funnels,
+        "completed": completed,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "funnels_per_minute": round(completed / elapsed * 60, 2),
+        "requests_per_second": round(requests / elapsed, 2),
+        "endpoints": recorder.summary(),
+        "mongo_ops_per_funnel": round(sum(mongo.values()) / max(funnels, 1), 1),
+        "mongo_ops_by_command": {cmd: round(n / max(funnels, 1), 1) for cmd, n in sorted(mongo.items()) if n},
+    }
+
+
+def _safe_funnel(*args):
+    try:
+        return run_funnel(*args)
+    except httpx.HTTPError as e:
+        print(f"[BENCH] funnel failed: {e}")
+        return False
+
+# ==============================
+# 🔹 BASELINE
+# ==============================
+def compare(result: dict, baseline: dict, tolerance: float, min_delta_ms: float = 50) -> list:
+    """
+    Returns regressions: slower p95/p99, lower throughput or more Mongo ops than
+    baseline. Latency must also be `min_delta_ms` worse, so jitter on
+    millisecond endpoints does not count.
+    """
+    regressions = []
+    for name, stats in result["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if not before:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if stats[key] > before[key] * (1 + tolerance) and stats[key] - before[key] > min_delta_ms:
+                regressions.append(f"{name} {key}: {stats[key]} > baseline {before[key]}")
+        if stats["errors"] > before["errors"]:
+            regressions.append(f"{name} errors: {stats['errors']} > baseline {before['errors']}")
+    if result["funnels_per_minute"] < baseline["funnels_per_minute"] * (1 - tolerance):
+        regressions.append(f"throughput: {result['funnels_per_minute']} < baseline {baseline['funnels_per_minute']} funnels/min")
+    if result["mongo_ops_per_funnel"] > baseline["mongo_ops_per_funnel"] * (1 + tolerance):
+        regressions.append(f"mongo ops/funnel: {result['mongo_ops_per_funnel']} > baseline {baseline['mongo_ops_per_funnel']}")
+    if result["completed"] < result["funnels"]:
+        regressions.append(f"only {result['completed']}/{result['funnels']} funnels completed")
+    return regressions
+
+
+def print_result(result: dict):
+    print(f"\nFunnels: {result['completed']}/{result['funnels']} completed in {result['elapsed_seconds']}s "
+          f"at concurrency {result['concurrency']}")
+    print(f"Throughput: {result['funnels_per_minute']} funnels/min, {result['requests_per_second']} req/s")
+    print(f"Mongo ops per funnel: {result['mongo_ops_per_funnel']}  {result['mongo_ops_by_command']}\n")
+    print(f"{'endpoint':<42} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in result["endpoints"].items():
+        print(f"{name:<42} {stats['count']:>6} {stats['errors']:>4} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end funnel benchmark")
+    parser.add_argument("--funnels", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=2, help="Conversation turns after the initial idea")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Progress polling interval (s)")
+    parser.add_argument("--report-timeout", type=float, default=180)
+    parser.add_argument("--url", default=None, help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=50, help="Ignore latency regressions smaller than this")
+    parser.add_argument("--json", default=None, help="Also write the result to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    def bench(url):
+        return run_benchmark(url, args.funnels, args.concurrency, args.turns, args.poll_interval, args.report_timeout)
+
+    if args.url:
+        result = bench(args.url)
+    else:
+        with ServerProcess(args, args.port) as server:
+            result = bench(server.url)
+    result["settings"] = {
+        "turns": args.turns,
+        "llm_backend": args.llm_backend,
+        "llm_p50": args.llm_p50,
+        "seed": args.seed,
+        "mongo": args.mongo_uri or "in-memory",
+    }
+    print_result(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != result["settings"]:
+            print(f"\n⚠️  Baseline settings differ: {baseline.get('settings')}")
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print(f"\n✅ Within {args.tolerance:.0%} of baseline")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
@@ -0,0 +1,160 @@
+# bench_llm_resilience.py
+# Compares tail latency of raw LLM calls vs. ResilientLLM (retries, hedging)
+# against the local fake LLM server.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_llm_resilience --requests 300 --concurrency 8
+#   python -m benchmarks.bench_llm_resilience --check   # breaker regression check only
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import resilience
+from agents.cancellation import GenerationCancelled
+from agents.llm_client import ResilientLLM, RetryBudget
+from benchmarks.fake_llm_server import FaultProfile, start_server
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeHTTPLLM:
+    """Minimal `.call()` client for the fake server, standing in for crewai.LLM."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.model = "fake/bench-model"
+        self.temperature = 0
+        self.stop = []
+        self.url = f"{base_url}/v1/chat/completions"
+        self.timeout = timeout
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 8192
+
+    def call(self, messages, **kwargs):
+        body = json.dumps({"model": self.model, "messages": messages}).encode()
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise HTTPStatusError(e.code) from e
+        return payload["choices"][0]["message"]["content"]
+
+
+class ScriptedLLM(FakeHTTPLLM):
+    """Raises the queued errors one call at a time, then answers."""
+
+    def __init__(self, errors):
+        super().__init__("http://unused")
+        self.errors = list(errors)
+
+    def call(self, messages, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def check_half_open_release():
+    """
+    A half-open trial that ends in a non-outage error (a 400) or a cancellation
+    must release the trial slot; otherwise the breaker stays half-open and
+    rejects every later call.
+    """
+    messages = [{"role": "user", "content": "ping"}]
+    for error in (HTTPStatusError(400), GenerationCancelled("check", "client disconnected")):
+        dependency = resilience.Dependency("check", max_concurrent=4, max_wait=1, failure_threshold=1,
+                                           recovery_timeout=0.05, is_failure=resilience._is_transient)
+        client = ResilientLLM(ScriptedLLM([error]), timeout=5, attempt_timeout=5, hedge=False,
+                              budget=RetryBudget(ratio=0.2, min_per_second=1), dependency=dependency)
+        dependency.breaker.record_failure()
+        time.sleep(0.1)
+        try:
+            client.call(messages)
+        except type(error):
+            pass
+        state = dependency.breaker.snapshot()["state"]
+        assert state == resilience.CLOSED, f"breaker left {state} after a half-open {type(error).__name__}"
+        assert client.call(messages) == "ok"
+    print("Breaker check: half-open trials are released after 400s and cancellations")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run(label, client, requests, concurrency):
+    messages = [{"role": "user", "content": "Summarize the requirements."}]
+    latencies, errors = [], 0
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            client.call(messages)
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, error in pool.map(one, range(requests)):
+            latencies.append(elapsed)
+            errors += error is not None
+
+    print(
+        f"{label:<22} p50={percentile(latencies, 0.50):6.2f}s  p95={percentile(latencies, 0.95):6.2f}s  "
+        f"p99={percentile(latencies, 0.99):6.2f}s  max={max(latencies):6.2f}s  errors={errors}/{requests}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tail-latency benchmark for the resilient LLM layer")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--p50", type=float, default=0.3)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.01)
+    parser.add_argument("--check", action="store_true", help="Only run the breaker regression check")
+    args = parser.parse_args()
+
+    check_half_open_release()
+    if args.check:
+        raise SystemExit(0)
+
+    profile = FaultProfile(p50=args.p50, tail_rate=args.tail_rate, error_rate=args.error_rate,
+                           hang_rate=args.hang_rate, seed=7)
+    server = start_server(profile=profile)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Fake LLM: p50={args.p50}s tail={args.tail_rate:.0%} errors={args.error_rate:.0%} hangs={args.hang_rate:.0%}\n")
+
+    # The raw client only has a socket timeout, like the pipeline had before.
+    run("raw client", FakeHTTPLLM(base_url, timeout=30), args.requests, args.concurrency)
+
+    def resilient(hedge):
+        return ResilientLLM(
+            FakeHTTPLLM(base_url, timeout=30),
+            timeout=30,
+            attempt_timeout=max(args.p50 * 10, 2),
+            hedge=hedge,
+            hedge_min_delay=args.p50,
+            budget=RetryBudget(ratio=0.2, min_per_second=1),
+        )
+
+    run("retries + deadlines", resilient(hedge=False), args.requests, args.concurrency)
+
+    hedged = resilient(hedge=True)
+    run("warm-up (hedged)", hedged, 50, args.concurrency)
+    run("retries + hedging", hedged, args.requests, args.concurrency)
+
+    server.shutdown()
@@ -0,0 +1,115 @@
+# bench_pdf.py
+# Renders per second for a typical four-section report, with the shared
+# PDFRenderer (styles and logo prepared once) vs. a renderer built for every
+# render, which is what each render used to pay for. "shared_cold" clears the
+# renderer's section memo before each render, so every section's markdown is
+# compiled again (a report whose sections all changed).
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_pdf
+#   python -m benchmarks.bench_pdf --renders 50 --section-chars 8000 --logo ../frontend/public/cipherslab-logo.png
+#   python -m benchmarks.bench_pdf --check   # inline markup regression check only
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("TRACING_ENABLED", "false")
+
+REPORT_SECTIONS = ("requirement_gathering", "technical_architecture", "ux_design", "business_strategy")
+
+
+def sample_session(section_chars: int) -> dict:
+    """A finished session with synthetic markdown sections of about `section_chars` each."""
+    from agents.fake_llm import synthetic_reply
+
+    return {
+        "session_id": "bench-pdf-session-0001",
+        "idea": "An AI agent that triages support tickets for online shops, drafts replies and escalates refunds",
+        "lead_score": 72,
+        "context": {key: synthetic_reply("", key, section_chars) for key in REPORT_SECTIONS},
+    }
+
+
+# Emphasis that used to come out as crossed tags (and fail the whole render), and names that are not emphasis
+INLINE_CASES = {
+    "***bold italic***": "<b><i>bold italic</i></b>",
+    "**bold _italic** text_": "<b>bold _italic</b> text_",
+    "~~**x~~**": "<strike>**x</strike>**",
+    "_a **b_ c**": "<i>a **b</i> c**",
+    "call __init__ from snake_case_name": "call __init__ from snake_case_name",
+    "**bold**, *italic*, _italic_ and ~~gone~~": "<b>bold</b>, <i>italic</i>, <i>italic</i> and <strike>gone</strike>",
+}
+
+
+def check_inline_markup():
+    """Inline markup is always properly nested, and a report full of it renders."""
+    from pdf_generator import generate_pdf_report
+    from pdf_markdown import inline_markup
+
+    for text, expected in INLINE_CASES.items():
+        assert inline_markup(text) == expected, f"{text!r} -> {inline_markup(text)!r}, expected {expected!r}"
+    markdown = "\n".join(f"- {text}" for text in INLINE_CASES) + "\n\n" + " ".join(INLINE_CASES)
+    session = {"session_id": "check-inline-markup", "idea": "check", "context": {key: markdown for key in REPORT_SECTIONS}}
+    assert generate_pdf_report(session).startswith(b"%PDF")
+    print("Inline markup check: crossed and nested emphasis render as nested tags")
+
+
+def cold(renderer):
+    def render(session):
+        renderer.sections.clear()
+        return renderer.render(session)
+    return render
+
+
+def measure(render, session: dict, renders: int) -> dict:
+    render(session)  # first render loads fonts' metrics and warms caches
+    samples = []
+    for _ in range(renders):
+        started = time.perf_counter()
+        size = len(render(session))
+        samples.append(time.perf_counter() - started)
+    return {
+        "renders": renders,
+        "renders_per_second": round(len(samples) / sum(samples), 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+        "p50_ms": round(sorted(samples)[len(samples) // 2] * 1000, 1),
+        "bytes": size,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF renders per second: shared vs. per-render PDFRenderer")
+    parser.add_argument("--renders", type=int, default=30, help="Renders per mode")
+    parser.add_argument("--section-chars", type=int, default=6000, help="Approximate markdown length per section")
+    parser.add_argument("--logo", default=None, help="Logo image to render with (PDF_LOGO_PATH)")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--check", action="store_true", help="Only run the inline markup regression check")
+    args = parser.parse_args()
+    if args.logo:
+        os.environ["PDF_LOGO_PATH"] = os.path.abspath(args.logo)
+
+    check_inline_markup()
+    if args.check:
+        raise SystemExit(0)
+
+    from pdf_generator import PDFRenderer, renderer
+
+    session = sample_session(args.section_chars)
+    result = {
+        "logo": bool(renderer.logo_png),
+        "per_render": measure(lambda s: PDFRenderer().render(s), session, args.renders),
+        "shared_cold": measure(cold(renderer), session, args.renders),
+        "shared": measure(renderer.render, session, args.renders),
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"\nlogo: {'yes' if result['logo'] else 'no'}, ~{args.section_chars} chars per section")
+        for mode in ("per_render", "shared_cold", "shared"):
+            row = result[mode]
+            print(f"  {mode:<11} {row['renders_per_second']:>7.2f} renders/s  mean {row['mean_ms']:>7.1f}ms  "
+                  f"p50 {row['p50_ms']:>7.1f}ms  {row['bytes']} bytes")
@@ -0,0 +1,143 @@
+# bench_startup.py
+# Cold-start benchmark: how long `import index` takes, which modules it pulls in,
+# how long a fresh worker takes to answer /health and to finish its background
+# warm-up, and what the first funnel request pays when agents are built on first use.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --runs 5 --warmup off --max-import-seconds 1.5
+#
+# Exits with status 1 if crewai, litellm or langchain are imported by `import
+# index` (they belong behind get_agents()), or if the import is slower than
+# --max-import-seconds.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.serve import ServerProcess, add_arguments
+
+# Must not be imported until the first request that needs an agent
+DEFERRED_MODULES = ("crewai", "litellm", "langchain_community", "langchain_core", "reportlab")
+
+# Lets `import index` run without real credentials; nothing connects at import
+IMPORT_ENV = {"GROQ_API_KEY": "gsk_benchmark", "MONGO_URI": "mongodb://127.0.0.1:27017"}
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import index
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+# ==============================
+# 🔹 IMPORT TIME
+# ==============================
+def _run_python(code: str, *flags):
+    env = {**os.environ, **IMPORT_ENV}
+    return subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, env=env, check=True)
+
+
+def measure_import(runs: int) -> dict:
+    """Median wall time of `import index` in fresh interpreters, and deferred modules it loaded."""
+    samples, loaded = [], set()
+    for _ in range(runs):
+        result = json.loads(_run_python(IMPORT_PROBE % (DEFERRED_MODULES,)).stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3),
+            "deferred_modules_loaded": sorted(loaded)}
+
+
+def heaviest_imports(top: int) -> list:
+    """Top packages by cumulative import time, from `python -X importtime`."""
+    stderr = _run_python("import index", "-X", "importtime").stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting depth is the indentation; keep each top-level package's outermost entry
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+    packages.pop("index", None)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ranked]
+
+# ==============================
+# 🔹 TIME TO FIRST REQUEST
+# ==============================
+def measure_server(args) -> dict:
+    """Process start -> first /health (-> warm-up done), then the first and second /conversation/start."""
+    os.environ["WARMUP_ON_STARTUP"] = "true" if args.warmup == "on" else "false"
+    warm_seconds = None
+    with ServerProcess(args, args.port, poll_interval=0.01, wait_for_warmup=False) as server:
+        with httpx.Client(base_url=server.url, timeout=300) as client:
+            if args.warmup == "on":
+                # Time until the background warm-up has built the agents
+                while not client.get("/health").json().get("agents_ready"):
+                    time.sleep(0.05)
+                warm_seconds = time.perf_counter() - server.started
+            latencies = []
+            for i in range(2):
+                started = time.perf_counter()
+                r = client.post("/conversation/start", json={"user_id": f"startup-{i}", "idea": "An AI agent that triages support tickets for online shops"})
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+    return {
+        "warmup": args.warmup,
+        "ready_s": round(server.ready_seconds, 3),
+        "warm_s": round(warm_seconds, 3) if warm_seconds else None,
+        "first_request_s": round(latencies[0], 3),
+        "second_request_s": round(latencies[1], 3),
+    }
+
+
+def print_result(result: dict):
+    imports = result["import"]
+    print(f"\nimport index: median {imports['median_s']}s (min {imports['min_s']}s)")
+    if imports["deferred_modules_loaded"]:
+        print(f"  ⚠ imported eagerly: {', '.join(imports['deferred_modules_loaded'])}")
+    print("  heaviest packages (cumulative):")
+    for row in result["heaviest"]:
+        print(f"    {row['cumulative_ms']:>9.1f}ms  {row['package']}")
+    server = result.get("server")
+    if server:
+        warm = f", agents built after {server['warm_s']}s" if server["warm_s"] else ""
+        print(f"\nworker (warm-up {server['warmup']}): /health after {server['ready_s']}s{warm}, "
+              f"first /conversation/start {server['first_request_s']}s, second {server['second_request_s']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the API")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time `import index` in")
+    parser.add_argument("--top", type=int, default=12, help="Heaviest packages to list")
+    parser.add_argument("--warmup", choices=["on", "off"], default="on", help="WARMUP_ON_STARTUP for the server run")
+    parser.add_argument("--no-server", action="store_true", help="Only measure the import")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="Fail if the median import is slower")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--port", type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    result = {"import": measure_import(args.runs), "heaviest": heaviest_imports(args.top)}
+    if not args.no_server:
+        result["server"] = measure_server(args)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+
+    failed = bool(result["import"]["deferred_modules_loaded"])
+    if args.max_import_seconds and result["import"]["median_s"] > args.max_import_seconds:
+        print(f"\n❌ import index took {result['import']['median_s']}s (limit {args.max_import_seconds}s)")
+        failed = True
+    sys.exit(1 if failed else 0)
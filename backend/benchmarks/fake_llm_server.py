@@ -0,0 +1,120 @@
+# fake_llm_server.py
+# Local OpenAI-compatible chat completion server that injects latency and errors.
+#
+# Usage:
+#   python -m benchmarks.fake_llm_server --port 8901 --p50 0.8 --tail-rate 0.05 --error-rate 0.05
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FaultProfile:
+    """Latency and failure distribution served by the fake LLM."""
+
+    def __init__(self, p50=0.8, sigma=0.35, tail_rate=0.05, tail_multiplier=12.0,
+                 error_rate=0.05, hang_rate=0.0, seed=None):
+        self.p50 = p50
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail_multiplier = tail_multiplier
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Returns (delay_seconds, status_code) for one request."""
+        with self._lock:
+            delay = self.random.lognormvariate(math.log(self.p50), self.sigma)
+            roll = self.random.random()
+            if roll < self.hang_rate:
+                return 3600.0, 200
+            if roll < self.hang_rate + self.tail_rate:
+                delay *= self.tail_multiplier
+            if self.random.random() < self.error_rate:
+                return delay / 4, self.random.choice([429, 500, 503])
+        return delay, 200
+
+
+def completion_payload(model: str, content: str, prompt_chars: int):
+    prompt_tokens = max(1, prompt_chars // 4)
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def make_handler(profile: FaultProfile, reply: str):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            delay, status = profile.sample()
+            time.sleep(delay)
+
+            if status != 200:
+                payload = {"error": {"message": "injected failure", "type": "server_error", "code": status}}
+            else:
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+                payload = completion_payload(body.get("model", "fake-model"), reply, prompt_chars)
+
+            data = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client gave up (timeout or hedge won)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port: int = 0, profile: FaultProfile = None,
+                 reply: str = "Thought: I now know the final answer\nFinal Answer: OK"):
+    """Starts the fake server on a daemon thread and returns it; `server.server_port` is the bound port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(profile or FaultProfile(), reply))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server with fault injection")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--p50", type=float, default=0.8, help="Median latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.35, help="Log-normal spread")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="Fraction of slow responses")
+    parser.add_argument("--tail-multiplier", type=float, default=12.0)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of 429/5xx responses")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that never answer")
+    args = parser.parse_args()
+
+    profile = FaultProfile(args.p50, args.sigma, args.tail_rate, args.tail_multiplier,
+                           args.error_rate, args.hang_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(profile, "Final Answer: OK"))
+    print(f"🧪 Fake LLM listening on http://127.0.0.1:{args.port}/v1/chat/completions")
+    server.serve_forever()
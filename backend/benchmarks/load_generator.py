@@ -0,0 +1,271 @@
+# load_generator.py
+# Closed-loop load generator with a concurrency sweep, to find where one uvicorn
+# worker saturates and size production worker counts from data.
+#
+# Each simulated user loops: start a conversation, answer N times, generate the
+# preview, poll progress and download the PDF of a finished report, with a
+# think time between requests. Concurrency steps up through --levels; every
+# step reports throughput and latency, giving a throughput-versus-latency curve.
+#
+# Usage (from backend/):
+#   python -m benchmarks.load_generator --levels 1,2,4,8,16,32 --step-seconds 60 --think exp:2
+#   python -m benchmarks.load_generator --url http://127.0.0.1:8000 --levels 4,8 --out curve.csv
+
+import argparse
+import csv
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from benchmarks.bench_funnel import ANSWERS, IDEAS, Recorder, percentile, timed
+from benchmarks.serve import ServerProcess, add_arguments
+
+# ==============================
+# 🔹 THINK TIME
+# ==============================
+def think_time(spec: str):
+    """
+    Parses a think-time distribution into a sampler returning seconds:
+    `none`, `const:S`, `uniform:LO:HI`, `exp:MEAN` or `lognormal:MEDIAN:SIGMA`.
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "none":
+        return lambda rng: 0.0
+    if kind == "const":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown think-time distribution '{spec}'")
+
+# ==============================
+# 🔹 SIMULATED USERS
+# ==============================
+class Step:
+    """Recorder for one concurrency level that keeps only its measurement window."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.recorder = Recorder()
+        self.measuring = False
+        self.stopped = threading.Event()
+
+    def add(self, name: str, seconds: float, ok: bool = True):
+        # Requests finishing during ramp-up or after the window are not counted
+        if self.measuring:
+            self.recorder.add(name, seconds, ok)
+
+
+def simulated_user(client: httpx.Client, step: Step, user: int, reports: list, turns: int,
+                   think, progress_polls: int):
+    rng = random.Random(user * 7919 + step.concurrency)
+    recorder = step
+
+    def pause():
+        step.stopped.wait(think(rng))
+        return not step.stopped.is_set()
+
+    def back_off(response):
+        # A shed request (503 with Retry-After) must not turn the user into a tight retry loop
+        try:
+            retry_after = float(response.headers.get("Retry-After", 0))
+        except ValueError:
+            retry_after = 0
+        step.stopped.wait(max(think(rng), retry_after, 0.5))
+
+    while not step.stopped.is_set():
+        try:
+            r = timed(client, recorder, "POST /conversation/start", "POST", "/conversation/start",
+                      json={"user_id": f"load-{user}", "idea": rng.choice(IDEAS)})
+            if r.status_code != 200:
+                back_off(r)
+                continue
+            if not pause():
+                continue
+            session_id = r.json()["session_id"]
+
+            for turn in range(turns):
+                timed(client, recorder, "POST /conversation/continue", "POST", "/conversation/continue",
+                      json={"session_id": session_id, "message": ANSWERS[turn % len(ANSWERS)]})
+                if not pause():
+                    break
+            else:
+                timed(client, recorder, "POST /preview/generate", "POST", "/preview/generate",
+                      json={"session_id": session_id})
+                if not pause() or not reports:
+                    continue
+                report = rng.choice(reports)
+                for _ in range(progress_polls):
+                    timed(client, recorder, "GET /progress/{session_id}", "GET", f"/progress/{report}")
+                    if not pause():
+                        break
+                else:
+                    timed(client, recorder, "GET /report/{session_id}/download-pdf", "GET",
+                          f"/report/{report}/download-pdf")
+                    pause()
+        except httpx.HTTPError as e:
+            # Already recorded as a failed request by timed()
+            print(f"[LOAD] user {user}: {e}")
+            step.stopped.wait(1)
+
+
+def seed_reports(client: httpx.Client, count: int, timeout: float = 300) -> list:
+    """Creates finished reports for the progress and PDF requests to hit."""
+    reports = []
+    recorder = Recorder()
+    for i in range(count):
+        r = timed(client, recorder, "seed", "POST", "/conversation/start",
+                  json={"user_id": f"load-seed-{i}", "idea": IDEAS[i % len(IDEAS)]})
+        session_id = r.json()["session_id"]
+        for answer in ANSWERS[:2]:
+            timed(client, recorder, "seed", "POST", "/conversation/continue",
+                  json={"session_id": session_id, "message": answer})
+        timed(client, recorder, "seed", "POST", "/preview/generate", json={"session_id": session_id})
+        timed(client, recorder, "seed", "POST", "/lead/capture",
+              json={"session_id": session_id, "email": f"seed{i}@example.com", "name": f"Seed User {i}"})
+        reports.append(session_id)
+
+    deadline = time.monotonic() + timeout
+    pending = set(reports)
+    while pending and time.monotonic() < deadline:
+        for session_id in list(pending):
+            if client.get(f"/progress/{session_id}").json()["stage"] == "report_complete":
+                pending.discard(session_id)
+        time.sleep(1)
+    if pending:
+        print(f"[LOAD] {len(pending)} seed report(s) did not finish; they are left out")
+    return [s for s in reports if s not in pending]
+
+# ==============================
+# 🔹 SWEEP
+# ==============================
+def run_step(client: httpx.Client, concurrency: int, reports: list, args, think) -> dict:
+    step = Step(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for user in range(concurrency):
+            pool.submit(simulated_user, client, step, user, reports, args.turns, think, args.progress_polls)
+            # Ramp users in over the warm-up so they do not move in lockstep
+            time.sleep(args.warmup_seconds / concurrency)
+        step.measuring = True
+        started = time.perf_counter()
+        time.sleep(args.step_seconds)
+        step.measuring = False
+        elapsed = time.perf_counter() - started
+        step.stopped.set()
+
+    summary = step.recorder.summary()
+    all_samples = [v for name, values in step.recorder.samples.items() for v in values]
+    count = len(all_samples)
+    errors = sum(stats["errors"] for stats in summary.values())
+    return {
+        "concurrency": concurrency,
+        "requests": count,
+        "throughput_rps": round(count / elapsed, 2),
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "p50_ms": round(percentile(all_samples, 0.50) * 1000, 1) if count else None,
+        "p95_ms": round(percentile(all_samples, 0.95) * 1000, 1) if count else None,
+        "p99_ms": round(percentile(all_samples, 0.99) * 1000, 1) if count else None,
+        "endpoints": summary,
+    }
+
+
+def find_saturation(steps: list, min_gain: float, slo_p95_ms: float = None):
+    """
+    The last step before adding users stopped paying off: throughput grew less
+    than `min_gain` (relative), or p95 broke the SLO. None if never reached.
+    """
+    for previous, current in zip(steps, steps[1:]):
+        gained = previous["throughput_rps"] and current["throughput_rps"] / previous["throughput_rps"] - 1
+        if gained < min_gain or (slo_p95_ms and current["p95_ms"] and current["p95_ms"] > slo_p95_ms):
+            return previous
+    return None
+
+
+def render_curve(steps: list, width: int = 40) -> str:
+    """ASCII throughput-versus-latency curve, one row per concurrency level."""
+    top_rps = max((s["throughput_rps"] for s in steps), default=0) or 1
+    lines = [f"{'users':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>6}  throughput"]
+    for s in steps:
+        bar = "█" * max(1, int(s["throughput_rps"] / top_rps * width))
+        lines.append(f"{s['concurrency']:>6} {s['throughput_rps']:>8.2f} {s['p50_ms'] or 0:>9.1f} "
+                     f"{s['p95_ms'] or 0:>9.1f} {s['p99_ms'] or 0:>9.1f} {s['error_rate']:>6.1%}  {bar}")
+    return "\n".join(lines)
+
+
+def write_curve(path: str, steps: list):
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(steps, f, indent=2)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["concurrency", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate"])
+        for s in steps:
+            writer.writerow([s["concurrency"], s["throughput_rps"], s["p50_ms"], s["p95_ms"], s["p99_ms"], s["error_rate"]])
+
+
+def sweep(url: str, args) -> list:
+    think = think_time(args.think)
+    levels = [int(level) for level in args.levels.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    with httpx.Client(base_url=url, timeout=args.request_timeout, limits=limits) as client:
+        print(f"Seeding {args.seed_reports} finished report(s)...")
+        reports = seed_reports(client, args.seed_reports)
+        steps = []
+        for concurrency in levels:
+            print(f"→ {concurrency} user(s) for {args.step_seconds:.0f}s (think {args.think})")
+            steps.append(run_step(client, concurrency, reports, args, think))
+            s = steps[-1]
+            print(f"  {s['throughput_rps']} req/s  p50 {s['p50_ms']}ms  p95 {s['p95_ms']}ms  errors {s['error_rate']:.1%}")
+    return steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator and concurrency sweep for one API worker")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Comma-separated concurrent user counts")
+    parser.add_argument("--step-seconds", type=float, default=60, help="Measurement window per level")
+    parser.add_argument("--warmup-seconds", type=float, default=10, help="Ramp-up before each window")
+    parser.add_argument("--think", default="exp:2", help="none | const:S | uniform:LO:HI | exp:MEAN | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--turns", type=int, default=2, help="Conversation turns per simulated session")
+    parser.add_argument("--progress-polls", type=int, default=3, help="Progress polls before each PDF download")
+    parser.add_argument("--seed-reports", type=int, default=3, help="Finished reports to poll and download")
+    parser.add_argument("--request-timeout", type=float, default=180)
+    parser.add_argument("--saturation-gain", type=float, default=0.10,
+                        help="Throughput growth below this (relative) between levels means saturated")
+    parser.add_argument("--slo-p95-ms", type=float, default=None, help="Also treat a p95 above this as saturated")
+    parser.add_argument("--target-rps", type=float, default=None, help="Print the workers needed for this load")
+    parser.add_argument("--out", default=None, help="Write the curve to .csv or .json")
+    parser.add_argument("--url", default=None, help="Load an already running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.url:
+        steps = sweep(args.url, args)
+    else:
+        with ServerProcess(args, args.port) as server:
+            steps = sweep(server.url, args)
+
+    print("\n" + render_curve(steps))
+    if args.out:
+        write_curve(args.out, steps)
+        print(f"\nCurve written to {args.out}")
+
+    saturated = find_saturation(steps, args.saturation_gain, args.slo_p95_ms)
+    if saturated is None:
+        print("\nNo saturation within the tested levels; extend --levels")
+    else:
+        print(f"\nSaturation: ~{saturated['concurrency']} concurrent users, "
+              f"{saturated['throughput_rps']} req/s at p95 {saturated['p95_ms']}ms per worker")
+        if args.target_rps:
+            workers = math.ceil(args.target_rps / saturated["throughput_rps"])
+            print(f"{args.target_rps} req/s with this request mix needs ~{workers} worker(s)")
@@ -0,0 +1,94 @@
+# otlp_collector.py
+# Local stand-in for an OTLP/HTTP trace collector: prints received spans or appends them to JSONL.
+#
+# Usage:
+#   python -m benchmarks.otlp_collector --port 4318 --out spans.jsonl
+#   TRACING_EXPORTERS=otlp OTEL_EXPORTER_OTLP_ENDPOINT=http://127.0.0.1:4318 uvicorn index:app
+
+import argparse
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.protobuf.json_format import MessageToDict
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse,
+)
+
+
+def decode_spans(body: bytes) -> list:
+    """Flattens an ExportTraceServiceRequest into one dict per span."""
+    request = ExportTraceServiceRequest()
+    request.ParseFromString(body)
+    spans = []
+    for resource_spans in request.resource_spans:
+        for scope_spans in resource_spans.scope_spans:
+            for span in scope_spans.spans:
+                attributes = {
+                    a["key"]: next(iter(a.get("value", {}).values()), None)
+                    for a in MessageToDict(span).get("attributes", [])
+                }
+                spans.append({
+                    "trace_id": span.trace_id.hex(),
+                    "span_id": span.span_id.hex(),
+                    "parent_id": span.parent_span_id.hex() or None,
+                    "name": span.name,
+                    "duration_ms": round((span.end_time_unix_nano - span.start_time_unix_nano) / 1e6, 2),
+                    "status": span.status.code,
+                    "attributes": attributes,
+                })
+    return spans
+
+
+def make_handler(out_path: str = None):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            spans = decode_spans(body)
+
+            with lock:
+                if out_path:
+                    with open(out_path, "a", encoding="utf-8") as f:
+                        for span in spans:
+                            f.write(json.dumps(span) + "\n")
+                else:
+                    for span in spans:
+                        print(f"{span['trace_id'][:8]} {span['name']:<40} {span['duration_ms']:>9.1f}ms")
+
+            data = ExportTraceServiceResponse().SerializeToString()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port: int = 0, out_path: str = None):
+    """Starts the collector on a daemon thread and returns it; `server.server_port` is the bound port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(out_path))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in OTLP/HTTP trace collector")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", default=None, help="Append spans to this JSONL file instead of printing")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.out))
+    print(f"🧪 OTLP collector listening on http://127.0.0.1:{args.port}/v1/traces")
+    server.serve_forever()
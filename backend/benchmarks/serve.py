@@ -0,0 +1,248 @@
+# serve.py
+# Runs the real API (index.py) on one uvicorn worker with local stand-ins for benchmarks:
+# in-memory Mongo (or a local mongod), a fake LLM backend and a stub Resend server.
+#
+# Usage (from backend/):
+#   python -m benchmarks.serve --port 8800 --llm-p50 0.8
+#   python -m benchmarks.serve --mongo-uri mongodb://127.0.0.1:27017 --llm-backend replay
+#
+# Mongo operations are observed into mongo_operation_duration_seconds (the
+# pymongo command listener does it for a real mongod; the in-memory stand-in is
+# wrapped to do the same), so benchmarks read them from /metrics.
+
+import argparse
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# mongomock method -> the command pymongo would send for it
+MONGO_COMMANDS = {
+    "find": "find",
+    "find_one": "find",
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "estimated_document_count": "count",
+    "distinct": "distinct",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "create_index": "createIndexes",
+    "create_indexes": "createIndexes",
+    "bulk_write": "bulkWrite",
+}
+
+# ==============================
+# 🔹 STAND-INS
+# ==============================
+def install_memory_mongo():
+    """Replaces pymongo.MongoClient with mongomock and reports its operations as metrics."""
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("The in-memory Mongo stand-in needs `pip install mongomock` (or pass --mongo-uri)")
+    import pymongo
+    from metrics import mongo_operation_duration
+
+    depth = threading.local()
+
+    def observed(command, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # mongomock implements some methods on top of others; count the outer call only
+            if getattr(depth, "value", 0):
+                return method(*args, **kwargs)
+            depth.value = 1
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                depth.value = 0
+                mongo_operation_duration.labels(command, outcome).observe(time.perf_counter() - started)
+        return wrapper
+
+    for name, command in MONGO_COMMANDS.items():
+        setattr(mongomock.Collection, name, observed(command, getattr(mongomock.Collection, name)))
+
+    class MemoryClient(mongomock.MongoClient):
+        def __init__(self, host=None, *args, **kwargs):
+            kwargs.pop("event_listeners", None)
+            super().__init__(host, *args, **kwargs)
+
+    pymongo.MongoClient = MemoryClient
+
+
+def start_resend_stub(latency: float = 0.15, port: int = 0, rate_limit: float = 0):
+    """
+    Local stand-in for the Resend API (POST /emails); returns the server. Like
+    Resend, a repeated Idempotency-Key gets the first email's id back, and with
+    rate_limit set, requests beyond that many per second get a 429.
+    """
+    lock = threading.Lock()
+    recent = []  # accepted requests within the last second
+    sent = {}  # idempotency key -> email id
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            key = self.headers.get("Idempotency-Key")
+            with lock:
+                now = time.monotonic()
+                recent[:] = [t for t in recent if now - t < 1]
+                limited = rate_limit and len(recent) >= rate_limit
+                if limited:
+                    server.rate_limited += 1
+                else:
+                    recent.append(now)
+            if limited:
+                self._reply(429, {"statusCode": 429, "name": "rate_limit_exceeded",
+                                  "message": "Too many requests. You can only make 2 requests per second."})
+                return
+            time.sleep(latency)
+            with lock:
+                if key in sent:
+                    server.deduplicated += 1
+                    email_id = sent[key]
+                else:
+                    server.accepted += 1
+                    email_id = str(uuid.uuid4())
+                    if key:
+                        sent[key] = email_id
+            self._reply(200, {"id": email_id})
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.accepted = server.deduplicated = server.rate_limited = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ==============================
+# 🔹 SERVER PROCESS
+# ==============================
+def add_arguments(parser):
+    """Stand-in options shared by every benchmark that launches the server."""
+    parser.add_argument("--mongo-uri", default=None, help="Local mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--llm-backend", default="synthetic", choices=["synthetic", "replay"])
+    parser.add_argument("--llm-p50", type=float, default=0.8, help="Synthetic LLM median latency (s)")
+    parser.add_argument("--llm-tail-rate", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7, help="Synthetic LLM random seed")
+    parser.add_argument("--resend-latency", type=float, default=0.15, help="Stub Resend latency (s)")
+    parser.add_argument("--resend-rate-limit", type=float, default=0, help="Stub Resend requests/s before 429s (0: none)")
+
+
+class ServerProcess:
+    """Starts `python -m benchmarks.serve` in a subprocess and stops it on exit."""
+
+    def __init__(self, args, port: int = 8800, log_path: str = None, poll_interval: float = 0.5,
+                 wait_for_warmup: bool = True):
+        self.port = port
+        self.poll_interval = poll_interval
+        # Benchmarks measure a warm worker: wait for the startup warm-up to build the agents
+        self.wait_for_warmup = wait_for_warmup
+        self.ready_seconds = None
+        self.url = f"http://127.0.0.1:{port}"
+        self.command = [
+            sys.executable, "-m", "benchmarks.serve",
+            "--port", str(port),
+            "--llm-backend", args.llm_backend,
+            "--llm-p50", str(args.llm_p50),
+            "--llm-tail-rate", str(args.llm_tail_rate),
+            "--llm-error-rate", str(args.llm_error_rate),
+            "--seed", str(args.seed),
+            "--resend-latency", str(args.resend_latency),
+            "--resend-rate-limit", str(args.resend_rate_limit),
+        ]
+        if args.mongo_uri:
+            self.command += ["--mongo-uri", args.mongo_uri]
+        self.log_path = log_path or os.path.join(tempfile.gettempdir(), f"benchmark_server_{port}.log")
+        self.process = None
+
+    def __enter__(self):
+        self._log = open(self.log_path, "w")
+        print(f"Starting benchmark API on {self.url} (log: {self.log_path})")
+        self.started = started = time.perf_counter()
+        env = {**os.environ, "WARMUP_ON_STARTUP": "true"} if self.wait_for_warmup else None
+        self.process = subprocess.Popen(self.command, stdout=self._log, stderr=subprocess.STDOUT, env=env)
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Benchmark server exited, see {self.log_path}")
+            try:
+                with urllib.request.urlopen(f"{self.url}/health", timeout=2) as response:
+                    # Seconds from process start to the first successful /health
+                    self.ready_seconds = self.ready_seconds or time.perf_counter() - started
+                    if not self.wait_for_warmup or json.load(response).get("agents_ready", True):
+                        return self
+            except OSError:
+                pass
+            time.sleep(self.poll_interval)
+        raise RuntimeError(f"Benchmark server did not become healthy, see {self.log_path}")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with local stand-ins for benchmarking")
+    parser.add_argument("--port", type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    # Configuration is read at import time, so set it before importing the app
+    os.environ["LLM_BACKEND"] = args.llm_backend
+    os.environ["LLM_SYNTHETIC_P50_SECONDS"] = str(args.llm_p50)
+    os.environ["LLM_SYNTHETIC_TAIL_RATE"] = str(args.llm_tail_rate)
+    os.environ["LLM_SYNTHETIC_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["LLM_SYNTHETIC_SEED"] = str(args.seed)
+    os.environ.setdefault("RESEND_API_KEY", "re_benchmark")
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        install_memory_mongo()
+
+    import resend
+    import uvicorn
+
+    resend_stub = start_resend_stub(args.resend_latency, rate_limit=args.resend_rate_limit)
+    resend.api_url = f"http://127.0.0.1:{resend_stub.server_port}"
+
+    from index import app
+
+    print(f"🧪 Benchmark API on http://127.0.0.1:{args.port} (LLM: {args.llm_backend}, "
+          f"Mongo: {args.mongo_uri or 'in-memory'}, Resend stub: {resend.api_url})")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, workers=1, log_level="warning")
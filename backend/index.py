@@ -1,12 +1,17 @@
 # api.py
 # FastAPI REST API for AI Agent Consultant System
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse, FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict
 from datetime import datetime
+from contextlib import asynccontextmanager
+import asyncio
+import threading
 import uvicorn
 import os
 
@@ -15,29 +20,89 @@ from agents.ai_consultant_system import (
     start_conversation,
     continue_conversation,
     generate_preview_report,
-    submit_lead_and_generate_full_report,
+    submit_lead_and_schedule_full_report,
     refine_report,
     get_session_report,
     get_progress,
     get_random_social_proof,
     get_lead_analytics,
     get_top_leads,
+    get_speculation_stats,
+    get_cancellation_stats,
+    get_llm_usage_stats,
+    get_session_traces,
     get_session,
+    find_export_sessions,
+    warm_up,
+    agents_ready,
+    mongo_client,
     IdeaRefinementManager
 )
-from pdf_generator import generate_pdf_report  # ADD THIS IMPORT
-from io import BytesIO
+import resilience
+from resilience import DependencyUnavailable, dependency_status
+import metrics
+import tracing
+import profiling
+from pdf_cache import get_report_pdf_file
+from pdf_renderer import pdf_renderer
+from report_export import EXPORT_FORMATS, export_archive
+from agents.speculation import preview_jobs, report_jobs
+from agents.report_scheduler import report_scheduler
+from agents.cancellation import CancelToken, GenerationCancelled, cancel_session
+from agents import metering
+from agents.email_outbox import outbox as email_outbox
+from agents.crew_pool import pool_stats
 
 
+# ==============================
+# 🔹 STARTUP/SHUTDOWN (LIFESPAN)
+# ==============================
+# Agents, LLM clients and the Mongo connection are created on first use; with
+# warm-up on, a background thread builds them right after startup instead, so
+# the worker serves /health immediately and the first funnel request is not slow.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run on API startup and shutdown."""
+    print("🚀 AI Agent Consultant API starting up...")
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+    # Drain emails queued before a restart
+    email_outbox.start()
+    print("✅ API ready to receive requests!")
+    yield
+    print("👋 AI Agent Consultant API shutting down...")
+    report_scheduler.shutdown()
+    email_outbox.stop()
+    metering.recorder.flush()
+    preview_jobs.shutdown()
+    report_jobs.shutdown()
+    pdf_renderer.shutdown()
+    tracing.shutdown()
+
 # ==============================
 # 🔹 FASTAPI APP SETUP
 # ==============================
 app = FastAPI(
     title="AI Agent Consultant API",
     description="Two-stage lead generation funnel with conversational refinement",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+# How often long-running endpoints check whether the client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+
+# Request latency per route for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# One trace per request, continued into the report jobs and crew stages it starts
+app.add_middleware(tracing.TracingMiddleware)
+
+# On-demand profiling: counts requests for profiling windows, X-Profile per-request cProfile
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # CORS middleware for frontend connections
 app.add_middleware(
     CORSMiddleware,
@@ -170,16 +235,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check with system status."""
+    """Detailed health check with system status (503 when the database is unreachable)."""
     try:
-        # Test database connection
-        from agents.ai_consultant_system import sessions
-        sessions.find_one()
+        # Ping with the client's bounded timeouts, off the event loop
+        await run_in_threadpool(resilience.mongo.call, mongo_client.admin.command, "ping")
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
     
-    return JSONResponse(status_code=200, content={"status": "healthy", "database": db_status, "timestamp": datetime.utcnow().isoformat()})
+    healthy = db_status == "connected"
+    return JSONResponse(status_code=200 if healthy else 503, content={"status": "healthy" if healthy else "unhealthy", "database": db_status, "dependencies": dependency_status(), "report_queue": report_scheduler.snapshot(), "agents_ready": agents_ready(), "timestamp": datetime.utcnow().isoformat()})
 
     # return {
     #     "status": "healthy",
@@ -187,6 +252,71 @@ async def health_check():
     #     "timestamp": datetime.utcnow().isoformat()
     # }
 
+async def run_until_disconnect(request: Request, session_id: str, kind: str, fn, *args):
+    """
+    Runs a cancellable generation in the threadpool and cancels it if the client
+    goes away (tab closed, request aborted) before it finishes.
+    """
+    token = CancelToken(session_id, kind)
+    job = asyncio.ensure_future(run_in_threadpool(fn, *args, cancel_token=token))
+    while True:
+        done, _ = await asyncio.wait({job}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return job.result()
+        if await request.is_disconnected():
+            token.cancel("client disconnected")
+            return await job
+
+# ==============================
+# 🔹 METRICS
+# ==============================
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+def _background_jobs():
+    queue = report_scheduler.snapshot()
+    return {
+        ("report",): sum(tier["running"] for tier in queue.values()),
+        ("speculative_preview",): preview_jobs.running_count(),
+        ("speculative_report",): report_jobs.running_count(),
+    }
+
+metrics.Gauge("background_jobs_in_flight", "Background jobs currently running", ("pool",), collect=_background_jobs)
+metrics.Gauge(
+    "report_queue_depth", "Report jobs waiting for a worker", ("tier",),
+    collect=lambda: {(tier,): stats["queued"] for tier, stats in report_scheduler.snapshot().items()},
+)
+metrics.Gauge(
+    "dependency_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("dependency",),
+    collect=lambda: {(name,): _CIRCUIT_STATES[dep["breaker"]["state"]] for name, dep in dependency_status().items()},
+)
+metrics.Gauge(
+    "dependency_calls_in_flight", "Calls holding a bulkhead slot", ("dependency",),
+    collect=lambda: {(name,): dep["bulkhead"]["in_flight"] for name, dep in dependency_status().items()},
+)
+metrics.Gauge(
+    "pdf_render_pending", "PDF renders queued or running in the render workers",
+    collect=lambda: {(): pdf_renderer.snapshot()["pending"]},
+)
+metrics.Gauge(
+    "email_outbox_messages", "Emails in the outbox by status", ("status",),
+    collect=lambda: {(status,): count for status, count in email_outbox.counts().items()},
+)
+metrics.Gauge(
+    "crew_pool_crews", "Prepared crews per workflow, idle or checked out", ("workflow", "state"),
+    collect=lambda: {(name, state): stats[state] for name, stats in pool_stats().items() for state in ("idle", "in_use")},
+)
+metrics.Gauge(
+    "crew_pool_checkouts", "Crew checkouts since start that built a new crew or reused one", ("workflow", "source"),
+    collect=lambda: {(name, source): stats[source] for name, stats in pool_stats().items() for source in ("built", "reused")},
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    # Collectors such as the email outbox gauge query Mongo; keep them off the event loop
+    content = await run_in_threadpool(metrics.render_latest)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE_LATEST)
+
 # ==============================
 # 🔹 CONVERSATION FLOW ENDPOINTS
 # ==============================
@@ -199,7 +329,7 @@ async def api_start_conversation(submission: IdeaSubmission):
     Returns session_id and first agent response.
     """
     try:
-        result = start_conversation(submission.user_id, submission.idea)
+        result = await run_in_threadpool(start_conversation, submission.user_id, submission.idea)
         
         # Add social proof
         social_proof = get_random_social_proof()
@@ -227,7 +357,7 @@ async def api_continue_conversation(message: ConversationMessage):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        result = continue_conversation(message.session_id, message.message)
+        result = await run_in_threadpool(continue_conversation, message.session_id, message.message)
         
         # Add social proof
         social_proof = get_random_social_proof()
@@ -240,7 +370,7 @@ async def api_continue_conversation(message: ConversationMessage):
             next_step=result["next_step"],
             social_proof=social_proof
         )
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error continuing conversation: {str(e)}")
@@ -250,7 +380,7 @@ async def api_continue_conversation(message: ConversationMessage):
 # ==============================
 
 @app.post("/preview/generate", response_model=PreviewResponse)
-async def api_generate_preview(query: SessionQuery):
+async def api_generate_preview(query: SessionQuery, request: Request):
     """
     Step 3: Generate FREE preview report (requirements only).
     
@@ -262,7 +392,7 @@ async def api_generate_preview(query: SessionQuery):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        result = generate_preview_report(query.session_id)
+        result = await run_until_disconnect(request, query.session_id, "preview", generate_preview_report, query.session_id)
         
         # Add social proof
         social_proof = get_random_social_proof()
@@ -274,22 +404,19 @@ async def api_generate_preview(query: SessionQuery):
             next_step=result["next_step"],
             social_proof=social_proof
         )
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating preview: {str(e)}")
 
 @app.post("/lead/capture", response_model=FullReportResponse)
-async def api_capture_lead(
-    lead_data: LeadCapture,
-    background_tasks: BackgroundTasks
-):
+async def api_capture_lead(lead_data: LeadCapture):
     """
     Step 4: Capture lead and generate full report.
     
     This endpoint:
-    1. Saves lead information
-    2. Triggers full report generation (background task)
+    1. Saves lead information (synchronously, so the lead_id is returned)
+    2. Queues full report generation by lead score (report scheduler)
     3. Sends email to user
     4. Notifies sales team
     
@@ -308,9 +435,9 @@ async def api_capture_lead(
                 detail="Lead already captured for this session"
             )
         
-        # Run report generation in background
-        background_tasks.add_task(
-            submit_lead_and_generate_full_report,
+        # Save the lead now; the report runs on the report workers, highest score first
+        result = await run_in_threadpool(
+            submit_lead_and_schedule_full_report,
             lead_data.session_id,
             lead_data.email,
             lead_data.name,
@@ -319,13 +446,13 @@ async def api_capture_lead(
         
         return FullReportResponse(
             session_id=lead_data.session_id,
-            lead_id="generating",  # Actual lead_id will be in DB once background task completes
+            lead_id=result["lead_id"],
             status="generating",
             email_sent=False,  # Will be true once background task completes
             refinements_left=2,
             message="Your report is being generated. You'll receive an email shortly!"
         )
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error capturing lead: {str(e)}")
@@ -348,7 +475,7 @@ async def api_get_report(query: SessionQuery):
             raise HTTPException(status_code=404, detail="Session not found")
         
         return result
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving report: {str(e)}")
@@ -356,7 +483,7 @@ async def api_get_report(query: SessionQuery):
 @app.post("/report/refine", response_model=RefinementResponse)
 async def api_refine_report(
     refinement: RefinementRequest,
-    background_tasks: BackgroundTasks
+    request: Request
 ):
     """
     Step 5: Refine report with additional information.
@@ -388,15 +515,33 @@ async def api_refine_report(
                 cta_url="https://calendly.com/youragency/consultation"
             )
         
-        # Run refinement in background
-        result = refine_report(refinement.session_id, refinement.additional_info)
+        # Run refinement (stopped between LLM calls if the client disconnects)
+        result = await run_until_disconnect(
+            request, refinement.session_id, "refinement",
+            refine_report, refinement.session_id, refinement.additional_info
+        )
         
         return RefinementResponse(**result)
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error refining report: {str(e)}")
 
+@app.post("/session/{session_id}/cancel")
+async def api_cancel_session(session_id: str):
+    """
+    Cancel the session's in-flight generations (preview, refinement, speculative jobs).
+    
+    Generations stop before their next LLM call. Finished work is kept:
+    resubmitting the same refinement resumes it instead of starting over.
+    """
+    session = get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    cancelled = cancel_session(session_id)
+    return {"session_id": session_id, "cancelled": cancelled}
+
 # ==============================
 # 🔹 PROGRESS & STATUS ENDPOINTS
 # ==============================
@@ -416,7 +561,7 @@ async def api_get_progress(session_id: str):
             raise HTTPException(status_code=404, detail="Session not found")
         
         return ProgressResponse(**progress)
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting progress: {str(e)}")
@@ -480,7 +625,7 @@ async def api_get_full_session(session_id: str):
         session['_id'] = str(session['_id'])
         
         return session
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting session: {str(e)}")
@@ -517,6 +662,152 @@ async def api_get_top_leads(limit: int = 10):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting top leads: {str(e)}")
 
+@app.get("/analytics/speculation")
+async def api_get_speculation_stats(days: int = 7):
+    """
+    Get daily speculative generation metrics (hit rate, tokens spent vs. wasted).
+    
+    Admin endpoint for tuning SPECULATIVE_REPORT_MIN_SCORE and the daily budget.
+    TODO: Add authentication in production.
+    """
+    try:
+        return {"days": get_speculation_stats(days)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting speculation stats: {str(e)}")
+
+@app.get("/analytics/cancellations")
+async def api_get_cancellation_stats(days: int = 7):
+    """
+    Get daily cancelled generations per kind and the estimated tokens saved.
+    
+    TODO: Add authentication in production.
+    """
+    try:
+        return {"days": get_cancellation_stats(days)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cancellation stats: {str(e)}")
+
+@app.get("/analytics/llm-usage")
+async def api_get_llm_usage(days: int = 7, session_id: Optional[str] = None):
+    """
+    Get LLM tokens, latency, retries and cost by stage, agent and model.
+    
+    Without session_id this also returns cost per lead; with it, one session's breakdown.
+    TODO: Add authentication in production.
+    """
+    try:
+        return await run_in_threadpool(get_llm_usage_stats, days, session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting LLM usage: {str(e)}")
+
+@app.get("/admin/traces/{session_id}")
+async def api_get_session_traces(session_id: str, format: str = "json", limit: int = 20):
+    """
+    Get the span waterfall of a session's recent traces (API -> report job ->
+    crew stages -> LLM calls -> PDF -> Resend). format=text renders ASCII bars.
+    
+    TODO: Add authentication in production.
+    """
+    try:
+        traces = await run_in_threadpool(get_session_traces, session_id, limit)
+        if format == "text":
+            return PlainTextResponse(tracing.render_waterfall_text(traces))
+        return {"session_id": session_id, "traces": traces}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting traces: {str(e)}")
+
+@app.post("/admin/profile/{kind}")
+async def api_start_profile(kind: str, seconds: Optional[float] = None, requests: Optional[int] = None,
+                            interval_ms: Optional[float] = None, include_idle: bool = False,
+                            top: int = 25, frames: int = 16):
+    """
+    Profile this worker for the next `seconds` or `requests` (whichever ends first).
+    
+    kind=cpu samples every thread's stack (interval_ms, include_idle);
+    kind=memory diffs tracemalloc snapshots (top, frames). Download the result
+    from /admin/profiles/{profile_id} once its status is done.
+    TODO: Add authentication in production.
+    """
+    if kind not in profiling.WINDOWS:
+        raise HTTPException(status_code=404, detail=f"Unknown profile kind '{kind}'")
+    params = {"interval_ms": interval_ms, "include_idle": include_idle} if kind == "cpu" else {"top": top, "frames": frames}
+    try:
+        profile = profiling.start_window(kind, seconds=seconds, requests=requests, **params)
+        return profile.to_dict()
+    except profiling.ProfilingBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting profile: {str(e)}")
+
+@app.post("/admin/profile/{kind}/stop")
+async def api_stop_profile(kind: str):
+    """
+    End a running cpu or memory profile early.
+    
+    TODO: Add authentication in production.
+    """
+    profile = profiling.stop_window(kind)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No {kind} profile is running")
+    return profile.to_dict()
+
+@app.get("/admin/profiles")
+async def api_list_profiles():
+    """
+    List this worker's recent profiles (cpu, memory and per-request cProfile).
+    
+    TODO: Add authentication in production.
+    """
+    return {"profiles": profiling.profiles.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def api_download_profile(profile_id: str, format: str = "collapsed"):
+    """
+    Download a profile: collapsed (flamegraph.pl / speedscope stacks), text,
+    pstats (request profiles, for snakeviz) or json (metadata and summary).
+    
+    TODO: Add authentication in production.
+    """
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if profile.status == "running" and format != "json":
+        raise HTTPException(status_code=409, detail="Profile is still running")
+    try:
+        body, media_type, filename = profiling.render(profile, format)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Profile has no '{format}' output; available: {sorted(profile.outputs)} or json")
+    return Response(body, media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.get("/admin/export")
+async def api_bulk_export(min_score: Optional[int] = None, max_score: Optional[int] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          stage: Optional[str] = None, formats: str = "pdf,json", limit: int = 500):
+    """
+    Download many sessions at once as a ZIP archive, streamed while it is built.
+    
+    Filters: lead score range (min_score, max_score), creation date range
+    (since, until; ISO dates) and stage. formats is pdf, json or both: PDFs
+    for finished reports, JSON for every matching session. At most `limit`
+    sessions, newest first.
+    TODO: Add authentication in production.
+    """
+    requested = [f.strip() for f in formats.split(",") if f.strip()]
+    if not requested or any(f not in EXPORT_FORMATS for f in requested):
+        raise HTTPException(status_code=400, detail=f"formats must be a comma-separated subset of {list(EXPORT_FORMATS)}")
+    if min_score is not None and max_score is not None and min_score > max_score:
+        raise HTTPException(status_code=400, detail="min_score is greater than max_score")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    
+    cursor = find_export_sessions(min_score, max_score, since, until, stage, limit)
+    filename = f"ai-agent-reports-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.zip"
+    return StreamingResponse(
+        export_archive(cursor, requested),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @app.get("/analytics/lead/{lead_id}")
 async def api_get_lead_details(lead_id: str):
     """
@@ -537,7 +828,7 @@ async def api_get_lead_details(lead_id: str):
         lead['_id'] = str(lead['_id'])
         
         return lead
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting lead details: {str(e)}")
@@ -560,7 +851,7 @@ async def api_get_full_session(session_id: str):
         session['_id'] = str(session['_id'])
         
         return session
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting session: {str(e)}")
@@ -570,11 +861,13 @@ async def api_get_full_session(session_id: str):
 # ==============================
 
 @app.get("/report/{session_id}/download-pdf")
-async def api_download_report_pdf(session_id: str):
+async def api_download_report_pdf(session_id: str, request: Request):
     """
     Downloads the complete report as a PDF file.
     
-    Returns a PDF file for download.
+    Returns a PDF file for download. The file is streamed from disk in chunks,
+    with Content-Length, an ETag (If-None-Match gets a 304) and Range /
+    If-Range support for resumed downloads.
     """
     try:
         # Get session data
@@ -590,22 +883,31 @@ async def api_download_report_pdf(session_id: str):
                 detail="Report not complete yet. Please wait for generation to finish."
             )
         
-        # Generate PDF
-        pdf_bytes = generate_pdf_report(session)
+        # Rendered once per report version into the PDF cache, then streamed from there
+        # (off the event loop: a miss waits for a render worker)
+        pdf = await run_in_threadpool(get_report_pdf_file, session)
+        
+        headers = {"Cache-Control": "private, no-cache"}
+        if pdf.etag:
+            headers["ETag"] = pdf.etag
+            if pdf.etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+                pdf.discard()
+                return Response(status_code=304, headers=headers)
         
         # Create filename
         filename = f"ai-agent-report-{session_id[:8]}.pdf"
         
         # Return PDF as downloadable file
-        return StreamingResponse(
-            BytesIO(pdf_bytes),
+        return FileResponse(
+            pdf.path,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
+            filename=filename,
+            stat_result=pdf.stat,
+            headers=headers,
+            background=BackgroundTask(pdf.discard) if pdf.temporary else None,
         )
         
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         print(f"[PDF ERROR] {e}")
@@ -635,7 +937,7 @@ async def webhook_report_complete(session_id: str):
             "session_id": session_id,
             "timestamp": datetime.utcnow().isoformat()
         }
-    except HTTPException:
+    except (HTTPException, DependencyUnavailable, GenerationCancelled):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Webhook error: {str(e)}")
@@ -649,26 +951,24 @@ async def not_found_handler(request, exc):
     
     return JSONResponse(status_code=404, content={ "error": "Not Found", "message": str(exc.detail) if hasattr(exc, 'detail') else "Resource not found",})
 
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable_handler(request, exc):
+    """Fail fast with a degraded response when a breaker is open or a bulkhead is full."""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))},
+        content={"error": "Service Degraded", "dependency": exc.dependency, "message": "This feature is temporarily unavailable. Please try again shortly.",}
+    )
+
+@app.exception_handler(GenerationCancelled)
+async def generation_cancelled_handler(request, exc):
+    """499 (client closed request): nobody is waiting for this response any more."""
+    return JSONResponse(status_code=499, content={"error": "Cancelled", "message": f"Generation cancelled: {exc.reason}",})
+
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
     return JSONResponse(status_code=500, content={  "error": "Internal Server Error", "message": "An unexpected error occurred. Please try again later.",})    
 
-# ==============================
-# 🔹 STARTUP/SHUTDOWN EVENTS
-# ==============================
-
-@app.on_event("startup")
-async def startup_event():
-    """Run on API startup."""
-    print("🚀 AI Agent Consultant API starting up...")
-    print("📊 Connecting to database...")
-    print("✅ API ready to receive requests!")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Run on API shutdown."""
-    print("👋 AI Agent Consultant API shutting down...")
-
 # ==============================
 # 🔹 RUN SERVER
 # ==============================
@@ -0,0 +1,257 @@
+# pdf_cache.py
+# Disk cache for rendered report PDFs, so repeat downloads and the report email
+# reuse one render instead of running reportlab again.
+#
+# Entries are keyed by a hash of everything the PDF shows (idea, lead score,
+# report sections) plus LAYOUT_VERSION, so a changed report never matches an
+# old entry. Files live in PDF_CACHE_DIR as <session_id>-<key>.pdf; a hit
+# refreshes the file's mtime and the least recently used files are evicted
+# once the directory grows past PDF_CACHE_MAX_MB. Refinements drop a
+# session's entries explicitly (invalidate) so old versions don't wait for eviction.
+#
+# Render workers write straight into the cache directory (get_report_pdf_file),
+# so downloads stream the file from disk and the PDF is never held in memory
+# by the API process.
+
+import base64
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+
+from metrics import email_attachment_encode_duration, pdf_cache_requests
+from pdf_renderer import PDF_RENDER_TIMEOUT_SECONDS, pdf_renderer
+
+PDF_CACHE_ENABLED = os.getenv("PDF_CACHE_ENABLED", "true").lower() == "true"
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ai-consultant-pdf-cache"))
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "256"))
+
+# Render temp files older than this were left by a render that hung or crashed
+STALE_TEMP_SECONDS = 2 * PDF_RENDER_TIMEOUT_SECONDS
+
+# Bump when pdf_generator's output changes for the same report content
+LAYOUT_VERSION = 3
+
+# The parts of the session the PDF renders
+REPORT_SECTIONS = ("requirement_gathering", "technical_architecture", "ux_design", "business_strategy")
+
+
+def cache_key(session: dict) -> str:
+    """Content hash of what the PDF shows for this session."""
+    context = session.get("context") or {}
+    payload = {
+        "layout": LAYOUT_VERSION,
+        "session_id": session.get("session_id"),
+        "idea": session.get("idea"),
+        "lead_score": session.get("lead_score"),
+        "sections": {key: context.get(key) for key in REPORT_SECTIONS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """Rendered PDFs on disk with LRU eviction by total size."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._bytes = None  # running total; rescanned when it passes max_bytes
+
+    def _prefix(self, session_id: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_-]", "_", session_id or "none") + "-"
+
+    def _path(self, session_id: str, key: str) -> str:
+        return os.path.join(self.directory, f"{self._prefix(session_id)}{key[:32]}.pdf")
+
+    def touch(self, session_id: str, key: str):
+        """Path of the cached PDF, marked as recently used, or None if it is not cached."""
+        path = self._path(session_id, key)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            return None
+
+    def temp_path(self) -> str:
+        """A new empty file in the cache directory, to render into and then commit()."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, session_id: str, key: str, tmp_path: str) -> str:
+        """Moves a fully written temp_path() file into place; returns the cached PDF's path."""
+        path = self._path(session_id, key)
+        # Write-then-rename so a concurrent reader never sees a partial file
+        try:
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            if self._bytes is None or self._bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        """
+        Deletes stale render temp files, then least recently used PDFs until the
+        directory fits in max_bytes.
+        """
+        entries, temp_bytes = [], 0
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((".pdf", ".tmp")):
+                continue
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".pdf"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif stat.st_mtime < stale_before:
+                    os.remove(entry.path)
+                else:
+                    temp_bytes += stat.st_size  # a render in progress
+            except FileNotFoundError:
+                continue
+        total = temp_bytes + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._bytes = total
+
+    def invalidate(self, session_id: str) -> int:
+        """Drops every cached PDF of a session; returns how many were removed."""
+        prefix, removed = self._prefix(session_id), 0
+        if not os.path.isdir(self.directory):
+            return 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix) and entry.name.endswith(".pdf"):
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                with self._lock:
+                    if self._bytes is not None:
+                        self._bytes -= size
+        return removed
+
+    def key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def release_key(self, key: str, lock: threading.Lock):
+        """Forgets `lock` (held by the caller) unless the key already maps to a newer lock."""
+        with self._lock:
+            if self._key_locks.get(key) is lock:
+                del self._key_locks[key]
+
+
+pdf_cache = PdfCache(PDF_CACHE_DIR, int(PDF_CACHE_MAX_MB * 1024 * 1024))
+
+
+class ReportPdf:
+    """A rendered report PDF on disk, with the ETag it is served under."""
+
+    def __init__(self, path: str, key, temporary: bool = False):
+        self.path = path
+        self.stat = os.stat(path)
+        # The content key names what the PDF shows; the inode tells renders of it apart
+        self.etag = f'"{key[:32]}-{self.stat.st_ino:x}"' if key else None
+        self.temporary = temporary  # not cached: the caller deletes it once sent
+
+    def discard(self):
+        if self.temporary:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _cached(session_id: str, key: str):
+    path = pdf_cache.touch(session_id, key)
+    if path is None:
+        return None
+    try:
+        pdf = ReportPdf(path, key)
+    except FileNotFoundError:  # invalidated in between
+        return None
+    pdf_cache_requests.labels("hit").inc()
+    return pdf
+
+
+def _render_temporary(session: dict) -> ReportPdf:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        pdf_renderer.render_to_file(session, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return ReportPdf(path, None, temporary=True)
+
+
+def get_report_pdf_file(session: dict) -> ReportPdf:
+    """The session's report PDF as a file, rendered only if no render of this content is cached."""
+    if not PDF_CACHE_ENABLED:
+        return _render_temporary(session)
+
+    session_id, key = session.get("session_id"), cache_key(session)
+    pdf = _cached(session_id, key)
+    if pdf is not None:
+        return pdf
+
+    # One render per key: concurrent requests for the same report wait for it
+    lock = pdf_cache.key_lock(key)
+    with lock:
+        try:
+            pdf = _cached(session_id, key)
+            if pdf is not None:
+                return pdf
+            pdf_cache_requests.labels("miss").inc()
+            try:
+                tmp_path = pdf_cache.temp_path()
+            except OSError as e:
+                print(f"[PDF CACHE] Could not store PDF for {session_id}: {e}")
+                return _render_temporary(session)
+            try:
+                pdf_renderer.render_to_file(session, tmp_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            return ReportPdf(pdf_cache.commit(session_id, key, tmp_path), key)
+        finally:
+            # Dropped by its first holder while still held: threads already waiting on it find
+            # the PDF cached, later ones take a new lock. Waiters never touch a newer lock.
+            pdf_cache.release_key(key, lock)
+
+
+def get_report_pdf_base64(session: dict) -> str:
+    """
+    The session's report PDF base64-encoded, as email attachments carry it.
+    Encodes straight from the (usually cached) file through a memory map, so
+    the PDF is not read into a bytes object first.
+    """
+    pdf = get_report_pdf_file(session)
+    try:
+        with email_attachment_encode_duration.time():
+            with open(pdf.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return base64.b64encode(view).decode("ascii")
+    finally:
+        pdf.discard()
@@ -1,221 +1,289 @@
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle, ListStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle, Image
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_JUSTIFY
+from xml.sax.saxutils import escape
 from io import BytesIO
-import markdown
+from PIL import Image as PILImage
 from datetime import datetime
 import os
+from metrics import pdf_render_duration
+from pdf_markdown import MarkdownCompiler, SectionMemo
+import tracing
+from profiling import profiled
 
-def add_logo_header(canvas, doc):
-    """Add CiphersLab logo to every page"""
-    canvas.saveState()
-    
-    # Add logo if file exists
-    logo_path = os.path.join(os.path.dirname(__file__), 'cipherslab-logo.png')
-    if os.path.exists(logo_path):
-        # Logo in top-left corner
-        canvas.drawImage(logo_path, 0.5*inch, doc.height + 1.5*inch, 
-                        width=0.4*inch, height=0.4*inch, 
-                        preserveAspectRatio=True, mask='auto')
-        
-        # Company name next to logo
-        canvas.setFont('Helvetica-Bold', 10)
-        canvas.setFillColor(colors.HexColor('#111827'))
-        canvas.drawString(1*inch, doc.height + 1.6*inch, 'CiphersLab')
-    
-    # Page number at bottom
-    canvas.setFont('Helvetica', 9)
-    canvas.setFillColor(colors.HexColor('#6b7280'))
-    page_num = canvas.getPageNumber()
-    text = f"Page {page_num}"
-    canvas.drawRightString(doc.width + 1*inch, 0.5*inch, text)
-    
-    canvas.restoreState()
+# Logo next to the company name in the page header, and on the title page
+PDF_LOGO_PATH = os.getenv("PDF_LOGO_PATH", os.path.join(os.path.dirname(__file__), 'cipherslab-logo.png'))
+# The logo is drawn at most 1.5 inches wide; larger images are downscaled once
+LOGO_MAX_PIXELS = 300
+# Compiled report sections kept per process, keyed by their markdown's hash
+PDF_SECTION_MEMO_SIZE = int(os.getenv("PDF_SECTION_MEMO_SIZE", "64"))
 
-def generate_pdf_report(session_data: dict) -> bytes:
+
+class PDFRenderer:
     """
-    Generates a professional PDF report from session data.
-    Returns PDF as bytes.
+    Renders report PDFs with styles and the logo prepared once, not per render.
+
+    The stylesheet, paragraph and table styles are built in __init__, the logo is
+    decoded and downscaled once, and the page header (logo + company name) is
+    drawn into a form on the first page of each document and reused on the others.
+    Section markdown is compiled by pdf_markdown and memoized by content, so
+    re-rendering a refined report only recompiles the sections that changed.
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    
-    # Container for PDF elements
-    elements = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e3a8a'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=18,
-        textColor=colors.HexColor('#3b82f6'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-    
-    subheading_style = ParagraphStyle(
-        'CustomSubHeading',
-        parent=styles['Heading3'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=8,
-        spaceBefore=8
-    )
-    
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['BodyText'],
-        fontSize=11,
-        alignment=TA_JUSTIFY,
-        spaceAfter=12
-    )
-    
-    # Title Page
-    elements.append(Spacer(1, 1*inch))
-    elements.append(Paragraph("AI Agent Strategic Report", title_style))
-    elements.append(Spacer(1, 0.3*inch))
-
-    # Add logo to title page
-    logo_path = os.path.join(os.path.dirname(__file__), 'cipherslab-logo.png')
-    if os.path.exists(logo_path):
-        logo = Image(logo_path, width=1.5*inch, height=1.5*inch)
-        logo.hAlign = 'CENTER'
-        elements.append(logo)
-    
 
-    # Company name
-    company_style = ParagraphStyle(
-        'Company',
-        parent=styles['Normal'],
-        fontSize=20,
-        textColor=colors.HexColor('#111827'),
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold',
-        spaceAfter=40
-    )
-    elements.append(Paragraph("CiphersLab", company_style))
-    
-    
-    # Metadata table
-    metadata = [
-        ['Generated:', datetime.now().strftime('%B %d, %Y')],
-        ['Session ID:', session_data.get('session_id', 'N/A')[:16] + '...'],
-        ['Lead Score:', str(session_data.get('lead_score', 'N/A'))],
-    ]
-    
-    metadata_table = Table(metadata, colWidths=[2*inch, 4*inch])
-    metadata_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#6b7280')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#111827')),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    
-    elements.append(metadata_table)
-    elements.append(Spacer(1, 0.5*inch))
-    
-    # Original Idea
-    elements.append(Paragraph("Original Idea", heading_style))
-    idea_text = session_data.get('idea', 'No idea provided')
-    elements.append(Paragraph(idea_text, body_style))
-    elements.append(Spacer(1, 0.3*inch))
+    def __init__(self, logo_path: str = PDF_LOGO_PATH):
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1e3a8a'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        )
+        self.heading_style = ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=18,
+            textColor=colors.HexColor('#3b82f6'),
+            spaceAfter=12,
+            spaceBefore=12
+        )
+        self.subheading_style = ParagraphStyle(
+            'CustomSubHeading',
+            parent=styles['Heading3'],
+            fontSize=14,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=8,
+            spaceBefore=8
+        )
+        self.body_style = ParagraphStyle(
+            'CustomBody',
+            parent=styles['BodyText'],
+            fontSize=11,
+            alignment=TA_JUSTIFY,
+            spaceAfter=12
+        )
+        self.company_style = ParagraphStyle(
+            'Company',
+            parent=styles['Normal'],
+            fontSize=20,
+            textColor=colors.HexColor('#111827'),
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold',
+            spaceAfter=40
+        )
+        self.footer_style = ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#6b7280'),
+            alignment=TA_CENTER
+        )
+        self.metadata_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#6b7280')),
+            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#111827')),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ])
+        self.list_style = ParagraphStyle(
+            'ListItem',
+            parent=self.body_style,
+            alignment=TA_LEFT,
+            spaceAfter=4
+        )
+        self.code_style = ParagraphStyle(
+            'Code',
+            parent=styles['Code'],
+            fontSize=9,
+            leading=12,
+            backColor=colors.HexColor('#f3f4f6'),
+            borderPadding=6,
+            spaceBefore=6,
+            spaceAfter=12
+        )
+        self.table_cell_style = ParagraphStyle(
+            'TableCell',
+            parent=styles['BodyText'],
+            fontSize=9,
+            leading=11
+        )
+        self.table_header_style = ParagraphStyle(
+            'TableHeader',
+            parent=self.table_cell_style,
+            fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#111827')
+        )
+        self.section_table_style = TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e5e7eb')),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#eff6ff')),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ])
+        compiler = MarkdownCompiler({
+            'heading': self.heading_style,
+            'subheading': self.subheading_style,
+            'body': self.body_style,
+            'list': self.list_style,
+            'list_container': ListStyle('List', leftIndent=18, bulletFontSize=9, bulletColor=colors.HexColor('#3b82f6')),
+            'code': self.code_style,
+            'table_cell': self.table_cell_style,
+            'table_header': self.table_header_style,
+            'table': self.section_table_style,
+        }, width=letter[0] - 2*72)
+        self.sections = SectionMemo(compiler, PDF_SECTION_MEMO_SIZE)
+        self.logo_png, self.logo = self._load_logo(logo_path)
+
+    def _load_logo(self, path: str):
+        """PNG bytes (for the title-page flowable) and an ImageReader (for page headers), or (None, None)."""
+        if not os.path.exists(path):
+            return None, None
+        image = PILImage.open(path)
+        image.thumbnail((LOGO_MAX_PIXELS, LOGO_MAX_PIXELS))
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        png = buffer.getvalue()
+        return png, ImageReader(BytesIO(png))
+
+    def _page_header(self, canvas, doc):
+        """Logo and company name (drawn once per document as a form), and the page number."""
+        canvas.saveState()
+
+        if self.logo is not None:
+            if not canvas.hasForm('logo_header'):
+                canvas.beginForm('logo_header')
+                # Logo in top-left corner
+                canvas.drawImage(self.logo, 0.5*inch, doc.height + 1.5*inch,
+                                width=0.4*inch, height=0.4*inch,
+                                preserveAspectRatio=True, mask='auto')
+
+                # Company name next to logo
+                canvas.setFont('Helvetica-Bold', 10)
+                canvas.setFillColor(colors.HexColor('#111827'))
+                canvas.drawString(1*inch, doc.height + 1.6*inch, 'CiphersLab')
+                canvas.endForm()
+            canvas.doForm('logo_header')
+
+        # Page number at bottom
+        canvas.setFont('Helvetica', 9)
+        canvas.setFillColor(colors.HexColor('#6b7280'))
+        page_num = canvas.getPageNumber()
+        text = f"Page {page_num}"
+        canvas.drawRightString(doc.width + 1*inch, 0.5*inch, text)
+
+        canvas.restoreState()
+
+    def render(self, session_data: dict) -> bytes:
+        buffer = BytesIO()
+        self.write(session_data, buffer)
+        return buffer.getvalue()
+
+    def write(self, session_data: dict, output):
+        """Builds the report PDF into `output`, a file path or a binary file object."""
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=letter,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=72
+        )
+
+        # Container for PDF elements
+        elements = []
+        title_style, heading_style = self.title_style, self.heading_style
+        subheading_style, body_style = self.subheading_style, self.body_style
+
+        # Title Page
+        elements.append(Spacer(1, 1*inch))
+        elements.append(Paragraph("AI Agent Strategic Report", title_style))
+        elements.append(Spacer(1, 0.3*inch))
+
+        # Add logo to title page
+        if self.logo_png is not None:
+            logo = Image(BytesIO(self.logo_png), width=1.5*inch, height=1.5*inch)
+            logo.hAlign = 'CENTER'
+            elements.append(logo)
+
+        # Company name
+        elements.append(Paragraph("CiphersLab", self.company_style))
+
+        # Metadata table
+        metadata = [
+            ['Generated:', datetime.now().strftime('%B %d, %Y')],
+            ['Session ID:', session_data.get('session_id', 'N/A')[:16] + '...'],
+            ['Lead Score:', str(session_data.get('lead_score', 'N/A'))],
+        ]
+
+        metadata_table = Table(metadata, colWidths=[2*inch, 4*inch])
+        metadata_table.setStyle(self.metadata_table_style)
+
+        elements.append(metadata_table)
+        elements.append(Spacer(1, 0.5*inch))
+
+        # Original Idea
+        elements.append(Paragraph("Original Idea", heading_style))
+        idea_text = session_data.get('idea', 'No idea provided')
+        elements.append(Paragraph(escape(idea_text), body_style))
+        elements.append(Spacer(1, 0.3*inch))
     
-    elements.append(PageBreak())
+        elements.append(PageBreak())
     
-    # Context sections
-    context = session_data.get('context', {})
+        # Context sections
+        context = session_data.get('context', {})
     
-    sections = [
-        ('requirement_gathering', 'Requirements Analysis', '📋'),
-        ('technical_architecture', 'Technical Architecture', '🏗️'),
-        ('ux_design', 'UX Design & User Flows', '🎨'),
-        ('business_strategy', 'Business Strategy', '💼'),
-    ]
+        sections = [
+            ('requirement_gathering', 'Requirements Analysis', '📋'),
+            ('technical_architecture', 'Technical Architecture', '🏗️'),
+            ('ux_design', 'UX Design & User Flows', '🎨'),
+            ('business_strategy', 'Business Strategy', '💼'),
+        ]
     
-    for key, title, icon in sections:
-        content = context.get(key)
+        for key, title, icon in sections:
+            content = context.get(key)
         
-        if content:
-            # Section title
-            elements.append(Paragraph(f"{icon} {title}", heading_style))
-            elements.append(Spacer(1, 0.2*inch))
+            if content:
+                # Section title
+                elements.append(Paragraph(f"{icon} {title}", heading_style))
+                elements.append(Spacer(1, 0.2*inch))
             
-            # Convert markdown to plain text and format
-            # Simple markdown parsing
-            lines = content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    elements.append(Spacer(1, 0.1*inch))
-                    continue
-                
-                # Handle headers
-                if line.startswith('###'):
-                    clean_line = line.replace('###', '').strip()
-                    elements.append(Paragraph(clean_line, subheading_style))
-                elif line.startswith('##'):
-                    clean_line = line.replace('##', '').strip()
-                    elements.append(Paragraph(clean_line, heading_style))
-                elif line.startswith('#'):
-                    clean_line = line.replace('#', '').strip()
-                    elements.append(Paragraph(clean_line, heading_style))
-                # Handle bullet points
-                elif line.startswith('- ') or line.startswith('* '):
-                    clean_line = '• ' + line[2:].strip()
-                    elements.append(Paragraph(clean_line, body_style))
-                # Handle bold
-                elif '**' in line:
-                    clean_line = line.replace('**', '<b>', 1).replace('**', '</b>', 1)
-                    elements.append(Paragraph(clean_line, body_style))
-                # Regular text
-                else:
-                    elements.append(Paragraph(line, body_style))
+                # Headings, lists, tables and code blocks, compiled once per content
+                elements.extend(self.sections.flowables(content))
             
-            elements.append(Spacer(1, 0.3*inch))
-            elements.append(PageBreak())
+                elements.append(Spacer(1, 0.3*inch))
+                elements.append(PageBreak())
     
-    # Footer on last page
-    elements.append(Spacer(1, 1*inch))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#6b7280'),
-        alignment=TA_CENTER
-    )
-    elements.append(Paragraph("Generated by CiphersLab AI Consultant", footer_style))
-    elements.append(Paragraph("© 2025 CiphersLab. All rights reserved.", footer_style))
+        # Footer on last page
+        elements.append(Spacer(1, 1*inch))
+        footer_style = self.footer_style
+        elements.append(Paragraph("Generated by CiphersLab AI Consultant", footer_style))
+        elements.append(Paragraph("© 2025 CiphersLab. All rights reserved.", footer_style))
     
-    # Build PDF
-    doc.build(elements)
-    
-    # Get PDF bytes
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_bytes
\ No newline at end of file
+        # Build PDF
+        doc.build(elements, onFirstPage=self._page_header, onLaterPages=self._page_header)
+
+
+renderer = PDFRenderer()
+
+@profiled
+def generate_pdf_report(session_data: dict) -> bytes:
+    """
+    Generates a professional PDF report from session data.
+    Returns PDF as bytes.
+    """
+    with tracing.span("pdf.render", session_id=session_data.get("session_id")), pdf_render_duration.time():
+        return _render_pdf(session_data)
+
+def _render_pdf(session_data: dict) -> bytes:
+    return renderer.render(session_data)
+
+def _write_pdf(session_data: dict, path: str) -> int:
+    renderer.write(session_data, path)
+    return os.path.getsize(path)
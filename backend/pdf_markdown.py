@@ -0,0 +1,382 @@
+# pdf_markdown.py
+# Compiles report-section markdown into reportlab flowables in a single pass:
+# headings, paragraphs, nested bullet and numbered lists, pipe tables, fenced
+# code blocks and horizontal rules, with inline bold, italics, strikethrough,
+# code spans and links. Text is XML-escaped, so "<" or "&" in LLM output can no
+# longer break a Paragraph, and emphasis is matched with a stack so the tags are
+# always nested ("***x***", crossed "**a _b** c_"). A block reportlab still
+# rejects falls back to its plain text instead of failing the render.
+#
+# Compiled sections are memoized by content hash (SectionMemo), so rendering a
+# refined report only recompiles the sections that changed. Flowables keep
+# layout state once a document has been built with them, so the memo stores
+# blocks holding never-built Paragraphs and hands every render fresh copies.
+
+import copy
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.platypus import ListFlowable, ListItem, Paragraph, Preformatted, Table
+from reportlab.platypus.flowables import HRFlowable
+
+# ==============================
+# 🔹 INLINE MARKUP
+# ==============================
+_CODE_SPAN = re.compile(r"`([^`]+)`")
+_LINK = re.compile(r"\[([^\]]+)\]\((https?://[^)\s\"]+)\)")
+_DELIMITER_RUN = re.compile(r"\*+|_+|~+")
+_DUNDER = re.compile(r"\w+")
+_EMPHASIS_TAGS = {"*": "i", "**": "b", "_": "i", "__": "b", "~~": "strike"}
+
+
+class _Opener:
+    """An unclosed emphasis delimiter; `index` is its slot in the output, literal until it is closed."""
+
+    def __init__(self, delimiter: str, index: int, end: int):
+        self.delimiter = delimiter
+        self.index = index
+        self.end = end  # source position just after the delimiter
+
+
+def _flanking(text: str, start: int, end: int):
+    """(can_open, can_close) for the delimiter run text[start:end]."""
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    can_open, can_close = not after.isspace(), not before.isspace()
+    if text[start] == "_":
+        # Underscores only emphasize at word boundaries, so snake_case stays as written
+        can_open = can_open and not (before.isalnum() or before == "_")
+        can_close = can_close and not (after.isalnum() or after == "_")
+    return can_open, can_close
+
+
+def _units(run: str) -> list:
+    """A delimiter run split into openers, outermost first: "***" opens bold, then italics."""
+    if run[0] == "~":
+        return [run] if run == "~~" else []
+    if len(run) > 3:
+        return []
+    return {1: [run], 2: [run], 3: [run[:2], run[:1]]}[len(run)]
+
+
+def inline_markup(text: str) -> str:
+    """
+    Markdown inline syntax -> reportlab paragraph markup, with everything else escaped.
+
+    Emphasis is matched with a stack of open delimiters, so the tags are always
+    properly nested: a closer only closes the innermost matching opener, and
+    openers it skips over (crossed emphasis) stay as literal text.
+    """
+    out, stack = [], []
+    position = literal_start = 0
+
+    def flush_literal(until: int):
+        if until > literal_start:
+            out.append(escape(text[literal_start:until]))
+
+    while position < len(text):
+        char = text[position]
+        if char == "`":
+            code = _CODE_SPAN.match(text, position)
+            if code:
+                flush_literal(position)
+                out.append(f'<font face="Courier">{escape(code.group(1))}</font>')
+                position = literal_start = code.end()
+                continue
+        elif char == "[":
+            link = _LINK.match(text, position)
+            if link:
+                flush_literal(position)
+                href = escape(link.group(2), {'"': "&quot;"})
+                out.append(f'<link href="{href}" color="#2563eb">{inline_markup(link.group(1))}</link>')
+                position = literal_start = link.end()
+                continue
+        elif char in "*_~":
+            run = _DELIMITER_RUN.match(text, position)
+            start, end = position, run.end()
+            units = _units(run.group())
+            if not units:
+                position = end
+                continue
+            flush_literal(start)
+            can_open, can_close = _flanking(text, start, end)
+            remaining = end - start
+            while can_close and remaining:
+                opener = next((o for o in reversed(stack) if o.delimiter[0] == char), None)
+                if opener is None or len(opener.delimiter) > remaining:
+                    break
+                # Openers between this one and the closer are crossed; they stay literal
+                while stack[-1] is not opener:
+                    stack.pop()
+                stack.pop()
+                content = text[opener.end:end - remaining]
+                if opener.delimiter == "__" and _DUNDER.fullmatch(content):
+                    # __init__ and friends are names, not bold text
+                    break
+                tag = _EMPHASIS_TAGS[opener.delimiter]
+                out[opener.index] = f"<{tag}>"
+                out.append(f"</{tag}>")
+                remaining -= len(opener.delimiter)
+            consumed = end - remaining
+            if remaining and can_open:
+                for unit in _units(text[consumed:end]):
+                    out.append(escape(unit))
+                    consumed += len(unit)
+                    stack.append(_Opener(unit, len(out) - 1, consumed))
+            literal_start = consumed
+            position = end
+            continue
+        position += 1
+    flush_literal(len(text))
+    return "".join(out)
+
+# ==============================
+# 🔹 COMPILED BLOCKS
+# ==============================
+class _ParagraphBlock:
+    """A parsed Paragraph or Preformatted; each render gets a shallow copy, the original is never laid out."""
+
+    def __init__(self, flowable, source: str = ""):
+        self.flowable = flowable
+        self.source = source  # the markdown it was compiled from
+
+    def __call__(self):
+        return copy.copy(self.flowable)
+
+
+class _FactoryBlock:
+    """Cheap flowables (rules) built fresh for every render."""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __call__(self):
+        return self.factory()
+
+
+class _TableBlock:
+    def __init__(self, rows: list, col_widths: list, style):
+        self.rows = rows
+        self.col_widths = col_widths
+        self.style = style
+
+    def __call__(self):
+        return Table([[cell() for cell in row] for row in self.rows], colWidths=self.col_widths,
+                     style=self.style, repeatRows=1, hAlign="LEFT")
+
+
+class _ListBlock:
+    def __init__(self, items: list, ordered: bool, start: int, style):
+        self.items = items  # each item is a list of blocks (its text, then any nested lists)
+        self.ordered = ordered
+        self.start = start
+        self.style = style
+
+    def __call__(self):
+        items = [ListItem([block() for block in item]) for item in self.items]
+        if self.ordered:
+            return ListFlowable(items, bulletType="1", start=self.start, bulletFormat="%s.", style=self.style)
+        return ListFlowable(items, bulletType="bullet", start="•", style=self.style)
+
+# ==============================
+# 🔹 COMPILER
+# ==============================
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+
+
+def _table_cells(line: str) -> list:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+def _indent(text: str) -> int:
+    return len(text.expandtabs(4))
+
+
+class MarkdownCompiler:
+    """
+    Turns a section's markdown into blocks (see compile()) with the renderer's styles.
+
+    `styles` needs: heading, subheading, body, list, list_container, code,
+    table_cell, table_header and table (a TableStyle); `width` is the frame
+    width tables are fitted to.
+    """
+
+    def __init__(self, styles: dict, width: float):
+        self.styles = styles
+        self.width = width
+
+    def _paragraph(self, text: str, style_name: str):
+        style = self.styles[style_name]
+        try:
+            paragraph = Paragraph(inline_markup(text), style)
+        except ValueError:
+            # Markup reportlab cannot parse must not fail the whole report: show the text as written
+            paragraph = Paragraph(escape(text), style)
+        return _ParagraphBlock(paragraph, text)
+
+    def compile(self, text: str) -> list:
+        """Compiles markdown into a list of blocks; call each block for a fresh flowable."""
+        lines = text.replace("\r\n", "\n").split("\n")
+        blocks, paragraph = [], []
+        list_stack = []  # open lists: (indent, _ListBlock)
+
+        def flush_paragraph():
+            if paragraph:
+                blocks.append(self._paragraph(" ".join(paragraph), "body"))
+                paragraph.clear()
+
+        def close_lists():
+            if list_stack:
+                blocks.append(list_stack[0][1])
+                list_stack.clear()
+
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            stripped = line.strip()
+
+            # Fenced code block: everything up to the closing fence, verbatim
+            fence = _FENCE.match(line)
+            if fence:
+                flush_paragraph()
+                close_lists()
+                code = []
+                i += 1
+                while i < len(lines) and not lines[i].strip().startswith(fence.group(1)):
+                    code.append(lines[i])
+                    i += 1
+                blocks.append(_ParagraphBlock(Preformatted("\n".join(code), self.styles["code"])))
+                i += 1
+                continue
+
+            if not stripped:
+                flush_paragraph()
+                i += 1
+                continue
+
+            # Pipe table: header row, separator row, then rows until a non-table line
+            if "|" in stripped and i + 1 < len(lines) and _TABLE_SEPARATOR.match(lines[i + 1]) and "-" in lines[i + 1]:
+                flush_paragraph()
+                close_lists()
+                rows = [_table_cells(line)]
+                i += 2
+                while i < len(lines) and "|" in lines[i] and lines[i].strip():
+                    rows.append(_table_cells(lines[i]))
+                    i += 1
+                blocks.append(self._table(rows))
+                continue
+
+            heading = _HEADING.match(stripped)
+            if heading:
+                flush_paragraph()
+                close_lists()
+                style = "heading" if len(heading.group(1)) <= 2 else "subheading"
+                blocks.append(self._paragraph(heading.group(2), style))
+                i += 1
+                continue
+
+            if _RULE.match(stripped):
+                flush_paragraph()
+                close_lists()
+                blocks.append(_FactoryBlock(lambda: HRFlowable(width="100%", thickness=0.5, color=colors.HexColor("#e5e7eb"),
+                                                               spaceBefore=6, spaceAfter=6)))
+                i += 1
+                continue
+
+            item = _LIST_ITEM.match(line)
+            if item:
+                flush_paragraph()
+                indent, marker, content = _indent(item.group(1)), item.group(2), item.group(3)
+                # Close lists nested deeper than this item
+                while len(list_stack) > 1 and list_stack[-1][0] > indent:
+                    list_stack.pop()
+                ordered = marker[0].isdigit()
+                # Switching between bullets and numbers at the same depth starts a new list
+                if list_stack and indent <= list_stack[-1][0] and list_stack[-1][1].ordered != ordered:
+                    if len(list_stack) == 1:
+                        close_lists()
+                    else:
+                        list_stack.pop()
+                if not list_stack or indent > list_stack[-1][0]:
+                    start = int(marker[:-1]) if ordered else 1
+                    new_list = _ListBlock([], ordered, start, self.styles["list_container"])
+                    if list_stack and list_stack[-1][1].items:
+                        list_stack[-1][1].items[-1].append(new_list)
+                    list_stack.append((indent, new_list))
+                list_stack[-1][1].items.append([self._paragraph(content, "list")])
+                i += 1
+                continue
+
+            # Indented text right after a list item continues that item
+            if list_stack and line[:1].isspace():
+                current = list_stack[-1][1].items[-1]
+                current[0] = self._paragraph(f"{current[0].source} {stripped}", "list")
+                i += 1
+                continue
+
+            close_lists()
+            paragraph.append(stripped)
+            i += 1
+
+        flush_paragraph()
+        close_lists()
+        return blocks
+
+    def _table(self, rows: list):
+        columns = max(len(row) for row in rows)
+        rows = [row + [""] * (columns - len(row)) for row in rows]
+        # Column widths follow the longest cell in each column, within bounds
+        longest = [max(len(row[c]) for row in rows) for c in range(columns)]
+        weights = [min(max(length, 6), 60) for length in longest]
+        col_widths = [self.width * weight / sum(weights) for weight in weights]
+        cells = [[self._paragraph(cell, "table_header") for cell in rows[0]]]
+        cells += [[self._paragraph(cell, "table_cell") for cell in row] for row in rows[1:]]
+        return _TableBlock(cells, col_widths, self.styles["table"])
+
+# ==============================
+# 🔹 SECTION MEMO
+# ==============================
+class SectionMemo:
+    """LRU of compiled sections keyed by the hash of their markdown."""
+
+    def __init__(self, compiler: MarkdownCompiler, max_entries: int):
+        self.compiler = compiler
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def flowables(self, text: str) -> list:
+        """Fresh flowables for `text`, compiling it only if this content was not seen recently."""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            blocks = self._entries.get(key)
+            if blocks is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if blocks is None:
+            blocks = self.compiler.compile(text)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = blocks
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return [block() for block in blocks]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
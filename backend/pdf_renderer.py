@@ -0,0 +1,290 @@
+# pdf_renderer.py
+# Renders report PDFs in a pool of worker processes, so reportlab's CPU work
+# runs on other cores instead of holding the GIL in the API process.
+#
+# Submissions are bounded: at most PDF_RENDER_MAX_PENDING renders may be queued
+# or running, and a caller waits at most PDF_RENDER_TIMEOUT_SECONDS for its
+# result. Both failures raise DependencyUnavailable, which the API turns into
+# a 503 with Retry-After. PDF_RENDER_WORKERS=0 renders in the calling thread.
+#
+# The timeout covers the render itself: workers report when they start a job,
+# and a render still queued behind others is only given up on (and cancelled)
+# once it has waited a full timeout without starting. A render that has started
+# cannot be cancelled, so one running past the timeout recycles the pool: its
+# worker processes are terminated (renders running next to the hung one fail
+# with a 503 too) and the next render starts a fresh pool. Otherwise a few hung
+# renders would hold every worker and every later render would time out.
+#
+# Workers are started with "spawn": forking the API process would copy its
+# Mongo, tracing and LLM threads' locks into the children.
+
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import tracing
+from metrics import pdf_render_duration
+from resilience import BulkheadFullError, DependencyUnavailable
+
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(2, os.cpu_count() or 1))))
+PDF_RENDER_MAX_PENDING = int(os.getenv("PDF_RENDER_MAX_PENDING", "16"))
+PDF_RENDER_TIMEOUT_SECONDS = float(os.getenv("PDF_RENDER_TIMEOUT_SECONDS", "60"))
+# How often a waiting caller checks whether its render has started or overrun
+PDF_RENDER_POLL_SECONDS = 0.25
+
+# The session fields the PDF shows; only these are sent to the worker
+RENDER_FIELDS = ("session_id", "idea", "lead_score", "context")
+
+
+class PdfRenderTimeout(DependencyUnavailable):
+    """Raised when a render did not finish within the renderer's timeout."""
+
+
+class PdfRenderInterrupted(DependencyUnavailable):
+    """Raised when the worker running a render died or its pool was recycled."""
+
+# ==============================
+# 🔹 WORKER PROCESS
+# ==============================
+_events = None  # the pool's event queue, in a worker process
+
+
+def _init_worker(events):
+    global _events
+    _events = events
+    events.put(("worker", os.getpid()))
+    # Spans and metrics are recorded by the API process around the whole render
+    os.environ["TRACING_ENABLED"] = "false"
+    import pdf_generator  # noqa: F401  (reportlab, once per worker)
+
+
+def _run_job(job_id: int, fn, *args):
+    """Runs `fn` in a worker, reporting when it starts and ends so the API process can time it."""
+    _events.put(("start", job_id, time.monotonic()))
+    try:
+        return fn(*args)
+    finally:
+        _events.put(("end", job_id))
+
+
+def _render_in_worker(session: dict) -> bytes:
+    from pdf_generator import _render_pdf
+    return _render_pdf(session)
+
+
+def _write_in_worker(session: dict, path: str) -> int:
+    from pdf_generator import _write_pdf
+    return _write_pdf(session, path)
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+# ==============================
+# 🔹 POOL
+# ==============================
+class _RenderPool:
+    """One generation of worker processes, with the PIDs and running jobs its workers reported."""
+
+    def __init__(self, workers: int):
+        context = multiprocessing.get_context("spawn")
+        self.events = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.events,),
+        )
+        self.pids = set()
+        self.terminated = False
+        self.running = {}  # job id -> time.monotonic() when its worker started it
+        self._lock = threading.Lock()
+
+    def drain(self):
+        """Reads the workers' reports. Called often enough that workers never block on a full pipe."""
+        with self._lock:
+            while not self.terminated and not self.events.empty():
+                event = self.events.get()
+                if event[0] == "worker":
+                    self.pids.add(event[1])
+                elif event[0] == "start":
+                    self.running[event[1]] = event[2]
+                else:
+                    self.running.pop(event[1], None)
+
+    def started(self, job_id: int):
+        """When the worker started `job_id` (time.monotonic()), or None if it has not started."""
+        self.drain()
+        with self._lock:
+            return self.running.get(job_id)
+
+    def terminate(self):
+        """Shuts the pool down and terminates its workers, waiting for them to exit."""
+        self.drain()
+        with self._lock:
+            self.terminated = True  # a killed worker may have left half a report in the pipe
+            pids = set(self.pids)
+        processes = [process for process in multiprocessing.active_children() if process.pid in pids]
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            # Make sure a hung render has stopped writing before its caller removes the file
+            process.join(timeout=5)
+        self.events.close()
+
+
+# ==============================
+# 🔹 RENDERER
+# ==============================
+class PdfRenderer:
+    """Process pool for PDF renders with a bounded backlog and a per-render timeout."""
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycles = 0
+        self._current = None
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._current is None:
+            self._current = _RenderPool(self.workers)
+        return self._current
+
+    def _submit(self, fn, *args):
+        """Returns the future, the pool it runs on and its job id."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise BulkheadFullError(
+                    "pdf_renderer",
+                    f"pdf_renderer is at capacity ({self.max_pending} renders queued or running)",
+                    retry_after=1,
+                )
+            self.pending += 1
+            try:
+                pool = self._pool()
+                job_id = next(self._job_ids)
+                future = pool.executor.submit(_run_job, job_id, fn, *args)
+            except BaseException:
+                self.pending -= 1
+                raise
+        pool.drain()
+        # The slot is held until the worker finishes (or is terminated), even if the caller gave up
+        future.add_done_callback(self._finished)
+        return future, pool, job_id
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def render(self, session: dict) -> bytes:
+        """Renders the report PDF for `session` and returns its bytes."""
+        if self.workers <= 0:
+            from pdf_generator import generate_pdf_report
+            return generate_pdf_report(session)
+        return self._run(_render_in_worker, session)
+
+    def render_to_file(self, session: dict, path: str) -> int:
+        """
+        Renders the report PDF for `session` into `path` and returns its size.
+        The worker writes the file itself, so the PDF never passes through this process.
+        """
+        if self.workers <= 0:
+            from pdf_generator import generate_pdf_report
+            data = generate_pdf_report(session)
+            with open(path, "wb") as f:
+                f.write(data)
+            return len(data)
+        return self._run(_write_in_worker, session, path)
+
+    def _run(self, fn, session: dict, *args):
+        payload = {field: session.get(field) for field in RENDER_FIELDS}
+        with tracing.span("pdf.render", session_id=session.get("session_id"), worker="process"), pdf_render_duration.time():
+            future, pool, job_id = self._submit(fn, payload, *args)
+            try:
+                return self._wait(future, pool, job_id)
+            except (BrokenProcessPool, CancelledError) as e:
+                # A worker died (e.g. OOM-killed) or another render's timeout recycled the pool
+                self._recycle(pool)
+                raise PdfRenderInterrupted("pdf_renderer", "PDF render was interrupted, please retry",
+                                           retry_after=1) from e
+
+    def _wait(self, future, pool, job_id: int):
+        """The render's result, timing it from when its worker started it rather than from submission."""
+        submitted = time.monotonic()
+        while True:
+            try:
+                return future.result(timeout=PDF_RENDER_POLL_SECONDS)
+            except FutureTimeoutError:
+                pass
+            now = time.monotonic()
+            started = pool.started(job_id)
+            if started is None:
+                # Still queued behind other renders: give up once a full timeout has passed, unless
+                # it is already handed to a worker (then it starts next and is timed from there)
+                if now - submitted >= self.timeout and future.cancel():
+                    self._timed_out()
+            elif now - started >= self.timeout:
+                # Running past the timeout: only killing the worker stops it (and frees its slot)
+                self._recycle(pool)
+                self._timed_out()
+
+    def _timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        raise PdfRenderTimeout(
+            "pdf_renderer", f"PDF render did not finish within {self.timeout:g}s", retry_after=self.timeout
+        )
+
+    def _recycle(self, pool):
+        """Terminates `pool`'s workers; the next render starts a fresh pool."""
+        with self._lock:
+            if self._current is not pool:
+                return  # already recycled
+            self._current = None
+            self.recycles += 1
+        print("[PDF RENDERER] Recycling the render pool")
+        pool.terminate()
+
+    def _reset(self, wait: bool = False):
+        with self._lock:
+            pool, self._current = self._current, None
+        if pool is not None:
+            pool.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def warm_up(self):
+        """Starts the worker processes (and imports reportlab in them) ahead of the first render."""
+        if self.workers <= 0:
+            import pdf_generator  # noqa: F401
+            return
+        for future, _, _ in [self._submit(_worker_pid) for _ in range(self.workers)]:
+            future.result()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "recycles": self.recycles,
+            }
+
+    def shutdown(self):
+        """Drops queued renders and waits for running ones (at most the render timeout)."""
+        self._reset(wait=True)
+
+
+pdf_renderer = PdfRenderer(PDF_RENDER_WORKERS, PDF_RENDER_MAX_PENDING, PDF_RENDER_TIMEOUT_SECONDS)
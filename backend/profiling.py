@@ -0,0 +1,536 @@
+# profiling.py
+# On-demand profiling of a live worker, driven from the admin endpoints
+#
+#   cpu     - samples every thread's Python stack for the next N seconds or
+#             requests; downloads as collapsed stacks (flamegraph.pl, speedscope,
+#             inferno) or a text summary
+#   memory  - tracemalloc snapshots at the start and end of a window; downloads
+#             as a top-N diff, or collapsed stacks weighted by bytes allocated
+#   request - cProfile of one request, asked for with an `X-Profile` header
+#             equal to PROFILING_TOKEN; downloads as .pstats (snakeviz, tuna,
+#             flameprof) or text
+#
+# cProfile only sees the thread it runs in, so the request profile covers the
+# event loop thread plus the work wrapped with @profiled (PDF rendering, crew
+# construction and kickoff) wherever it runs. The event loop is shared: other
+# requests' coroutines that run while the profiled request awaits land in its
+# profile too. How many requests overlapped it is returned in
+# X-Profile-Overlapping (so far) and stored as overlapping_requests; profile
+# on a quiet worker for a clean result. Profiles live in this worker's memory;
+# fetch them from the worker that took them.
+
+import cProfile
+import functools
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "300"))
+PROFILING_MAX_STORED = int(os.getenv("PROFILING_MAX_STORED", "20"))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "10"))
+
+# Requests to these paths do not count towards a window's request budget
+EXCLUDED_PATHS = ("/admin/profile", "/metrics", "/health")
+
+# Innermost frames of threads that are parked waiting for work
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"),
+}
+
+
+class ProfilingBusy(Exception):
+    """A window of the same kind is already running."""
+
+# ==============================
+# 🔹 PROFILE STORE
+# ==============================
+class Profile:
+    """One finished (or running) profile and its downloadable outputs."""
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = "running"
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+        self.summary = {}
+        self.outputs = {}
+        self.error = None
+
+    def finish(self, outputs: dict, summary: dict):
+        self.outputs = outputs
+        self.summary = summary
+        self.status = "done"
+        self.finished_at = datetime.utcnow()
+
+    def fail(self, error: Exception):
+        self.error = repr(error)
+        self.status = "failed"
+        self.finished_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {
+            "profile_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "formats": sorted(self.outputs),
+            "summary": self.summary,
+            "error": self.error,
+        }
+
+
+class ProfileStore:
+    """The most recent PROFILING_MAX_STORED profiles of this worker."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            finished = [p for p in self._profiles.values() if p.status != "running"]
+            for old in finished[:max(0, len(self._profiles) - self.limit)]:
+                del self._profiles[old.id]
+
+    def get(self, profile_id: str):
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [p.to_dict() for p in reversed(self._profiles.values())]
+
+
+profiles = ProfileStore(PROFILING_MAX_STORED)
+
+# ==============================
+# 🔹 WINDOWS (CPU SAMPLING / MEMORY)
+# ==============================
+_active = {}
+_active_lock = threading.Lock()
+
+
+class _Window:
+    """
+    Runs from start() until `seconds` pass, `requests` requests complete or
+    stop() is called, whichever comes first, then stores the profile.
+    """
+
+    kind = ""
+
+    def __init__(self, seconds: float = None, requests: int = None, **params):
+        seconds = min(seconds or PROFILING_MAX_SECONDS, PROFILING_MAX_SECONDS)
+        self.profile = Profile(self.kind, {"seconds": seconds, "requests": requests, **params})
+        self.deadline = time.monotonic() + seconds
+        self.requests_left = requests
+        self.requests_seen = 0
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._begin()
+        profiles.add(self.profile)
+        threading.Thread(target=self._run, name=f"profiling-{self.kind}", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def request_finished(self):
+        with self._lock:
+            self.requests_seen += 1
+            if self.requests_left and self.requests_seen >= self.requests_left:
+                self._stopped.set()
+
+    def _waiting(self, interval: float) -> bool:
+        remaining = self.deadline - time.monotonic()
+        return remaining > 0 and not self._stopped.wait(min(interval, remaining))
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self._collect()
+            outputs, summary = self._end()
+            summary.update(duration_s=round(time.perf_counter() - started, 2), requests=self.requests_seen)
+            self.profile.finish(outputs, summary)
+            print(f"[PROFILE] {self.kind} profile {self.profile.id} ready ({summary['duration_s']}s)")
+        except Exception as e:
+            print(f"[PROFILE] {self.kind} profile {self.profile.id} failed: {e!r}")
+            self.profile.fail(e)
+        finally:
+            with _active_lock:
+                _active.pop(self.kind, None)
+
+    def _begin(self):
+        pass
+
+    def _collect(self):
+        while self._waiting(1.0):
+            pass
+
+    def _end(self):
+        raise NotImplementedError
+
+
+def _frame_label(code) -> str:
+    path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def _thread_group(name: str) -> str:
+    # "ThreadPoolExecutor-0_3" and "report-job-2" group with their pool siblings
+    while True:
+        stripped = re.sub(r"[-_]\d+$", "", name)
+        if stripped == name:
+            return name
+        name = stripped
+
+
+def _collapsed(counts: Counter) -> str:
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in counts.most_common())
+
+
+class CpuSampler(_Window):
+    """Statistical profiler: every interval, records each thread's Python stack."""
+
+    kind = "cpu"
+
+    def __init__(self, seconds=None, requests=None, interval_ms: float = None, include_idle: bool = False):
+        super().__init__(seconds, requests, interval_ms=interval_ms or PROFILING_SAMPLE_INTERVAL_MS,
+                         include_idle=include_idle)
+        self.interval = (interval_ms or PROFILING_SAMPLE_INTERVAL_MS) / 1000
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+
+    def _collect(self):
+        own = threading.get_ident()
+        while self._waiting(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                leaf = frame.f_code
+                if not self.include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident, f"thread-{ident}")))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def _end(self):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                # Thread bootstrap frames sit under every stack and say nothing
+                if "/threading.py:" not in label:
+                    total[label] += count
+        busy = sum(self.stacks.values())
+
+        lines = [f"CPU samples: {self.samples} ticks, {busy} busy thread stacks "
+                 f"(every {self.interval * 1000:.0f}ms, idle {'included' if self.include_idle else 'excluded'})", ""]
+        for title, counter in (("Self (innermost frame)", own), ("Total (anywhere on the stack)", total)):
+            lines.append(f"{title}:")
+            for label, count in counter.most_common(25):
+                lines.append(f"  {count / busy if busy else 0:>6.1%}  {count:>7}  {label}")
+            lines.append("")
+
+        summary = {
+            "ticks": self.samples,
+            "stacks": busy,
+            "top_self": [{"frame": label, "samples": count} for label, count in own.most_common(10)],
+        }
+        return {"collapsed": _collapsed(self.stacks), "text": "\n".join(lines)}, summary
+
+
+class MemoryWindow(_Window):
+    """tracemalloc snapshot diff between the start and the end of the window."""
+
+    kind = "memory"
+
+    def __init__(self, seconds=None, requests=None, top: int = 25, frames: int = 16):
+        super().__init__(seconds, requests, top=top, frames=frames)
+        self.top = top
+        self.frames = frames
+        self.started_tracing = False
+        self.baseline = None
+
+    def _begin(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        self.baseline = self._snapshot()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _end(self):
+        try:
+            snapshot = self._snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if self.started_tracing:
+                tracemalloc.stop()
+
+        by_line = snapshot.compare_to(self.baseline, "lineno")
+        grown = sum(d.size_diff for d in by_line)
+        lines = [f"Allocation diff over the window: {grown / 1024:+.1f} KiB "
+                 f"(traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB)", ""]
+        for diff in by_line[:self.top]:
+            frame = diff.traceback[0]
+            lines.append(f"  {diff.size_diff / 1024:>+10.1f} KiB  {diff.count_diff:>+8} blocks  "
+                         f"{frame.filename}:{frame.lineno}")
+
+        stacks = Counter()
+        for diff in snapshot.compare_to(self.baseline, "traceback"):
+            if diff.size_diff > 0:
+                # Oldest frame first, as collapsed stacks expect; capped at `frames` deep
+                stack = tuple(f"{os.path.basename(f.filename)}:{f.lineno}" for f in diff.traceback)
+                stacks[stack] += diff.size_diff
+
+        summary = {
+            "size_diff_kib": round(grown / 1024, 1),
+            "peak_kib": round(peak / 1024, 1),
+            "top": [
+                {"line": f"{d.traceback[0].filename}:{d.traceback[0].lineno}",
+                 "size_diff_kib": round(d.size_diff / 1024, 1), "count_diff": d.count_diff}
+                for d in by_line[:10]
+            ],
+        }
+        return {"collapsed": _collapsed(stacks), "text": "\n".join(lines)}, summary
+
+
+WINDOWS = {"cpu": CpuSampler, "memory": MemoryWindow}
+
+
+def start_window(kind: str, **params) -> Profile:
+    """Starts a cpu or memory window; raises ProfilingBusy if one is running."""
+    with _active_lock:
+        if kind in _active:
+            raise ProfilingBusy(f"A {kind} profile is already running ({_active[kind].profile.id})")
+        window = WINDOWS[kind](**params)
+        _active[kind] = window
+    try:
+        window.start()
+    except Exception:
+        with _active_lock:
+            _active.pop(kind, None)
+        raise
+    return window.profile
+
+
+def stop_window(kind: str):
+    """Ends a running window early; returns its profile (None if none runs)."""
+    window = _active.get(kind)
+    if window is None:
+        return None
+    window.stop()
+    return window.profile
+
+# ==============================
+# 🔹 PER-REQUEST CPROFILE
+# ==============================
+_request_profile = ContextVar("request_profile", default=None)
+_thread_state = threading.local()
+# cProfile hooks one thread at a time, so only one request is profiled at once
+_request_lock = threading.Lock()
+# HTTP requests in flight on this worker's event loop, and the request being profiled
+_in_flight = 0
+_profiling = None
+
+
+class RequestProfile:
+    """cProfile stats of one request, merged from every thread that worked on it."""
+
+    def __init__(self, method: str, path: str):
+        self.profile = Profile("request", {"method": method, "path": path})
+        self._stats = None
+        self._lock = threading.Lock()
+        self.finished = False
+        # Other requests in flight at any point while this one was profiled
+        self.overlapping = 0
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            if self.finished:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+
+    def finish(self, status: int, top: int = 40):
+        with self._lock:
+            self.finished = True
+            stats = self._stats
+        if stats is None:
+            self.profile.finish({}, {"status": status, "functions": 0, "overlapping_requests": self.overlapping})
+            return
+        buffer = io.StringIO()
+        if self.overlapping:
+            buffer.write(f"NOTE: {self.overlapping} other request(s) ran on the event loop during this "
+                         "profile; their coroutines are included below.\n\n")
+        stats.stream = buffer
+        stats.sort_stats("cumulative").print_stats(top)
+        self.profile.finish(
+            {"pstats": marshal.dumps(stats.stats), "text": buffer.getvalue()},
+            {"status": status, "functions": len(stats.stats), "total_s": round(stats.total_tt, 4),
+             "overlapping_requests": self.overlapping},
+        )
+
+
+def _run_profiled(request_profile: RequestProfile, fn, *args, **kwargs):
+    profiler = cProfile.Profile()
+    _thread_state.active = True
+    profiler.enable()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _thread_state.active = False
+        request_profile.add(profiler)
+
+
+def profiled(fn):
+    """
+    Includes fn in the cProfile of the request that called it, in whichever
+    thread it runs. A no-op unless that request asked to be profiled.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        request_profile = _request_profile.get()
+        if request_profile is None or getattr(_thread_state, "active", False):
+            return fn(*args, **kwargs)
+        return _run_profiled(request_profile, fn, *args, **kwargs)
+    return wrapper
+
+# ==============================
+# 🔹 ASGI MIDDLEWARE
+# ==============================
+class ProfilingMiddleware:
+    """
+    Counts completed requests towards running windows, and profiles requests
+    carrying `X-Profile: <PROFILING_TOKEN>`, returning `X-Profile-Id` and
+    `X-Profile-Overlapping` (other requests in flight so far).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight
+        token = None
+        if PROFILING_TOKEN:
+            token = dict(scope.get("headers", [])).get(b"x-profile", b"").decode("latin-1")
+        _in_flight += 1
+        try:
+            if token == PROFILING_TOKEN and token:
+                await self._profile(scope, receive, send)
+            else:
+                if _profiling is not None:
+                    _profiling.overlapping += 1
+                await self.app(scope, receive, send)
+        finally:
+            _in_flight -= 1
+            if not scope["path"].startswith(EXCLUDED_PATHS):
+                for window in list(_active.values()):
+                    window.request_finished()
+
+    async def _profile(self, scope, receive, send):
+        global _profiling
+        if not _request_lock.acquire(blocking=False):
+            if _profiling is not None:
+                _profiling.overlapping += 1
+            await self.app(scope, receive, self._with_header(send, b"x-profile-error", b"busy"))
+            return
+
+        request_profile = RequestProfile(scope["method"], scope["path"])
+        request_profile.overlapping = _in_flight - 1
+        profiles.add(request_profile.profile)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-overlapping", str(request_profile.overlapping).encode())
+                ]
+            await send(message)
+
+        _profiling = request_profile
+        reset = _request_profile.set(request_profile)
+        profiler = cProfile.Profile()
+        _thread_state.active = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, self._with_header(send_wrapper, b"x-profile-id", request_profile.profile.id.encode()))
+        finally:
+            profiler.disable()
+            _thread_state.active = False
+            _profiling = None
+            _request_profile.reset(reset)
+            _request_lock.release()
+            request_profile.add(profiler)
+            request_profile.finish(status["code"])
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(name, value)]
+            await send(message)
+        return send_wrapper
+
+# ==============================
+# 🔹 DOWNLOADS
+# ==============================
+MEDIA_TYPES = {
+    "collapsed": ("text/plain; charset=utf-8", "folded"),
+    "text": ("text/plain; charset=utf-8", "txt"),
+    "pstats": ("application/octet-stream", "pstats"),
+    "json": ("application/json", "json"),
+}
+
+
+def render(profile: Profile, format: str):
+    """(body, media type, filename) of a profile in one of its formats, or json metadata."""
+    if format == "json":
+        body = json.dumps(profile.to_dict(), indent=2)
+    elif format in profile.outputs:
+        body = profile.outputs[format]
+    else:
+        raise KeyError(format)
+    media_type, extension = MEDIA_TYPES[format]
+    return body, media_type, f"{profile.kind}-{profile.id}.{extension}"
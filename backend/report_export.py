@@ -0,0 +1,129 @@
+# report_export.py
+# Bulk export of many sessions as one ZIP archive (PDF reports and/or session
+# JSON), streamed to the client while it is being built.
+#
+# PDFs come from the PDF cache (rendered by the render workers on a miss).
+# EXPORT_CONCURRENCY threads fetch them ahead of the archive writer, so at most
+# that many sessions and file paths are held at any time. Entries are
+# compressed straight from disk in 64KB chunks and every chunk the writer
+# produces is sent right away, so memory stays flat however many reports the
+# archive holds. Only zipfile's central directory grows, by about 100 bytes
+# per entry.
+#
+# Usage:
+#   GET /admin/export?min_score=60&since=2025-01-01&formats=pdf,json
+
+import io
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_cache import get_report_pdf_file
+from pdf_renderer import PDF_RENDER_WORKERS
+from resilience import DependencyUnavailable
+
+# Sessions whose PDF is fetched or rendered ahead of the archive writer
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", str(max(2, PDF_RENDER_WORKERS))))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = ("pdf", "json")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable stream that collects zipfile's output until it is sent."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def report_complete(session: dict) -> bool:
+    return bool((session.get("context") or {}).get("business_strategy"))
+
+
+def _fetch_pdf(session: dict):
+    """(ReportPdf, None) or (None, error message); runs on the export's thread pool."""
+    try:
+        return get_report_pdf_file(session), None
+    except DependencyUnavailable as e:
+        return None, str(e)
+    except Exception as e:
+        print(f"[EXPORT] Could not render PDF for {session.get('session_id')}: {e}")
+        return None, f"{type(e).__name__}: {e}"
+
+
+def export_archive(sessions, formats=EXPORT_FORMATS, concurrency: int = EXPORT_CONCURRENCY):
+    """
+    Yields a ZIP archive of `sessions` (an iterable of session documents, e.g. a
+    Mongo cursor) in chunks: pdf/<session_id>.pdf for finished reports and
+    json/<session_id>.json for every session. Sessions whose PDF could not be
+    produced are listed in errors.json at the end.
+    """
+    sink = _ChunkSink()
+    window = deque()  # (session, future or None), in archive order
+    errors = []
+    counts = {"sessions": 0, "pdf": 0, "json": 0}
+    started = time.perf_counter()
+
+    def write_entry(archive, session, future):
+        session_id = session.get("session_id")
+        counts["sessions"] += 1
+        if "json" in formats:
+            session = {**session, "_id": str(session.get("_id"))}
+            archive.writestr(f"json/{session_id}.json", json.dumps(session, indent=2, default=str))
+            counts["json"] += 1
+            yield sink.drain()
+        if future is None:
+            return
+        pdf, error = future.result()
+        if pdf is None:
+            errors.append({"session_id": session_id, "error": error})
+            return
+        try:
+            with open(pdf.path, "rb") as source, archive.open(f"pdf/{session_id}.pdf", "w") as entry:
+                while chunk := source.read(EXPORT_CHUNK_BYTES):
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            counts["pdf"] += 1
+        finally:
+            pdf.discard()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="export") as pool:
+        try:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for session in sessions:
+                    future = None
+                    if "pdf" in formats and report_complete(session):
+                        future = pool.submit(_fetch_pdf, session)
+                    window.append((session, future))
+                    if len(window) >= concurrency:
+                        yield from write_entry(archive, *window.popleft())
+                while window:
+                    yield from write_entry(archive, *window.popleft())
+                if errors:
+                    archive.writestr("errors.json", json.dumps(errors, indent=2))
+            yield sink.drain()  # central directory
+            print(f"[EXPORT] {counts['sessions']} sessions ({counts['pdf']} PDFs, {counts['json']} JSON, "
+                  f"{len(errors)} errors) in {time.perf_counter() - started:.1f}s")
+        finally:
+            # Client went away: drop temporary PDFs that were fetched but not written
+            for _, future in window:
+                if future is not None and not future.cancel():
+                    pdf, _ = future.result()
+                    if pdf is not None:
+                        pdf.discard()
@@ -0,0 +1,223 @@
+# resilience.py
+# Circuit breakers and bulkheads for external dependencies (Groq, Resend, MongoDB)
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, NetworkTimeout
+
+# ==============================
+# 🔹 ERRORS
+# ==============================
+class DependencyUnavailable(RuntimeError):
+    """Base error for calls rejected without reaching the dependency."""
+
+    def __init__(self, dependency: str, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DependencyUnavailable):
+    """Raised when a dependency's circuit breaker is open."""
+
+
+class BulkheadFullError(DependencyUnavailable):
+    """Raised when a dependency already has its maximum number of calls in flight."""
+
+# ==============================
+# 🔹 CIRCUIT BREAKER
+# ==============================
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    closed    -> calls pass; `failure_threshold` consecutive failures open it
+    open      -> calls fail fast until `recovery_timeout` has elapsed
+    half_open -> up to `half_open_max_calls` trial calls; one success closes it,
+                 one failure re-opens it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_calls = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raises CircuitOpenError if the call must not go through."""
+        with self._lock:
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.recovery_timeout:
+                    raise CircuitOpenError(
+                        self.name,
+                        f"{self.name} is unavailable (circuit open)",
+                        retry_after=self.recovery_timeout - elapsed,
+                    )
+                self.state = HALF_OPEN
+                self._trial_calls = 0
+                print(f"[BREAKER] {self.name}: open -> half_open")
+
+            if self.state == HALF_OPEN:
+                if self._trial_calls >= self.half_open_max_calls:
+                    raise CircuitOpenError(
+                        self.name,
+                        f"{self.name} is recovering (circuit half-open)",
+                        retry_after=self.recovery_timeout,
+                    )
+                self._trial_calls += 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"[BREAKER] {self.name}: {self.state} -> closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"[BREAKER] {self.name}: {self.state} -> open after {self.failures} failure(s)")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+# ==============================
+# 🔹 BULKHEAD
+# ==============================
+class Bulkhead:
+    """Bounded concurrency pool; callers wait at most `max_wait` seconds for a slot."""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float = 0.5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.rejected = 0
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(timeout=self.max_wait):
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFullError(
+                self.name,
+                f"{self.name} is at capacity ({self.max_concurrent} calls in flight)",
+                retry_after=self.max_wait,
+            )
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "max_concurrent": self.max_concurrent, "rejected": self.rejected}
+
+# ==============================
+# 🔹 GUARDED DEPENDENCY
+# ==============================
+class Dependency:
+    """A circuit breaker plus a bulkhead for one external service."""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float,
+                 failure_threshold: int, recovery_timeout: float, is_failure=None):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, recovery_timeout)
+        self.bulkhead = Bulkhead(name, max_concurrent, max_wait)
+        # Decides which exceptions count against the breaker (default: all of them)
+        self.is_failure = is_failure or (lambda exc: True)
+
+    @contextmanager
+    def guard(self):
+        """Fails fast if the breaker is open or the bulkhead is full; records the outcome."""
+        self.breaker.allow()
+        with self.bulkhead.slot():
+            try:
+                yield
+            except Exception as e:
+                if self.is_failure(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+
+    def call(self, fn, *args, **kwargs):
+        with self.guard():
+            return fn(*args, **kwargs)
+
+    def snapshot(self):
+        return {"breaker": self.breaker.snapshot(), "bulkhead": self.bulkhead.snapshot()}
+
+
+def _dependency_from_env(name: str, prefix: str, max_concurrent: int, max_wait: float,
+                         failure_threshold: int, recovery_timeout: float, is_failure=None):
+    return Dependency(
+        name,
+        max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", max_concurrent)),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT_SECONDS", max_wait)),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", failure_threshold)),
+        recovery_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET_SECONDS", recovery_timeout)),
+        is_failure=is_failure,
+    )
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Only outages trip a breaker; bad requests (4xx other than 408/429) do not."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 429)
+    return True
+
+
+def _is_resend_outage(exc: BaseException) -> bool:
+    """As _is_transient, minus 429s: the email outbox pauses its senders on those itself."""
+    return _is_transient(exc) and getattr(exc, "code", None) not in (429, "429")
+
+
+def _is_mongo_outage(exc: BaseException) -> bool:
+    """Connection loss and server-side timeouts trip the breaker; query errors do not."""
+    return isinstance(exc, (ConnectionFailure, ExecutionTimeout, NetworkTimeout))
+
+# ==============================
+# 🔹 DEPENDENCIES
+# ==============================
+groq = _dependency_from_env("groq", "GROQ", max_concurrent=16, max_wait=30,
+                            failure_threshold=5, recovery_timeout=30, is_failure=_is_transient)
+resend_api = _dependency_from_env("resend", "RESEND", max_concurrent=4, max_wait=1,
+                                  failure_threshold=3, recovery_timeout=60, is_failure=_is_resend_outage)
+mongo = _dependency_from_env("mongo", "MONGO", max_concurrent=64, max_wait=2,
+                             failure_threshold=5, recovery_timeout=10, is_failure=_is_mongo_outage)
+
+DEPENDENCIES = {dep.name: dep for dep in (groq, resend_api, mongo)}
+
+
+def dependency_status():
+    """Breaker and bulkhead state of every dependency, for /health."""
+    return {name: dep.snapshot() for name, dep in DEPENDENCIES.items()}
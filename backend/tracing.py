@@ -0,0 +1,327 @@
+# tracing.py
+# Span-based tracing across the funnel (API -> report jobs -> crew stages -> LLM -> PDF -> Resend)
+#
+# Uses the OpenTelemetry SDK with a private TracerProvider: CrewAI installs its
+# own global provider for its telemetry, and our spans must not go there.
+# Spans are exported to any of (TRACING_EXPORTERS, comma separated):
+#   mongo - `trace_spans` collection, read back by the admin waterfall endpoint
+#   jsonl - one JSON object per span in TRACING_JSONL_PATH
+#   otlp  - OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. benchmarks/otlp_collector.py)
+
+import functools
+import inspect
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Status, StatusCode
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACING_EXPORTERS = [e.strip() for e in os.getenv("TRACING_EXPORTERS", "mongo").split(",") if e.strip()]
+TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH", "traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_RETENTION_DAYS = int(os.getenv("TRACING_RETENTION_DAYS", "14"))
+
+SESSION_ATTRIBUTE = "session.id"
+
+# ==============================
+# 🔹 EXPORTERS
+# ==============================
+def span_to_dict(span) -> dict:
+    """Flat, JSON-friendly form of a finished span."""
+    context = span.get_span_context()
+    attributes = dict(span.attributes or {})
+    return {
+        "trace_id": format(context.trace_id, "032x"),
+        "span_id": format(context.span_id, "016x"),
+        "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "name": span.name,
+        "session_id": attributes.get(SESSION_ATTRIBUTE),
+        "start": datetime.fromtimestamp(span.start_time / 1e9, tz=timezone.utc),
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 2),
+        "status": span.status.status_code.name.lower(),
+        "error": span.status.description,
+        "attributes": attributes,
+        "thread": attributes.get("thread.name"),
+    }
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Appends finished spans to a local JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = [json.dumps(span_to_dict(span), default=str) for span in spans]
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"[TRACING] Could not write {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+class MongoSpanExporter(SpanExporter):
+    """Stores finished spans in Mongo for the per-session waterfall."""
+
+    def __init__(self):
+        self.collection = None
+        self._indexed = False
+
+    def export(self, spans):
+        if self.collection is None:
+            return SpanExportResult.FAILURE
+        try:
+            if not self._indexed:
+                self.collection.create_index("start", expireAfterSeconds=TRACING_RETENTION_DAYS * 86400)
+                self.collection.create_index([("session_id", 1), ("start", 1)])
+                self.collection.create_index("trace_id")
+                self._indexed = True
+            self.collection.insert_many([span_to_dict(span) for span in spans], ordered=False)
+        except Exception as e:
+            print(f"[TRACING] Could not store {len(spans)} spans: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+class SessionPropagator(SpanProcessor):
+    """Copies session.id and the thread name from the parent span onto each new span."""
+
+    def on_start(self, span, parent_context=None):
+        span.set_attribute("thread.name", threading.current_thread().name)
+        if span.attributes and SESSION_ATTRIBUTE in span.attributes:
+            return
+        parent = trace.get_current_span(parent_context)
+        session_id = (getattr(parent, "attributes", None) or {}).get(SESSION_ATTRIBUTE)
+        if session_id:
+            span.set_attribute(SESSION_ATTRIBUTE, session_id)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        # The provider stops flushing later processors (the exporters) on a falsy result
+        return True
+
+# ==============================
+# 🔹 PROVIDER
+# ==============================
+mongo_exporter = MongoSpanExporter()
+
+
+def _build_provider():
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "ai-agent-consultant"}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(SessionPropagator())
+    for name in TRACING_EXPORTERS:
+        if name == "mongo":
+            exporter = mongo_exporter
+        elif name == "jsonl":
+            exporter = JsonlSpanExporter(TRACING_JSONL_PATH)
+        elif name == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        else:
+            print(f"[TRACING] Unknown exporter '{name}' ignored")
+            continue
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    return provider
+
+
+provider = _build_provider() if TRACING_ENABLED else None
+if provider is not None and os.getenv("OTEL_SDK_DISABLED", "false").lower() == "true":
+    # Commonly set to silence CrewAI telemetry; CREWAI_DISABLE_TELEMETRY does that without this side effect
+    print("[TRACING] OTEL_SDK_DISABLED is set, no spans will be recorded")
+tracer = provider.get_tracer("ai-agent-consultant") if provider else trace.NoOpTracer()
+_propagator = TraceContextTextMapPropagator()
+
+
+def bind_span_store(collection):
+    """Sets the Mongo collection used by the `mongo` exporter."""
+    mongo_exporter.collection = collection
+
+
+def shutdown():
+    """Flushes pending spans and stops the exporters."""
+    if provider is not None:
+        provider.shutdown()
+
+# ==============================
+# 🔹 SPANS
+# ==============================
+@contextmanager
+def span(name: str, session_id: str = None, **attributes):
+    """Runs the block in a child span of the current one; exceptions mark it as failed."""
+    if session_id:
+        attributes[SESSION_ATTRIBUTE] = session_id
+    with tracer.start_as_current_span(
+        name,
+        attributes={k: v for k, v in attributes.items() if v is not None},
+        record_exception=False,
+        set_status_on_exception=False,
+    ) as current:
+        try:
+            yield current
+        except BaseException as e:
+            current.set_status(Status(StatusCode.ERROR, f"{type(e).__name__}: {e}"[:300]))
+            raise
+
+
+def traced(name: str):
+    """Decorator form of span(); tags the span when the first parameter is `session_id`."""
+    def decorator(fn):
+        params = list(inspect.signature(fn).parameters)
+        takes_session = bool(params) and params[0] == "session_id"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            session_id = None
+            if takes_session:
+                session_id = args[0] if args else kwargs.get("session_id")
+            with span(name, session_id=session_id):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_context():
+    """Captures the active trace context to continue it on another thread."""
+    return otel_context.get_current()
+
+
+def run_in_context(ctx, fn, *args, **kwargs):
+    """Runs fn with `ctx` (from current_context()) as the active trace context."""
+    token = otel_context.attach(ctx)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        otel_context.detach(token)
+
+# ==============================
+# 🔹 ASGI MIDDLEWARE
+# ==============================
+class TracingMiddleware:
+    """
+    Opens a server span per HTTP request, continuing the caller's trace when a
+    W3C `traceparent` header is present, and returns the trace id in `X-Trace-Id`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        parent = _propagator.extract(headers)
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=parent,
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        ) as current:
+            trace_id = format(current.get_span_context().trace_id, "032x").encode()
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    current.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        current.set_status(Status(StatusCode.ERROR))
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace_id)]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                current.update_name(f"{scope['method']} {route.path}")
+                session_id = (scope.get("path_params") or {}).get("session_id")
+                if session_id:
+                    current.set_attribute(SESSION_ATTRIBUTE, session_id)
+
+# ==============================
+# 🔹 WATERFALL
+# ==============================
+def build_waterfall(spans: list) -> list:
+    """
+    Orders spans of one or more traces as a waterfall: each trace's span tree
+    depth first, children in start order, with offsets from the trace start.
+    """
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s["trace_id"], []).append(s)
+
+    traces = []
+    for trace_id, trace_spans in by_trace.items():
+        trace_spans.sort(key=lambda s: s["start"])
+        ids = {s["span_id"] for s in trace_spans}
+        children = {}
+        for s in trace_spans:
+            # Spans whose parent was not exported (or lives in the caller's service) are roots
+            parent = s["parent_id"] if s["parent_id"] in ids else None
+            children.setdefault(parent, []).append(s)
+        started = trace_spans[0]["start"]
+        ended = max(s["start"].timestamp() * 1000 + s["duration_ms"] for s in trace_spans)
+
+        ordered = []
+        stack = [(s, 0) for s in reversed(children.get(None, []))]
+        while stack:
+            s, depth = stack.pop()
+            ordered.append((s, depth))
+            stack.extend((child, depth + 1) for child in reversed(children.get(s["span_id"], [])))
+
+        traces.append({
+            "trace_id": trace_id,
+            "started_at": started,
+            "duration_ms": round(ended - started.timestamp() * 1000, 2),
+            "spans": [
+                {
+                    "name": s["name"],
+                    "depth": depth,
+                    "offset_ms": round((s["start"] - started).total_seconds() * 1000, 2),
+                    "duration_ms": s["duration_ms"],
+                    "status": s["status"],
+                    "thread": s.get("thread"),
+                    "attributes": s.get("attributes", {}),
+                }
+                for s, depth in ordered
+            ],
+        })
+    traces.sort(key=lambda t: t["started_at"])
+    return traces
+
+
+def render_waterfall_text(traces: list, width: int = 60) -> str:
+    """Plain-text waterfall (one bar per span) for quick inspection in a terminal."""
+    lines = []
+    for t in traces:
+        total = max(t["duration_ms"], 1)
+        lines.append(f"trace {t['trace_id']}  {t['started_at']:%Y-%m-%d %H:%M:%S}  {total:.0f}ms")
+        for s in t["spans"]:
+            start = int(s["offset_ms"] / total * width)
+            length = max(1, int(s["duration_ms"] / total * width))
+            bar = " " * start + "█" * min(length, width - start)
+            label = ("  " * s["depth"] + s["name"])[:40]
+            flag = " !" if s["status"] == "error" else ""
+            lines.append(f"{label:<40} |{bar:<{width}}| {s['duration_ms']:>9.1f}ms{flag}")
+        lines.append("")
+    return "\n".join(lines)